@@ -1,9 +1,20 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlencode
+import asyncio
+import base64
+import functools
+import json
 import os
+import re
+import zipfile
 
 app = FastAPI(title="Sistema de Accesos")
 
@@ -17,75 +28,558 @@ app.mount("/faces", StaticFiles(directory=os.path.join(WORKSPACE_PATH, "data/det
 
 # Configuración de la base de datos
 DATABASE_URL = "sqlite:///./data/access.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Consultas simultáneas a la base: cada una corre en un hilo del pool con su
+# propia conexión (SQLite libera el GIL mientras ejecuta la consulta), así
+# una consulta lenta no detiene el event loop ni a los demás clientes
+DB_MAX_CONCURRENCY = 8
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30},
+                       pool_size=DB_MAX_CONCURRENCY, max_overflow=0)
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="db")
 
-# Rutas
-@app.get("/")
-async def home(request: Request):
+# Paginación
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Formato de ancho fijo con el que DatabaseManager guarda los timestamps
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+ESTADOS = ("Permitido", "No autorizado")
+
+# Streaming de accesos nuevos (SSE)
+STREAM_POLL_INTERVAL = 1.0
+STREAM_BATCH_SIZE = 500
+STREAM_CLIENT_QUEUE_SIZE = 1000
+STREAM_KEEPALIVE_INTERVAL = 15.0
+
+# Estadísticas: tablas de conteos que mantiene DatabaseManager al insertar
+# (ver src/database_manager.py) y largo del prefijo del timestamp de cada intervalo
+ROLLUPS = {"horas": ("access_rollup_hourly", 13), "dias": ("access_rollup_daily", 10)}
+ROLLUP_UNAUTHORIZED = ""
+ROLLUP_ALL = "*"
+MAX_RANKING = 1000
+
+# Meses archivados por src/retention.py: un SQLite por mes con sus accesos y
+# un ZIP con sus imágenes; la API los lee como si siguieran en la base
+ARCHIVE_DIR = "./data/archive"
+ARCHIVE_IMAGES_PATTERN = re.compile(r"faces_\d{4}_\d{2}\.zip")
+
+@app.on_event("startup")
+def ensure_indexes():
+    """Crea los índices de consulta si la base ya existe pero aún no los tiene"""
+    with engine.begin() as connection:
+        exists = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'access_logs'"
+        )).first()
+        if exists is None:
+            return
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp ON access_logs (timestamp, id)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_access_logs_person ON access_logs (person_id, timestamp, id)"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_access_logs_unauthorized "
+            "ON access_logs (timestamp, id) WHERE person_id IS NULL"
+        ))
+
+@app.on_event("shutdown")
+def close_database():
+    db_executor.shutdown(wait=False)
+    engine.dispose()
+
+async def run_db(function, *args, **kwargs):
+    """
+    Ejecuta una función bloqueante de acceso a la base sin bloquear el event loop
+
+    Las llamadas que superan DB_MAX_CONCURRENCY esperan su turno en la cola
+    del pool de hilos de la base (el event loop sigue atendiendo al resto).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(function, *args, **kwargs))
+
+def fetch_since(last_id: int, limit: int):
+    """Accesos con id posterior a last_id, en orden de inserción"""
     with engine.connect() as connection:
-        # Consulta SQL para obtener los accesos
-        query = text("""
-            SELECT id, name, person_id, timestamp, face_image_path 
-            FROM access_logs 
-            ORDER BY timestamp DESC
-        """)
-        result = connection.execute(query)
-        accesos = []
-        for row in result:
+        return connection.execute(text("""
+            SELECT id, name, person_id, timestamp, face_image_path
+            FROM access_logs
+            WHERE id > :last_id
+            ORDER BY id
+            LIMIT :limit
+        """), {"last_id": last_id, "limit": limit}).fetchall()
+
+def fetch_max_id() -> int:
+    """Id del último acceso registrado (0 si no hay ninguno)"""
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM access_logs")).scalar()
+
+async def iter_since(last_id: int):
+    """Todos los accesos con id posterior a last_id, consultados por lotes hasta agotarlos"""
+    while True:
+        rows = await run_db(fetch_since, last_id, STREAM_BATCH_SIZE)
+        for row in rows:
+            yield serialize_access(row)
+        if len(rows) < STREAM_BATCH_SIZE:
+            return
+        last_id = rows[-1].id
+
+class AccessBroadcaster:
+    """
+    Difunde los accesos nuevos a todos los clientes conectados por SSE
+
+    Una única tarea consulta la base de forma incremental (id > último id
+    visto) y reparte cada lote a las colas de los suscriptores, así la carga
+    sobre la base no crece con la cantidad de clientes. Si la cola de un
+    cliente lento se llena, se vacía y se le deja RESYNC: el cliente vuelve
+    a leer de la base lo que le falta en lugar de perder eventos.
+    """
+
+    def __init__(self, poll_interval: float = STREAM_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.high_water_mark = 0
+        self._subscribers = set()
+        self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=STREAM_CLIENT_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    async def _run(self):
+        self.high_water_mark = await run_db(fetch_max_id)
+        while self._subscribers:
             try:
-                # Intentar parsear el timestamp con microsegundos
-                timestamp = datetime.strptime(row.timestamp, '%Y-%m-%d %H:%M:%S.%f')
-            except ValueError:
-                try:
-                    # Si falla, intentar sin microsegundos
-                    timestamp = datetime.strptime(row.timestamp, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    # Si aún falla, usar el timestamp como string
-                    timestamp = row.timestamp
-
-            # Ajustar la ruta de la imagen para usar el prefijo /faces/
-            imagen_path = row.face_image_path
-            if imagen_path:
-                # Extraer solo el nombre del archivo de la ruta completa
-                imagen_nombre = os.path.basename(imagen_path)
-                imagen_path = f"/faces/{imagen_nombre}"
-
-            accesos.append({
-                "id": row.id,
-                "nombre": row.name,
-                "persona_id": row.person_id if row.person_id else "No identificado",
-                "timestamp": timestamp,
-                "estado": "Permitido" if row.person_id else "No autorizado",
-                "imagen": imagen_path
-            })
-    
+                rows = await run_db(fetch_since, self.high_water_mark, STREAM_BATCH_SIZE)
+            except Exception as e:
+                print(f"Error al consultar accesos nuevos: {str(e)}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if rows:
+                self.high_water_mark = rows[-1].id
+                accesos = [serialize_access(row) for row in rows]
+                for queue in list(self._subscribers):
+                    for acceso in accesos:
+                        if queue.full():
+                            # Cliente lento: en lugar de descartar eventos se le pide
+                            # que se ponga al día desde la base
+                            while not queue.empty():
+                                queue.get_nowait()
+                            queue.put_nowait(RESYNC)
+                        queue.put_nowait(acceso)
+            if len(rows) < STREAM_BATCH_SIZE:
+                await asyncio.sleep(self.poll_interval)
+
+# Marca en la cola de un cliente que perdió eventos por ser lento
+RESYNC = None
+
+broadcaster = AccessBroadcaster()
+
+def format_sse(acceso: dict) -> str:
+    """Formatea un acceso como evento SSE (el id permite reanudar con Last-Event-ID)"""
+    return f"id: {acceso['id']}\nevent: acceso\ndata: {json.dumps(acceso, default=str)}\n\n"
+
+def encode_cursor(timestamp: str, row_id: int) -> str:
+    """Codifica la posición (timestamp, id) del último registro de una página"""
+    return base64.urlsafe_b64encode(f"{timestamp}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Decodifica un cursor generado por encode_cursor"""
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return timestamp, int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def normalize_time(value: Optional[str], field: str) -> Optional[str]:
+    """Convierte una fecha ISO del usuario al formato de ancho fijo guardado en la base"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Fecha inválida en '{field}': {value}")
+
+def fetch_access_page(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                      person_id: Optional[str] = None, estado: Optional[str] = None,
+                      desde: Optional[str] = None, hasta: Optional[str] = None):
+    """
+    Obtiene una página de accesos, del más reciente al más antiguo
+
+    La paginación es por cursor (keyset) sobre (timestamp, id), de modo que
+    cada página cuesta lo mismo sin importar cuántos registros haya.
+
+    Returns:
+        tuple: (filas, cursor de la página siguiente o None)
+    """
+    if estado and estado not in ESTADOS:
+        raise HTTPException(status_code=400, detail=f"Estado inválido: {estado}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conditions = []
+    params = {"limit": limit + 1}
+    if cursor:
+        params["cursor_ts"], params["cursor_id"] = decode_cursor(cursor)
+        conditions.append("(timestamp, id) < (:cursor_ts, :cursor_id)")
+    if person_id:
+        conditions.append("person_id = :person_id")
+        params["person_id"] = person_id
+    if estado == "Permitido":
+        conditions.append("person_id IS NOT NULL")
+    elif estado == "No autorizado":
+        conditions.append("person_id IS NULL")
+    if desde:
+        conditions.append("timestamp >= :desde")
+        params["desde"] = normalize_time(desde, "desde")
+    if hasta:
+        conditions.append("timestamp <= :hasta")
+        params["hasta"] = normalize_time(hasta, "hasta")
+
+    def page_query(conditions):
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return text(f"""
+            SELECT id, name, person_id, timestamp, face_image_path
+            FROM access_logs
+            {where}
+            ORDER BY timestamp DESC, id DESC
+            LIMIT :limit
+        """)
+
+    with engine.connect() as connection:
+        archives = archived_months(connection)
+        live_conditions = list(conditions)
+        if archives:
+            # Las filas de meses archivados que todavía no se borraron se leen del archivo
+            live_conditions.append("timestamp >= :archive_boundary")
+            params["archive_boundary"] = month_start(next_month(archives[0].month))
+        rows = connection.execute(page_query(live_conditions), params).fetchall()
+
+    # Si la página no se completó, seguir por los meses archivados, del más nuevo al más viejo
+    upper = [value for value in (params.get("cursor_ts"), params.get("hasta")) if value]
+    for month, path in archives:
+        if len(rows) > limit or (params.get("desde") and month_start(next_month(month)) <= params["desde"]):
+            break
+        if (upper and month_start(month) > min(upper)) or not os.path.exists(path):
+            continue
+        with archive_engine(path).connect() as connection:
+            rows += connection.execute(page_query(conditions), {**params, "limit": limit + 1 - len(rows)}).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return rows, next_cursor
+
+def month_start(month: str) -> str:
+    """Primer instante de un mes 'AAAA-MM' en el formato de la base"""
+    return f"{month}-01 00:00:00.000000"
+
+def next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f"{year:04d}-{number:02d}"
+
+def archived_months(connection):
+    """Meses archivados (mes, archivo), del más reciente al más viejo"""
+    try:
+        return connection.execute(text("SELECT month, path FROM access_archive ORDER BY month DESC")).fetchall()
+    except OperationalError:
+        # Todavía no se archivó nada
+        connection.rollback()
+        return []
+
+@functools.lru_cache(maxsize=64)
+def archive_engine(path: str):
+    """Engine de solo lectura para el archivo de un mes"""
+    return create_engine(f"sqlite:///file:{path}?mode=ro&uri=true", connect_args={"check_same_thread": False})
+
+def read_archived_image(archive_name: str, member: str) -> Optional[bytes]:
+    """Lee una imagen del ZIP de un mes archivado (None si no existe)"""
+    try:
+        with zipfile.ZipFile(os.path.join(ARCHIVE_DIR, archive_name)) as archive:
+            return archive.read(member)
+    except (FileNotFoundError, KeyError, zipfile.BadZipFile):
+        return None
+
+def page_link(path: str, cursor: str, **filters) -> str:
+    """Arma el enlace a la página siguiente conservando los filtros aplicados"""
+    params = {k: v for k, v in filters.items() if v not in (None, "")}
+    return f"{path}?{urlencode({**params, 'cursor': cursor})}"
+
+def face_url(face_image_path: Optional[str]) -> Optional[str]:
+    """Ajusta la ruta de la imagen para usar el prefijo /faces/"""
+    if not face_image_path:
+        return face_image_path
+    # Conservar la ruta relativa a detected_faces (incluye los directorios por fecha)
+    parts = face_image_path.replace("\\", "/").split("/")
+    # Imagen de un mes archivado: se sirve desde el ZIP del mes
+    zipped = [index for index, part in enumerate(parts) if part.endswith(".zip")]
+    if zipped:
+        return "/archivo/" + "/".join(parts[zipped[-1]:])
+    if "detected_faces" in parts:
+        relative = parts[len(parts) - parts[::-1].index("detected_faces"):]
+        return "/faces/" + "/".join(relative)
+    # Extraer solo el nombre del archivo de la ruta completa
+    return f"/faces/{os.path.basename(face_image_path)}"
+
+def parse_timestamp(value):
+    """Convierte el timestamp guardado a datetime (o lo deja como string si no se puede)"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+def serialize_access(row, timestamp=None):
+    """Convierte una fila de access_logs al formato de la API"""
+    return {
+        "id": row.id,
+        "nombre": row.name,
+        "persona_id": row.person_id if row.person_id else "No identificado",
+        "timestamp": row.timestamp if timestamp is None else timestamp,
+        "estado": "Permitido" if row.person_id else "No autorizado",
+        "imagen": face_url(row.face_image_path)
+    }
+
+def fetch_access_json(*args):
+    """
+    Página de accesos ya serializada a JSON (para /api/accesos)
+
+    Corre completa en el pool de la base: la consulta y la serialización de
+    una página grande no ocupan el event loop.
+
+    Returns:
+        tuple: (cuerpo JSON en bytes, cursor de la página siguiente o None)
+    """
+    rows, next_cursor = fetch_access_page(*args)
+    body = json.dumps([serialize_access(row) for row in rows], default=str,
+                      ensure_ascii=False, separators=(",", ":"))
+    return body.encode("utf-8"), next_cursor
+
+def fetch_rollup(intervalo: str, desde: Optional[str] = None, hasta: Optional[str] = None,
+                 person_id: Optional[str] = None, por_persona: bool = False):
+    """
+    Conteos de accesos permitidos y no autorizados por intervalo
+
+    Lee las tablas pre-agregadas y suma al vuelo solo los accesos que todavía
+    no se contabilizaron (id posterior al último procesado), así el resultado
+    es exacto aunque los conteos vayan atrasados, y cuesta lo mismo sin importar
+    cuántos años de registros haya.
+
+    Args:
+        intervalo (str): "horas" o "dias"
+        desde, hasta (str, optional): Fechas ISO; se incluyen los intervalos que las contienen
+        person_id (str, optional): Solo esta persona
+        por_persona (bool): Si es True se devuelve un conteo por intervalo y persona
+            (person_id '' son los no autorizados); si no, el total de cada intervalo
+
+    Returns:
+        dict: {(intervalo, person_id): [permitidos, no autorizados]}
+    """
+    table, length = ROLLUPS[intervalo]
+    conditions = []
+    params = {}
+    if desde:
+        conditions.append("bucket >= :desde")
+        params["desde"] = normalize_time(desde, "desde")[:length]
+    if hasta:
+        conditions.append("bucket <= :hasta")
+        params["hasta"] = normalize_time(hasta, "hasta")[:length]
+    tail_conditions = list(conditions)
+    if person_id is not None:
+        conditions.append("person_id = :person_id")
+        tail_conditions.append("person_id = :person_id")
+        params["person_id"] = person_id
+    elif por_persona:
+        conditions.append("person_id != :all")
+        params["all"] = ROLLUP_ALL
+    else:
+        conditions.append("person_id = :all")
+        params["all"] = ROLLUP_ALL
+    where = f"WHERE {' AND '.join(conditions)}"
+    tail_where = f"WHERE {' AND '.join(tail_conditions)}" if tail_conditions else ""
+    # Sin filtro de persona ni desglose, los accesos pendientes se agrupan en el total
+    tail_person = "person_id" if person_id is not None or por_persona else ":all"
+
+    counts = {}
+    with engine.connect() as connection:
+        try:
+            last_id = connection.execute(text(
+                "SELECT last_id FROM access_rollup_state WHERE name = 'access_logs'"
+            )).scalar() or 0
+            rows = connection.execute(text(f"""
+                SELECT bucket, person_id, allowed, unauthorized FROM {table} {where}
+            """), params).fetchall()
+        except OperationalError:
+            # La base todavía no tiene las tablas de conteos: todo se suma al vuelo
+            connection.rollback()
+            last_id, rows = 0, []
+        tail = connection.execute(text(f"""
+            SELECT bucket, {tail_person}, SUM(allowed), SUM(unauthorized)
+            FROM (
+                SELECT substr(timestamp, 1, {length}) AS bucket,
+                       COALESCE(person_id, :unauthorized) AS person_id,
+                       person_id IS NOT NULL AS allowed, person_id IS NULL AS unauthorized
+                FROM access_logs WHERE id > :last_id
+            ) {tail_where}
+            GROUP BY 1, 2
+        """), {**params, "last_id": last_id, "unauthorized": ROLLUP_UNAUTHORIZED}).fetchall()
+
+    for bucket, person, allowed, unauthorized in list(rows) + list(tail):
+        count = counts.setdefault((bucket, person), [0, 0])
+        count[0] += allowed
+        count[1] += unauthorized
+    return counts
+
+def access_series(intervalo: str, desde: Optional[str] = None, hasta: Optional[str] = None,
+                  person_id: Optional[str] = None):
+    """Serie de accesos por intervalo, en orden cronológico"""
+    counts = fetch_rollup(intervalo, desde, hasta, person_id)
+    return [
+        {"intervalo": bucket, "permitidos": allowed, "no_autorizados": unauthorized}
+        for (bucket, _), (allowed, unauthorized) in sorted(counts.items())
+    ]
+
+def access_ranking(desde: Optional[str] = None, hasta: Optional[str] = None, limit: int = 100):
+    """Accesos por persona en el período, de la que más tiene a la que menos"""
+    totals = {}
+    for (_, person), (allowed, unauthorized) in fetch_rollup("dias", desde, hasta, por_persona=True).items():
+        total = totals.setdefault(person, [0, 0])
+        total[0] += allowed
+        total[1] += unauthorized
+    ranking = sorted(totals.items(), key=lambda item: (-sum(item[1]), item[0]))
+    return [
+        {"persona_id": person if person != ROLLUP_UNAUTHORIZED else None,
+         "permitidos": allowed, "no_autorizados": unauthorized}
+        for person, (allowed, unauthorized) in ranking[:max(1, min(limit, MAX_RANKING))]
+    ]
+
+# Rutas
+@app.get("/")
+async def home(request: Request, cursor: Optional[str] = None, person_id: Optional[str] = None,
+               estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+               limit: int = DEFAULT_PAGE_SIZE):
+    rows, next_cursor = await run_db(fetch_access_page, limit, cursor, person_id, estado, desde, hasta)
+    accesos = [serialize_access(row, parse_timestamp(row.timestamp)) for row in rows]
+
+    siguiente = None
+    if next_cursor:
+        siguiente = page_link("/", next_cursor, person_id=person_id, estado=estado,
+                              desde=desde, hasta=hasta, limit=limit)
+
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "accesos": accesos}
+        {
+            "request": request,
+            "accesos": accesos,
+            "siguiente": siguiente,
+            "filtros": {"person_id": person_id, "estado": estado, "desde": desde, "hasta": hasta},
+            "estados": ESTADOS,
+            # Solo la primera página sin filtros se actualiza en vivo
+            "en_vivo": not any((cursor, person_id, estado, desde, hasta)),
+        }
     )
 
 @app.get("/api/accesos")
-async def get_accesos():
-    with engine.connect() as connection:
-        query = text("""
-            SELECT id, name, person_id, timestamp, face_image_path 
-            FROM access_logs 
-            ORDER BY timestamp DESC
-        """)
-        result = connection.execute(query)
-        accesos = []
-        for row in result:
-            imagen_path = row.face_image_path
-            if imagen_path:
-                imagen_nombre = os.path.basename(imagen_path)
-                imagen_path = f"/faces/{imagen_nombre}"
-                
-            accesos.append({
-                "id": row.id,
-                "nombre": row.name,
-                "persona_id": row.person_id if row.person_id else "No identificado",
-                "timestamp": row.timestamp,
-                "estado": "Permitido" if row.person_id else "No autorizado",
-                "imagen": imagen_path
-            })
-    return accesos 
\ No newline at end of file
+async def get_accesos(cursor: Optional[str] = None, person_id: Optional[str] = None,
+                      estado: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                      limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Lista los accesos del más reciente al más antiguo, paginados por cursor
+
+    El cursor de la página siguiente se devuelve en el header X-Next-Cursor
+    (y en Link, rel="next"); se omite en la última página.
+    """
+    body, next_cursor = await run_db(fetch_access_json, limit, cursor, person_id, estado, desde, hasta)
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        link = page_link("/api/accesos", next_cursor, person_id=person_id, estado=estado,
+                         desde=desde, hasta=hasta, limit=limit)
+        headers["Link"] = f'<{link}>; rel="next"'
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/accesos/stream")
+async def stream_accesos(request: Request, ultimo_id: Optional[int] = None):
+    """
+    Stream (Server-Sent Events) de los accesos nuevos a medida que se registran
+
+    Si el cliente se reconecta con el header Last-Event-ID (o indica ultimo_id)
+    primero recibe los accesos que se perdió.
+    """
+    queue = broadcaster.subscribe()
+    last_event_id = request.headers.get("last-event-id") or (str(ultimo_id) if ultimo_id is not None else None)
+
+    async def events():
+        try:
+            if last_event_id and last_event_id.isdigit():
+                # Ponerse al día con todo lo que se perdió, por lotes
+                last_sent = int(last_event_id)
+                async for acceso in iter_since(last_sent):
+                    last_sent = acceso["id"]
+                    yield format_sse(acceso)
+            else:
+                # Cliente nuevo: el stream empieza en el último acceso registrado
+                last_sent = await run_db(fetch_max_id)
+            while True:
+                try:
+                    acceso = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comentario SSE para mantener viva la conexión
+                    yield ": keepalive\n\n"
+                    continue
+                if acceso is RESYNC:
+                    async for acceso in iter_since(last_sent):
+                        last_sent = acceso["id"]
+                        yield format_sse(acceso)
+                    continue
+                if acceso["id"] <= last_sent:
+                    continue
+                last_sent = acceso["id"]
+                yield format_sse(acceso)
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/estadisticas/horas")
+async def estadisticas_horas(desde: Optional[str] = None, hasta: Optional[str] = None,
+                             person_id: Optional[str] = None):
+    """Accesos permitidos y no autorizados por hora ("YYYY-MM-DD HH")"""
+    return await run_db(access_series, "horas", desde, hasta, person_id)
+
+@app.get("/api/estadisticas/dias")
+async def estadisticas_dias(desde: Optional[str] = None, hasta: Optional[str] = None,
+                            person_id: Optional[str] = None):
+    """Accesos permitidos y no autorizados por día ("YYYY-MM-DD")"""
+    return await run_db(access_series, "dias", desde, hasta, person_id)
+
+@app.get("/api/estadisticas/personas")
+async def estadisticas_personas(desde: Optional[str] = None, hasta: Optional[str] = None,
+                                limit: int = 100):
+    """
+    Accesos por persona en el período (persona_id null agrupa los no autorizados),
+    ordenados de mayor a menor
+    """
+    return await run_db(access_ranking, desde, hasta, limit)
+
+@app.get("/archivo/{archivo}/{imagen:path}")
+async def imagen_archivada(archivo: str, imagen: str):
+    """Imagen de un rostro guardada en el ZIP de un mes archivado"""
+    if not ARCHIVE_IMAGES_PATTERN.fullmatch(archivo):
+        raise HTTPException(status_code=404, detail="Archivo inexistente")
+    content = await run_db(read_archived_image, archivo, imagen)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Imagen inexistente")
+    return Response(content=content, media_type="image/jpeg")
@@ -0,0 +1,364 @@
+import argparse
+import csv
+import os
+import queue
+import sys
+import threading
+import time
+import cv2
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from face_detector import FaceDetector, UNKNOWN_NAME
+from face_locators import LOCATOR_TYPES, create_face_locator
+from database_manager import DatabaseManager
+from encoding_cache import EncodingCache
+from enrollment import IMAGE_EXTENSIONS, enroll_directory
+from pipeline import AccessDeduplicator
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mpg', '.mpeg', '.wmv', '.webm')
+
+REPORT_FIELDS = ('source', 'frame', 'offset_s', 'timestamp', 'name', 'distance',
+                 'top', 'right', 'bottom', 'left')
+
+
+class FrameJob(NamedTuple):
+    """Frame decodificado de una fuente offline"""
+    source: str
+    index: int
+    offset: float          # Segundos desde el inicio del video (0 para imágenes)
+    timestamp: datetime    # Momento real estimado del frame
+    image: object
+
+
+class Detection(NamedTuple):
+    """Rostro encontrado en un frame de una fuente offline"""
+    source: str
+    frame: int
+    offset: float
+    timestamp: datetime
+    name: str
+    distance: float
+    location: tuple
+
+
+def expand_inputs(paths: List[str]) -> List[str]:
+    """Expande directorios en la lista ordenada de videos e imágenes que contienen"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+                        files.append(os.path.join(root, filename))
+        else:
+            files.append(path)
+    return files
+
+
+def iter_frames(paths: List[str], frame_step: int = 1,
+                start_time: Optional[datetime] = None) -> Iterator[FrameJob]:
+    """
+    Recorre los frames de videos e imágenes sueltas
+
+    En los videos solo se decodifican uno de cada frame_step frames; el resto
+    se saltea con grab(), que avanza el stream sin convertir la imagen.
+
+    Args:
+        paths: Archivos de video o de imagen
+        frame_step (int): Procesar uno de cada frame_step frames de video
+        start_time (datetime, optional): Inicio de la grabación; por defecto se usa
+            la fecha de modificación de cada archivo
+    """
+    for path in paths:
+        base_time = start_time or datetime.fromtimestamp(os.path.getmtime(path))
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"No se pudo leer la imagen: {path}")
+                continue
+            yield FrameJob(path, 0, 0.0, base_time, image)
+            continue
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"No se pudo abrir el video: {path}")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        index = 0
+        try:
+            while True:
+                if index % frame_step:
+                    if not cap.grab():
+                        break
+                else:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    offset = index / fps
+                    yield FrameJob(path, index, offset, base_time + timedelta(seconds=offset), frame)
+                index += 1
+        finally:
+            cap.release()
+
+
+class DecodeThread(threading.Thread):
+    """Decodifica los frames en un hilo propio y los entrega en lotes por una cola acotada"""
+
+    def __init__(self, paths: List[str], frame_step: int = 1, batch_size: int = 8,
+                 max_batches: int = 8, start_time: Optional[datetime] = None):
+        super().__init__(name='decodificacion', daemon=True)
+        self.paths = paths
+        self.frame_step = frame_step
+        self.batch_size = batch_size
+        self.start_time = start_time
+        self.batches = queue.Queue(maxsize=max_batches)
+        self.frames = 0
+        self.media_seconds = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        batch = []
+        last_offsets = {}
+        try:
+            for job in iter_frames(self.paths, self.frame_step, self.start_time):
+                if self._stop_event.is_set():
+                    break
+                self.frames += 1
+                last_offsets[job.source] = job.offset
+                batch.append(job)
+                if len(batch) >= self.batch_size:
+                    self.batches.put(batch)
+                    batch = []
+            if batch:
+                self.batches.put(batch)
+        finally:
+            self.media_seconds = sum(last_offsets.values())
+            self.batches.put(None)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# Detector de cada proceso del pool
+_batch_detector = None
+
+
+def _init_batch_worker(detector):
+    global _batch_detector
+    _batch_detector = detector
+
+
+def _detect_batch(batch: List[FrameJob]) -> List[Detection]:
+    """Detecta los rostros de un lote de frames identificándolos en una sola búsqueda"""
+    results = _batch_detector.detect_faces_batch([job.image for job in batch])
+    detections = []
+    for job, faces in zip(batch, results):
+        for location, name, distance in faces:
+            detections.append(Detection(job.source, job.index, job.offset, job.timestamp,
+                                        name, float(distance), location))
+    return detections
+
+
+def process_offline(detector: FaceDetector, paths: List[str], workers: int = 1, frame_step: int = 1,
+                    batch_size: int = 8, start_time: Optional[datetime] = None,
+                    stats: Optional[Dict] = None) -> Iterator[Detection]:
+    """
+    Procesa videos e imágenes contra la galería del detector
+
+    La decodificación corre en un hilo y la detección en un pool de procesos;
+    los lotes se entregan en el orden de las fuentes.
+
+    Args:
+        detector: FaceDetector con la galería cargada
+        paths: Archivos de video o de imagen
+        workers (int): Procesos de detección (1 detecta en el proceso actual)
+        frame_step (int): Procesar uno de cada frame_step frames de video
+        batch_size (int): Frames por lote enviado a cada proceso
+        start_time (datetime, optional): Inicio de la grabación
+        stats (dict, optional): Se completa con frames, segundos de video y tiempo total
+
+    Returns:
+        Iterator[Detection]: Rostros detectados, en orden
+    """
+    started = time.perf_counter()
+    decoder = DecodeThread(paths, frame_step=frame_step, batch_size=batch_size,
+                           max_batches=max(2, workers * 2), start_time=start_time)
+    decoder.start()
+
+    _init_batch_worker(detector)
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                       initargs=(detector,))
+    try:
+        pending = deque()
+        while True:
+            batch = decoder.batches.get()
+            if batch is None:
+                break
+            if executor is None:
+                yield from _detect_batch(batch)
+                continue
+            pending.append(executor.submit(_detect_batch, batch))
+            # Mantener a lo sumo dos lotes por proceso en vuelo
+            while len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        decoder.stop()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if stats is not None:
+            stats['frames'] = decoder.frames
+            stats['media_seconds'] = decoder.media_seconds
+            stats['elapsed'] = time.perf_counter() - started
+
+
+class ReportWriter:
+    """Escribe las detecciones en un reporte CSV o Parquet (según la extensión)"""
+
+    def __init__(self, path: str, chunk_size: int = 10000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._rows = []
+        self._csv_file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        self._parquet = path.lower().endswith('.parquet')
+        if self._parquet:
+            try:
+                import pyarrow  # noqa: F401
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                raise SystemExit("Para reportes Parquet hace falta instalar pyarrow (pip install pyarrow)")
+        else:
+            self._csv_file = open(path, 'w', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(REPORT_FIELDS)
+
+    def write(self, detection: Detection):
+        top, right, bottom, left = detection.location
+        self._rows.append((detection.source, detection.frame, round(detection.offset, 3),
+                           detection.timestamp.isoformat(sep=' '), detection.name,
+                           round(detection.distance, 4), top, right, bottom, left))
+        if len(self._rows) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        if self._parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_arrays([list(column) for column in zip(*self._rows)], names=list(REPORT_FIELDS))
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            self._csv_writer.writerows(self._rows)
+        self._rows = []
+
+    def close(self):
+        self._flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._csv_file is not None:
+            self._csv_file.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Procesa offline videos grabados y carpetas de imágenes contra la galería actual"
+    )
+    parser.add_argument('inputs', nargs='+', help="Archivos de video, imágenes o directorios")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Procesos de detección (por defecto, uno por núcleo)")
+    parser.add_argument('--frame-step', type=int, default=5,
+                        help="Procesar uno de cada N frames de video")
+    parser.add_argument('--batch-size', type=int, default=8, help="Frames por lote")
+    parser.add_argument('--escala', type=float, default=1.0, help="Escala de detección (0, 1]")
+    parser.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'ANCHO', 'ALTO'))
+    parser.add_argument('--detector', choices=list(LOCATOR_TYPES), default='hog',
+                        help="Detector de rostros (los de OpenCV usan los modelos de --models-dir)")
+    parser.add_argument('--models-dir', default=os.path.join('data', 'models'))
+    parser.add_argument('--galeria', default=os.path.join('data', 'authorized_faces'),
+                        help="Directorio de rostros autorizados")
+    parser.add_argument('--galeria-archivo',
+                        help="Galería exportada con enroll.py --exportar; en float32 los procesos "
+                             "comparten la matriz mapeada en memoria en lugar de copiarla")
+    parser.add_argument('--inicio', type=datetime.fromisoformat,
+                        help="Fecha y hora de inicio de la grabación (AAAA-MM-DD HH:MM:SS); "
+                             "por defecto, la fecha de modificación de cada archivo")
+    parser.add_argument('--reporte', help="Guardar todas las detecciones en un CSV o Parquet")
+    parser.add_argument('--registrar', action='store_true',
+                        help="Registrar los accesos autorizados en access_logs")
+    parser.add_argument('--db-path', default=os.path.join('data', 'access.db'))
+    parser.add_argument('--min-interval', type=float, default=10,
+                        help="Minutos mínimos entre registros de la misma persona en una fuente")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.reporte and not args.registrar:
+        print("Indicar --reporte y/o --registrar")
+        return 2
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("No se encontraron videos ni imágenes para procesar")
+        return 2
+
+    detector = FaceDetector(detection_scale=args.escala, roi=tuple(args.roi) if args.roi else None,
+                            locator=create_face_locator(args.detector, models_dir=args.models_dir))
+    if args.galeria_archivo:
+        detector.gallery = type(detector.gallery).load(args.galeria_archivo)
+    elif os.path.isdir(args.galeria):
+        enroll_directory(detector, args.galeria, workers=max(1, args.workers),
+                         cache=EncodingCache(), verbose=False)
+    print(f"Galería: {len(detector.gallery)} rostros, fuentes: {len(paths)}")
+
+    report = ReportWriter(args.reporte) if args.reporte else None
+    accesses = []
+    deduplicators = {}
+    min_interval = timedelta(minutes=args.min_interval)
+    stats = {}
+    faces = 0
+    try:
+        for detection in process_offline(detector, paths, workers=max(1, args.workers),
+                                         frame_step=max(1, args.frame_step),
+                                         batch_size=max(1, args.batch_size),
+                                         start_time=args.inicio, stats=stats):
+            faces += 1
+            if report is not None:
+                report.write(detection)
+            if args.registrar and detection.name != UNKNOWN_NAME:
+                deduplicator = deduplicators.setdefault(detection.source, AccessDeduplicator(min_interval))
+                should_register, _ = deduplicator.check(detection.name, detection.timestamp)
+                if should_register:
+                    accesses.append((detection.name, detection.name, detection.timestamp, None))
+    finally:
+        if report is not None:
+            report.close()
+
+    if args.registrar and accesses:
+        db_manager = DatabaseManager(args.db_path, async_writes=False)
+        try:
+            db_manager.register_accesses(accesses)
+        finally:
+            db_manager.close()
+
+    elapsed = stats.get('elapsed', 0.0)
+    fps = stats.get('frames', 0) / elapsed if elapsed > 0 else 0.0
+    print(f"Frames procesados: {stats.get('frames', 0)} en {elapsed:.2f}s ({fps:.1f} frames/s)")
+    if stats.get('media_seconds'):
+        print(f"Video recorrido: {stats['media_seconds']:.1f}s "
+              f"({stats['media_seconds'] / elapsed:.1f}x tiempo real)")
+    print(f"Rostros detectados: {faces}, accesos registrados: {len(accesses) if args.registrar else 0}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
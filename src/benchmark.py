@@ -0,0 +1,848 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+from urllib.parse import parse_qsl, urlencode
+from urllib.request import urlopen
+from face_detector import FaceDetector
+from face_locators import LOCATOR_TYPES, create_face_locator
+from face_gallery import FaceGallery, TemplateGallery, create_index
+from gallery_file import DTYPES
+from database_manager import DatabaseManager
+from text_recognizer import TextRecognizer
+from face_tracker import iou
+from encoding_cache import EncodingCache
+from enrollment import IMAGE_EXTENSIONS, enroll_directory
+
+
+def summarize_latencies(latencies: Sequence[float]) -> Dict[str, float]:
+    """
+    Resume una serie de latencias (en segundos)
+
+    Returns:
+        dict: Percentiles p50/p95/p99, media y máximo en milisegundos
+    """
+    if not latencies:
+        return {'n': 0, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    samples = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        'n': int(samples.size),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(samples.max()),
+    }
+
+
+def time_calls(fn: Callable, inputs: Sequence, repeat: int = 1) -> List[float]:
+    """Mide la latencia de fn sobre cada entrada, repeat veces"""
+    latencies = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def measure(fn: Callable, inputs: Sequence, repeat: int = 1, warmup: int = 1) -> Dict:
+    """
+    Mide latencia, throughput y pico de memoria de fn sobre cada entrada
+
+    Las primeras warmup pasadas no se cuentan (cachés, carga de modelos).
+    El pico de memoria corresponde a las asignaciones hechas durante la
+    medición (Python y NumPy), no al proceso completo.
+    """
+    for _ in range(warmup):
+        for item in inputs[:1]:
+            fn(item)
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        latencies = time_calls(fn, inputs, repeat)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'latency': summarize_latencies(latencies),
+        'throughput_per_s': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'peak_alloc_mb': peak / 1024 ** 2,
+    }
+
+
+def print_cases(results: List[Dict]):
+    """Imprime una tabla con los casos medidos"""
+    print(f"{'caso':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>10} {'MB':>8}")
+    for r in results:
+        print(f"{r['case']:<40} {r['latency']['p50_ms']:>9.2f} {r['latency']['p95_ms']:>9.2f} "
+              f"{r['latency']['p99_ms']:>9.2f} {r['throughput_per_s']:>10.1f} {r['peak_alloc_mb']:>8.1f}")
+
+
+def load_frames(path: str, max_frames: int = 200, frame_step: int = 1) -> List[np.ndarray]:
+    """Carga frames de un directorio de imágenes o de un archivo de video"""
+    frames = []
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                image = cv2.imread(os.path.join(path, filename))
+                if image is not None:
+                    frames.append(image)
+            if len(frames) >= max_frames:
+                break
+        return frames
+
+    cap = cv2.VideoCapture(path)
+    index = 0
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % frame_step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def load_gallery(detector: FaceDetector, faces_dir: str):
+    """Carga la galería de autorizados (usando la caché de encodings)"""
+    if faces_dir and os.path.isdir(faces_dir):
+        enroll_directory(detector, faces_dir, cache=EncodingCache(), verbose=False)
+
+
+def compare_detections(reference, candidate, min_iou: float = 0.5) -> Dict[str, int]:
+    """Cuenta los rostros de referencia encontrados y los que conservan la identidad"""
+    found = 0
+    same_identity = 0
+    used = set()
+    for ref_location, ref_name in reference:
+        best, best_iou = None, min_iou
+        for i, (location, name) in enumerate(candidate):
+            overlap = iou(ref_location, location)
+            if i not in used and overlap >= best_iou:
+                best, best_iou = i, overlap
+        if best is not None:
+            used.add(best)
+            found += 1
+            if candidate[best][1] == ref_name:
+                same_identity += 1
+    return {'found': found, 'same_identity': same_identity}
+
+
+def bench_scales(args) -> Dict:
+    """Compromiso precisión/latencia de la detección a distintas escalas"""
+    frames = load_frames(args.input, max_frames=args.max_frames)
+    if not frames:
+        raise SystemExit(f"No se encontraron frames en {args.input}")
+
+    roi = tuple(args.roi) if args.roi else None
+    reference_detector = FaceDetector(roi=roi)
+    load_gallery(reference_detector, args.galeria)
+    reference = [reference_detector.detect_faces(frame) for frame in frames]
+    reference_faces = sum(len(r) for r in reference)
+
+    results = []
+    for scale in args.scales:
+        detector = FaceDetector(detection_scale=scale, roi=roi)
+        detector.gallery = reference_detector.gallery
+        detections = []
+        latencies = []
+        for _ in range(args.repeat):
+            detections = []
+            for frame in frames:
+                start = time.perf_counter()
+                detections.append(detector.detect_faces(frame))
+                latencies.append(time.perf_counter() - start)
+
+        found = same_identity = 0
+        for ref, candidate in zip(reference, detections):
+            counts = compare_detections(ref, candidate)
+            found += counts['found']
+            same_identity += counts['same_identity']
+
+        results.append({
+            'scale': scale,
+            'latency': summarize_latencies(latencies),
+            'faces': sum(len(d) for d in detections),
+            'recall': found / reference_faces if reference_faces else 1.0,
+            'identity_agreement': same_identity / reference_faces if reference_faces else 1.0,
+        })
+
+    print(f"Frames: {len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]}), "
+          f"rostros de referencia (escala 1.0): {reference_faces}")
+    print(f"{'escala':>7} {'p50 ms':>9} {'p95 ms':>9} {'rostros':>8} {'recall':>8} {'identidad':>10}")
+    for r in results:
+        print(f"{r['scale']:>7.2f} {r['latency']['p50_ms']:>9.1f} {r['latency']['p95_ms']:>9.1f} "
+              f"{r['faces']:>8d} {r['recall']:>8.2%} {r['identity_agreement']:>10.2%}")
+
+    return {'frames': len(frames), 'reference_faces': reference_faces, 'results': results}
+
+
+def face_crops(faces_dir: str, limit: int = 8) -> List[np.ndarray]:
+    """Recortes de rostros reales tomados de las imágenes autorizadas (fixtures del repo)"""
+    crops = []
+    if not faces_dir or not os.path.isdir(faces_dir):
+        return crops
+    detector = FaceDetector()
+    for filename in sorted(os.listdir(faces_dir)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(faces_dir, filename))
+        if image is None:
+            continue
+        locations = detector.locate_faces(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if locations:
+            top, right, bottom, left = locations[0]
+            # Margen para que el detector vea la cabeza completa
+            margin = (bottom - top) // 2
+            image = image[max(0, top - margin):bottom + margin, max(0, left - margin):right + margin]
+        crops.append(image)
+        if len(crops) >= limit:
+            break
+    return crops
+
+
+def synthetic_frame(width: int, height: int, crops: List[np.ndarray], count: int, seed: int = 0) -> np.ndarray:
+    """Frame sintético con count rostros pegados en grilla sobre un fondo con ruido"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    if count == 0 or not crops:
+        return frame
+    cols = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / cols))
+    cell_w, cell_h = width // cols, height // rows
+    for i in range(count):
+        crop = crops[i % len(crops)]
+        scale = 0.9 * min(cell_w / crop.shape[1], cell_h / crop.shape[0])
+        face = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        y = (i // cols) * cell_h + (cell_h - face.shape[0]) // 2
+        x = (i % cols) * cell_w + (cell_w - face.shape[1]) // 2
+        frame[y:y + face.shape[0], x:x + face.shape[1]] = face
+    return frame
+
+
+def parse_resolution(value: str):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def bench_detection(args) -> Dict:
+    """Latencia de FaceDetector.detect_faces (ubicación HOG y encoding) por resolución y cantidad de rostros"""
+    crops = face_crops(args.galeria)
+    if not crops and any(args.faces):
+        print(f"Sin rostros de referencia en {args.galeria}: los frames no tendrán rostros")
+    detector = FaceDetector()
+    cases = []
+    for width, height in args.resolutions:
+        for count in args.faces:
+            frames = [synthetic_frame(width, height, crops, count, seed=i) for i in range(args.frames)]
+            rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+            located = {id(rgb): detector.locate_faces(rgb) for rgb in rgb_frames}
+            label = f"{width}x{height} rostros={count}"
+
+            for stage, fn, inputs in (
+                ('ubicacion', detector.locate_faces, rgb_frames),
+                ('encoding', lambda rgb: detector.encode_faces(rgb, located[id(rgb)]), rgb_frames),
+                ('total', detector.detect_faces, frames),
+            ):
+                result = measure(fn, inputs, repeat=args.repeat)
+                result.update({'case': f"deteccion {stage} {label}", 'width': width, 'height': height,
+                               'faces': count, 'found': sum(len(v) for v in located.values()) // len(frames)})
+                cases.append(result)
+
+    print_cases(cases)
+    return {'cases': cases}
+
+
+def bench_detectors(args) -> Dict:
+    """
+    Velocidad y recall de cada backend de detección frente a uno de referencia,
+    con el encoder de dlib sobre las ubicaciones de cada uno
+    """
+    if args.input:
+        frames = load_frames(args.input, max_frames=args.max_frames)
+    else:
+        # Sin fixtures propios: frames sintéticos con los rostros autorizados
+        crops = face_crops(args.galeria)
+        frames = [synthetic_frame(640, 480, crops, 1 + i % 4, seed=i) for i in range(args.max_frames)] if crops else []
+    if not frames:
+        raise SystemExit("No hay frames para comparar (indicar un directorio o video, o --galeria con rostros)")
+
+    reference_detector = FaceDetector(locator=create_face_locator(args.referencia, models_dir=args.models_dir))
+    load_gallery(reference_detector, args.galeria)
+    reference = [reference_detector.detect_faces(frame) for frame in frames]
+    reference_faces = sum(len(r) for r in reference)
+    rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+
+    cases = []
+    for kind in args.backends:
+        try:
+            locator = create_face_locator(kind, models_dir=args.models_dir)
+        except (FileNotFoundError, ImportError, ValueError) as e:
+            print(f"{kind}: no disponible ({str(e)})")
+            continue
+        detector = reference_detector.with_locator(locator)
+        detections = [detector.detect_faces(frame) for frame in frames]
+        found = same_identity = 0
+        for ref, candidate in zip(reference, detections):
+            counts = compare_detections(ref, candidate, min_iou=args.min_iou)
+            found += counts['found']
+            same_identity += counts['same_identity']
+        faces = sum(len(d) for d in detections)
+
+        for stage, fn, inputs in (
+            ('ubicacion', detector.locate_faces, rgb_frames),
+            ('total', detector.detect_faces, frames),
+        ):
+            result = measure(fn, inputs, repeat=args.repeat)
+            result.update({
+                'case': f"detector {kind} {stage}", 'backend': kind, 'stage': stage,
+                'faces': faces, 'extra_faces': faces - found,
+                'recall': found / reference_faces if reference_faces else 1.0,
+                'identity_agreement': same_identity / reference_faces if reference_faces else 1.0,
+            })
+            cases.append(result)
+
+    print(f"Frames: {len(frames)} ({frames[0].shape[1]}x{frames[0].shape[0]}), "
+          f"rostros de referencia ({args.referencia}): {reference_faces}")
+    print(f"{'detector':<8} {'ubic. p50':>10} {'total p50':>10} {'rostros':>8} {'extra':>6} {'recall':>8} {'identidad':>10}")
+    for locate, total in zip(cases[::2], cases[1::2]):
+        print(f"{locate['backend']:<8} {locate['latency']['p50_ms']:>10.1f} {total['latency']['p50_ms']:>10.1f} "
+              f"{locate['faces']:>8d} {locate['extra_faces']:>6d} {locate['recall']:>8.2%} "
+              f"{locate['identity_agreement']:>10.2%}")
+    return {'frames': len(frames), 'reference': args.referencia, 'reference_faces': reference_faces, 'cases': cases}
+
+
+def bench_gallery(args) -> Dict:
+    """Latencia de FaceGallery.match según el tamaño de la galería, el índice y los rostros por frame"""
+    rng = np.random.default_rng(args.seed)
+    cases = []
+    for size in args.sizes:
+        # Encodings con estructura de grupos, como los de personas reales
+        centers = rng.normal(0, 0.3, size=(max(1, size // 50), 128)).astype(np.float32)
+        encodings = centers[rng.integers(0, centers.shape[0], size)] + \
+            rng.normal(0, 0.05, size=(size, 128)).astype(np.float32)
+        names = [f"persona_{i}" for i in range(size)]
+        queries = {
+            batch: [encodings[rng.integers(0, size, batch)] +
+                    rng.normal(0, 0.02, size=(batch, 128)).astype(np.float32) for _ in range(args.repeat)]
+            for batch in args.queries
+        }
+        # Resultado exacto para medir el recall@1 de los índices aproximados
+        exact = create_index('brute')
+        exact.build(encodings)
+        truth = {batch: exact.search(np.concatenate(q))[0][:, 0] for batch, q in queries.items()}
+
+        for kind in args.indices:
+            gallery = FaceGallery(index=create_index(kind))
+            gallery.add_many(encodings, names)
+            start = time.perf_counter()
+            gallery.search(encodings[:1])
+            build_s = time.perf_counter() - start
+
+            for batch in args.queries:
+                result = measure(lambda q: gallery.match(q), queries[batch])
+                found, _ = gallery.search(np.concatenate(queries[batch]))
+                result.update({'case': f"galeria {kind} n={size} consultas={batch}", 'size': size,
+                               'index': kind, 'queries': batch, 'build_s': build_s,
+                               'recall_at_1': float(np.mean(found[:, 0] == truth[batch]))})
+                cases.append(result)
+
+    print_cases(cases)
+    return {'cases': cases}
+
+
+def bench_templates(args) -> Dict:
+    """
+    Aciertos, falsos aceptados y latencia con varias muestras por identidad:
+    una imagen por persona, todas las muestras como filas sueltas y plantillas
+    """
+    rng = np.random.default_rng(args.seed)
+    people = args.people
+    # Cada persona tiene un centro y algunas condiciones (luz, ángulo) que
+    # desplazan sus encodings; las consultas llegan con cualquier condición
+    centers = rng.normal(0, 0.07, size=(people, 128)).astype(np.float32)
+    conditions = rng.normal(0, 0.035, size=(people, args.conditions, 128)).astype(np.float32)
+
+    def sample(identities):
+        shift = conditions[identities, rng.integers(0, args.conditions, len(identities))]
+        return centers[identities] + shift + rng.normal(0, 0.015, size=(len(identities), 128)).astype(np.float32)
+
+    enrolled = np.repeat(np.arange(people), args.samples)
+    encodings = sample(enrolled)
+    names = [f"persona_{i}" for i in enrolled]
+    genuine_ids = rng.integers(0, people, args.queries)
+    genuine = sample(genuine_ids)
+    # Desconocidos parecidos a alguien de la galería (el caso difícil)
+    impostors = centers[rng.integers(0, people, args.queries)] + \
+        rng.normal(0, args.lookalike, size=(args.queries, 128)).astype(np.float32)
+    expected = [f"persona_{i}" for i in genuine_ids]
+
+    first = np.arange(0, len(enrolled), args.samples)
+    variants = (
+        ('una muestra', FaceGallery(), encodings[first], [names[i] for i in first]),
+        ('filas sueltas', FaceGallery(), encodings, names),
+        ('plantillas', TemplateGallery(max_exemplars=args.exemplars), encodings, names),
+    )
+    cases = []
+    for label, gallery, gallery_encodings, gallery_names in variants:
+        gallery.add_many(gallery_encodings, gallery_names)
+        start = time.perf_counter()
+        gallery.prepare()
+        build_s = time.perf_counter() - start
+
+        accepted = [name for name, _ in gallery.match(genuine, tolerance=args.tolerance)]
+        false_accepts = [name for name, _ in gallery.match(impostors, tolerance=args.tolerance)]
+        result = measure(lambda q: gallery.match(q, tolerance=args.tolerance),
+                         [genuine[i:i + 4] for i in range(0, len(genuine), 4)])
+        result.update({
+            'case': f"plantillas {label} personas={people} muestras={args.samples}",
+            'rows': len(gallery), 'build_s': build_s,
+            'true_accept_rate': float(np.mean([a == e for a, e in zip(accepted, expected)])),
+            'false_accept_rate': float(np.mean([name is not None for name in false_accepts])),
+        })
+        cases.append(result)
+
+    print(f"{'variante':<14} {'filas':>8} {'aciertos':>9} {'falsos':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for r, (label, *_) in zip(cases, variants):
+        print(f"{label:<14} {r['rows']:>8} {r['true_accept_rate']:>9.2%} {r['false_accept_rate']:>8.2%} "
+              f"{r['latency']['p50_ms']:>8.2f} {r['latency']['p99_ms']:>8.2f}")
+    return {'cases': cases, 'tolerance': args.tolerance}
+
+
+def synthetic_credential(text_value: str = "JUAN PEREZ") -> np.ndarray:
+    """Imagen sintética con una credencial blanca (relación 1.6) y un nombre impreso"""
+    image = np.full((480, 640, 3), 70, dtype=np.uint8)
+    cv2.rectangle(image, (160, 140), (480, 340), (255, 255, 255), thickness=-1)
+    cv2.putText(image, text_value, (185, 250), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+    return image
+
+
+def bench_ocr(args) -> Dict:
+    """Latencia de TextRecognizer.extract_text sobre credenciales sintéticas o imágenes dadas"""
+    if args.input and os.path.isdir(args.input):
+        images = load_frames(args.input, max_frames=args.max_frames)
+    else:
+        images = [synthetic_credential()]
+
+    # Sin caché: cada llamada mide el OCR completo
+    recognizer = TextRecognizer(cache_size=0)
+    batch = images * max(1, args.repeat)
+    cases = []
+    for stage, fn, inputs in (
+        ('localizar credencial', recognizer.find_white_card, images),
+        ('extract_text', recognizer.extract_text, images),
+        ('extract_texts lote', lambda items: recognizer.extract_texts(items, workers=args.workers), [batch]),
+    ):
+        if stage != 'localizar credencial' and recognizer.backend.name == 'pytesseract':
+            try:
+                import pytesseract
+                pytesseract.get_tesseract_version()
+            except Exception as e:
+                print(f"Tesseract no disponible, se omite {stage}: {str(e)}")
+                continue
+        result = measure(fn, inputs, repeat=1 if stage == 'extract_texts lote' else args.repeat)
+        result.update({'case': f"ocr {stage}", 'backend': recognizer.backend.name})
+        if stage == 'extract_texts lote':
+            # Throughput en imágenes por segundo, no en lotes
+            result['throughput_per_s'] *= len(batch)
+            result['batch'] = len(batch)
+        cases.append(result)
+
+    if cases:
+        print_cases(cases)
+    text = recognizer.extract_text(images[0]) if len(cases) > 1 else None
+    recognizer.close()
+    return {'cases': cases, 'backend': recognizer.backend.name, 'text': text}
+
+
+def _synthetic_accesses(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1).timestamp()
+    offsets = np.sort(rng.uniform(0, 365 * 24 * 3600, count))
+    people = rng.integers(0, 60, count)
+    for offset, person in zip(offsets, people):
+        # Uno de cada diez accesos sin identificar
+        person_id = None if person < 6 else f"persona_{person}"
+        yield (person_id or "Desconocido", person_id, datetime.fromtimestamp(start + offset), None)
+
+
+def bench_db(args) -> Dict:
+    """Latencia de register_access y get_access_logs con tablas grandes"""
+    cases = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            db_path = os.path.join(tmp, f"access_{size}.db")
+            db_manager = DatabaseManager(db_path, async_writes=False)
+            start = time.perf_counter()
+            db_manager.register_accesses(_synthetic_accesses(size, seed=args.seed))
+            prefill_s = time.perf_counter() - start
+            operations = list(range(args.ops))
+
+            result = measure(lambda i: db_manager.register_access("persona_1", "persona_1"), operations)
+            result.update({'case': f"db register_access sincronico n={size}", 'rows': size, 'prefill_s': prefill_s})
+            cases.append(result)
+
+            result = measure(lambda i: db_manager.get_access_logs(limit=args.limit), operations)
+            result.update({'case': f"db get_access_logs limit={args.limit} n={size}", 'rows': size})
+            cases.append(result)
+            db_manager.close()
+
+            db_manager = DatabaseManager(db_path, async_writes=True)
+            result = measure(lambda i: db_manager.register_access("persona_1", "persona_1"), operations)
+            start = time.perf_counter()
+            db_manager.flush()
+            result.update({'case': f"db register_access encolado n={size}", 'rows': size,
+                           'flush_s': time.perf_counter() - start})
+            cases.append(result)
+            db_manager.close()
+
+    print_cases(cases)
+    return {'cases': cases}
+
+
+def bench_api(args) -> Dict:
+    """
+    Latencia y throughput de /api/accesos bajo carga concurrente (contra un servidor en marcha)
+
+    Informa además el escalado del throughput respecto del primer nivel de
+    concurrencia (si el servidor serializa las consultas se queda cerca de 1x)
+    y la latencia de una consulta chica que se lanza periódicamente durante la
+    carga: si las consultas bloquean el event loop, la sonda espera detrás de ellas.
+    """
+    url = f"{args.url.rstrip('/')}/api/accesos?limit={args.limit}"
+    if args.filtros:
+        url = f"{url}&{urlencode(parse_qsl(args.filtros))}"
+    errors = []
+
+    def fetch_pages(_):
+        # Primera página y, si se pide, las siguientes siguiendo el cursor
+        latencies = []
+        next_url = url
+        for _ in range(args.paginas):
+            start = time.perf_counter()
+            try:
+                with urlopen(next_url, timeout=30) as response:
+                    response.read()
+                    cursor = response.headers.get('X-Next-Cursor')
+            except Exception as e:
+                errors.append(str(e))
+                break
+            latencies.append(time.perf_counter() - start)
+            if not cursor:
+                break
+            next_url = f"{url}&cursor={cursor}"
+        return latencies
+
+    def probe(stop, latencies):
+        # Consulta chica periódica: mide cuánto espera un cliente liviano mientras dura la carga
+        probe_url = f"{args.url.rstrip('/')}/api/accesos?limit=1"
+        while not stop.wait(0.05):
+            start = time.perf_counter()
+            try:
+                with urlopen(probe_url, timeout=30) as response:
+                    response.read()
+            except Exception:
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    cases = []
+    for concurrency in args.concurrency:
+        errors.clear()
+        stop_probe = threading.Event()
+        probe_latencies = []
+        probe_thread = threading.Thread(target=probe, args=(stop_probe, probe_latencies), daemon=True)
+        probe_thread.start()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            latencies = [lat for batch in executor.map(fetch_pages, range(args.requests)) for lat in batch]
+            elapsed = time.perf_counter() - start
+        stop_probe.set()
+        probe_thread.join()
+        cases.append({
+            'case': f"api /api/accesos concurrencia={concurrency}",
+            'concurrency': concurrency,
+            'latency': summarize_latencies(latencies),
+            'probe_latency': summarize_latencies(probe_latencies),
+            'throughput_per_s': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'peak_alloc_mb': 0.0,
+            'errors': len(errors),
+        })
+        if errors:
+            print(f"Concurrencia {concurrency}: {len(errors)} errores (p. ej. {errors[0]})")
+
+    base_throughput = cases[0]['throughput_per_s'] if cases else 0.0
+    for case in cases:
+        case['scaling'] = case['throughput_per_s'] / base_throughput if base_throughput else 0.0
+
+    print_cases(cases)
+    print(f"{'concurrencia':>12} {'req/s':>10} {'escalado':>9} {'sonda p50':>10} {'sonda p99':>10}")
+    for case in cases:
+        print(f"{case['concurrency']:>12} {case['throughput_per_s']:>10.1f} {case['scaling']:>8.2f}x "
+              f"{case['probe_latency']['p50_ms']:>10.1f} {case['probe_latency']['p99_ms']:>10.1f}")
+    return {'cases': cases}
+
+
+def bench_gallery_format(args) -> Dict:
+    """Tamaño, carga y precisión del formato compacto de galería frente a float64"""
+    rng = np.random.default_rng(args.seed)
+    size = args.size
+    centers = rng.normal(0, 0.3, size=(max(1, size // 50), 128))
+    encodings = centers[rng.integers(0, centers.shape[0], size)] + rng.normal(0, 0.05, size=(size, 128))
+    names = [f"persona_{i}" for i in range(size)]
+    # Consultas cercanas a la galería (coinciden) y lejanas (desconocidos)
+    near = encodings[rng.integers(0, size, args.queries // 2)] + \
+        rng.normal(0, args.noise, size=(args.queries // 2, 128))
+    far = rng.normal(0, 0.3, size=(args.queries - near.shape[0], 128))
+    queries = np.concatenate([near, far])
+
+    # Referencia en float64: distancias exactas
+    squared = (queries ** 2).sum(1)[:, None] + (encodings ** 2).sum(1)[None, :] - 2 * queries @ encodings.T
+    distances = np.sqrt(np.maximum(squared, 0))
+    best = distances.argmin(axis=1)
+    best_distance = distances[np.arange(len(queries)), best]
+    baseline = [names[i] if d <= args.tolerance else None for i, d in zip(best, best_distance)]
+
+    gallery = FaceGallery()
+    gallery.add_many(encodings, names)
+    cases = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in args.dtypes:
+            path = os.path.join(tmp, f"galeria_{dtype}.fgal")
+            gallery.save(path, dtype=dtype)
+            start = time.perf_counter()
+            loaded = FaceGallery.load(path)
+            load_s = time.perf_counter() - start
+
+            matches = loaded.match(queries, tolerance=args.tolerance)
+            agreement = float(np.mean([name == ref for (name, _), ref in zip(matches, baseline)]))
+            distance_error = np.abs(np.array([d for _, d in matches]) - best_distance)
+            result = measure(lambda q: loaded.match(q, tolerance=args.tolerance),
+                             [queries[i:i + 8] for i in range(0, len(queries), 8)])
+            result.update({
+                'case': f"formato {dtype} n={size}",
+                'dtype': dtype,
+                'file_bytes': os.path.getsize(path),
+                'bytes_per_identity': os.path.getsize(path) / size,
+                'load_s': load_s,
+                'memory_mapped': loaded._backing_file is not None,
+                'identity_agreement': agreement,
+                'max_distance_error': float(distance_error.max()),
+                'mean_distance_error': float(distance_error.mean()),
+            })
+            cases.append(result)
+            del loaded
+
+    print(f"{'tipo':<8} {'bytes/id':>9} {'carga ms':>9} {'mmap':>5} {'acuerdo':>8} {'err. máx':>9} {'p50 ms':>8}")
+    for r in cases:
+        print(f"{r['dtype']:<8} {r['bytes_per_identity']:>9.1f} {r['load_s'] * 1000:>9.2f} "
+              f"{'sí' if r['memory_mapped'] else 'no':>5} {r['identity_agreement']:>8.2%} "
+              f"{r['max_distance_error']:>9.5f} {r['latency']['p50_ms']:>8.2f}")
+    return {'cases': cases, 'baseline': 'float64', 'tolerance': args.tolerance}
+
+
+def bench_all(args) -> Dict:
+    """Ejecuta las suites que no necesitan servidor con sus parámetros por defecto"""
+    results = {}
+    for command in ('deteccion', 'galeria', 'plantillas', 'formato', 'ocr', 'db'):
+        print(f"== {command} ==")
+        sub_args = parse_args([command] + (['--galeria', args.galeria] if command == 'deteccion' else []))
+        results[command] = sub_args.func(sub_args)
+    return results
+
+
+def collect_cases(results) -> Dict[str, Dict]:
+    """Casos medidos de un resultado (anidado o no), indexados por nombre"""
+    cases = {}
+    if isinstance(results, dict):
+        if 'case' in results:
+            cases[results['case']] = results
+        else:
+            for value in results.values():
+                cases.update(collect_cases(value))
+    elif isinstance(results, list):
+        for value in results:
+            cases.update(collect_cases(value))
+    return cases
+
+
+def bench_compare(args) -> Dict:
+    """Compara dos corridas guardadas con --json y marca las regresiones de p95 y throughput"""
+    with open(args.base, encoding='utf-8') as f:
+        base = collect_cases(json.load(f))
+    with open(args.nuevo, encoding='utf-8') as f:
+        new = collect_cases(json.load(f))
+
+    rows = []
+    regressions = []
+    print(f"{'caso':<40} {'p95 base':>9} {'p95 nuevo':>9} {'cambio':>8} {'ops/s cambio':>13}")
+    for case in sorted(set(base) & set(new)):
+        old_p95 = base[case]['latency']['p95_ms']
+        new_p95 = new[case]['latency']['p95_ms']
+        p95_change = (new_p95 - old_p95) / old_p95 if old_p95 > 0 else 0.0
+        old_tp = base[case]['throughput_per_s']
+        tp_change = (new[case]['throughput_per_s'] - old_tp) / old_tp if old_tp > 0 else 0.0
+        regressed = p95_change > args.umbral or tp_change < -args.umbral
+        rows.append({'case': case, 'p95_change': p95_change, 'throughput_change': tp_change,
+                     'regression': regressed})
+        if regressed:
+            regressions.append(case)
+        print(f"{case:<40} {old_p95:>9.2f} {new_p95:>9.2f} {p95_change:>+8.1%} {tp_change:>+13.1%}"
+              f"{'  REGRESION' if regressed else ''}")
+
+    missing = sorted(set(base) - set(new))
+    if missing:
+        print(f"Casos ausentes en la corrida nueva: {', '.join(missing)}")
+    return {'comparison': rows, 'regressions': regressions, 'missing': missing}
+
+
+def environment_info() -> Dict:
+    """Datos del entorno para poder comparar corridas"""
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'sqlite': sqlite3.sqlite_version,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema de reconocimiento")
+    parser.add_argument('--json', help="Guardar los resultados en este archivo JSON")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scales = subparsers.add_parser('escalas', help="Precisión y latencia de la detección según la escala")
+    scales.add_argument('input', help="Directorio de imágenes o archivo de video")
+    scales.add_argument('--scales', type=float, nargs='+', default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    scales.add_argument('--roi', type=int, nargs=4, metavar=('X', 'Y', 'ANCHO', 'ALTO'))
+    scales.add_argument('--galeria', default=os.path.join('data', 'authorized_faces'),
+                        help="Directorio de rostros autorizados para comparar identidades")
+    scales.add_argument('--max-frames', type=int, default=100)
+    scales.add_argument('--repeat', type=int, default=1)
+    scales.set_defaults(func=bench_scales)
+
+    detection = subparsers.add_parser('deteccion', help="Ubicación HOG y encoding por resolución y rostros")
+    detection.add_argument('--resolutions', type=parse_resolution, nargs='+',
+                           default=[(640, 480), (1280, 720), (1920, 1080)], metavar='ANCHOxALTO')
+    detection.add_argument('--faces', type=int, nargs='+', default=[0, 1, 4])
+    detection.add_argument('--galeria', default=os.path.join('data', 'authorized_faces'),
+                           help="Imágenes de las que se toman los rostros para los frames sintéticos")
+    detection.add_argument('--frames', type=int, default=3, help="Frames distintos por caso")
+    detection.add_argument('--repeat', type=int, default=3)
+    detection.set_defaults(func=bench_detection)
+
+    detectors = subparsers.add_parser('detectores', help="Velocidad y recall de cada backend de detección")
+    detectors.add_argument('input', nargs='?',
+                           help="Directorio de imágenes o video (por defecto, frames sintéticos con --galeria)")
+    detectors.add_argument('--backends', nargs='+', choices=list(LOCATOR_TYPES), default=list(LOCATOR_TYPES))
+    detectors.add_argument('--referencia', choices=list(LOCATOR_TYPES), default='hog',
+                           help="Detector cuyas detecciones se toman como verdad")
+    detectors.add_argument('--models-dir', default=os.path.join('data', 'models'))
+    detectors.add_argument('--galeria', default=os.path.join('data', 'authorized_faces'))
+    detectors.add_argument('--min-iou', type=float, default=0.3,
+                           help="Solapamiento mínimo con la referencia (las cajas de cada detector difieren)")
+    detectors.add_argument('--max-frames', type=int, default=40)
+    detectors.add_argument('--repeat', type=int, default=2)
+    detectors.set_defaults(func=bench_detectors)
+
+    gallery = subparsers.add_parser('galeria', help="Búsqueda en la galería según su tamaño")
+    gallery.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    gallery.add_argument('--indices', nargs='+', default=['brute', 'ivf'])
+    gallery.add_argument('--queries', type=int, nargs='+', default=[1, 8], help="Rostros por frame")
+    gallery.add_argument('--repeat', type=int, default=200)
+    gallery.add_argument('--seed', type=int, default=0)
+    gallery.set_defaults(func=bench_gallery)
+
+    templates = subparsers.add_parser('plantillas', help="Varias muestras por identidad: plantillas frente a filas sueltas")
+    templates.add_argument('--people', type=int, default=10000)
+    templates.add_argument('--samples', type=int, default=8, help="Imágenes cargadas por persona")
+    templates.add_argument('--conditions', type=int, default=4, help="Condiciones de captura distintas por persona")
+    templates.add_argument('--exemplars', type=int, default=5, help="Ejemplares por plantilla")
+    templates.add_argument('--lookalike', type=float, default=0.05,
+                           help="Desvío de los desconocidos respecto de la persona a la que se parecen")
+    templates.add_argument('--queries', type=int, default=2000)
+    templates.add_argument('--tolerance', type=float, default=0.6)
+    templates.add_argument('--seed', type=int, default=0)
+    templates.set_defaults(func=bench_templates)
+
+    gallery_format = subparsers.add_parser('formato', help="Formato compacto de galería: tamaño y precisión")
+    gallery_format.add_argument('--size', type=int, default=100000)
+    gallery_format.add_argument('--dtypes', nargs='+', choices=list(DTYPES), default=list(DTYPES))
+    gallery_format.add_argument('--queries', type=int, default=2000)
+    gallery_format.add_argument('--noise', type=float, default=0.03,
+                                help="Desvío de las consultas respecto de su identidad")
+    gallery_format.add_argument('--tolerance', type=float, default=0.6)
+    gallery_format.add_argument('--seed', type=int, default=0)
+    gallery_format.set_defaults(func=bench_gallery_format)
+
+    ocr = subparsers.add_parser('ocr', help="TextRecognizer.extract_text")
+    ocr.add_argument('input', nargs='?', help="Directorio de imágenes (por defecto, una credencial sintética)")
+    ocr.add_argument('--max-frames', type=int, default=50)
+    ocr.add_argument('--repeat', type=int, default=20)
+    ocr.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                     help="Hilos para la extracción por lotes")
+    ocr.set_defaults(func=bench_ocr)
+
+    db = subparsers.add_parser('db', help="register_access y get_access_logs con tablas grandes")
+    db.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    db.add_argument('--ops', type=int, default=500)
+    db.add_argument('--limit', type=int, default=100)
+    db.add_argument('--seed', type=int, default=0)
+    db.set_defaults(func=bench_db)
+
+    api = subparsers.add_parser('api', help="/api/accesos bajo carga concurrente")
+    api.add_argument('--url', default='http://127.0.0.1:8000')
+    api.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    api.add_argument('--requests', type=int, default=200, help="Sesiones por nivel de concurrencia")
+    api.add_argument('--paginas', type=int, default=1, help="Páginas recorridas por sesión")
+    api.add_argument('--limit', type=int, default=100)
+    api.add_argument('--filtros', default='',
+                     help="Parámetros extra de la consulta, p. ej. 'estado=No autorizado&desde=2024-01-01'")
+    api.set_defaults(func=bench_api)
+
+    everything = subparsers.add_parser('todo', help="deteccion, galeria, plantillas, formato, ocr y db con sus valores por defecto")
+    everything.add_argument('--galeria', default=os.path.join('data', 'authorized_faces'))
+    everything.set_defaults(func=bench_all)
+
+    compare = subparsers.add_parser('comparar', help="Compara dos resultados guardados con --json")
+    compare.add_argument('base')
+    compare.add_argument('nuevo')
+    compare.add_argument('--umbral', type=float, default=0.1,
+                         help="Cambio relativo tolerado antes de marcar una regresión")
+    compare.set_defaults(func=bench_compare)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = args.func(args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': args.command, 'environment': environment_info(), 'results': results},
+                      f, indent=2)
+    # Código de salida distinto de cero si la comparación encontró regresiones
+    if isinstance(results, dict) and results.get('regressions'):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,76 @@
+import atexit
+import queue
 import sqlite3
 import os
+import threading
+import time
 from datetime import datetime
+from functools import partial
+from metrics import DB_ROWS, REGISTRY
+
+# Formato de ancho fijo: el orden alfabético coincide con el cronológico
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Tablas de conteos pre-agregados y largo del prefijo del timestamp que
+# define cada intervalo ('YYYY-MM-DD HH' por hora, 'YYYY-MM-DD' por día)
+ROLLUP_TABLES = (('access_rollup_hourly', 13), ('access_rollup_daily', 10))
+# En los conteos, person_id '' son los accesos no autorizados y '*' el total
+# de cada intervalo (todas las personas)
+ROLLUP_UNAUTHORIZED = ''
+ROLLUP_ALL = '*'
+
+# Versión de los datos (PRAGMA user_version); cada migración de init_database
+# corre una sola vez, en las bases con una versión anterior
+SCHEMA_VERSION = 1
 
 class DatabaseManager:
-    def __init__(self, db_path='data/access.db'):
+    def __init__(self, db_path='data/access.db', async_writes=True, batch_size=100, flush_interval=0.5):
         """
         Inicializa el gestor de base de datos
         
         Args:
             db_path (str): Ruta al archivo de la base de datos
+            async_writes (bool): Si es True los accesos se encolan y se escriben en lote
+                desde un hilo propio, sin bloquear a quien los registra
+            batch_size (int): Cantidad máxima de accesos por transacción
+            flush_interval (float): Segundos máximos que un acceso espera en la cola
         """
         # Asegurar que el directorio existe
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         self.db_path = db_path
+        self.async_writes = async_writes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        
+        # Conexión única y de larga duración, compartida entre hilos con un lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn_lock = threading.Lock()
         self.init_database()
+        
+        self._queue = queue.Queue()
+        self._closed = False
+        self._writer = None
+        if async_writes:
+            self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+            self._writer.start()
+        # Garantizar que los accesos encolados se escriban al salir
+        atexit.register(self.close)
     
     def init_database(self):
         """Inicializa la base de datos y crea la tabla si no existe"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._conn_lock:
+            cursor = self._conn.cursor()
+            
+            # Las bases nuevas devuelven de a poco el espacio que libera el archivado
+            # (ver retention.py); va antes de WAL, que ya inicializa el archivo, y en
+            # una base existente solo tiene efecto tras un VACUUM
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            
+            # WAL permite que la interfaz web lea mientras se escribe, y con
+            # synchronous=NORMAL solo se hace fsync en los checkpoints
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
             
             # Crear tabla de registros de acceso
             cursor.execute('''
@@ -32,7 +83,114 @@ class DatabaseManager:
                 )
             ''')
             
-            conn.commit()
+            # Migraciones de datos pendientes según la versión guardada en la base
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            if version < 1:
+                # Normalizar timestamps antiguos sin microsegundos al formato de ancho fijo
+                # (recorre toda la tabla, por eso corre una sola vez)
+                cursor.execute('''
+                    UPDATE access_logs SET timestamp = timestamp || '.000000'
+                    WHERE length(timestamp) = 19
+                ''')
+            if version < SCHEMA_VERSION:
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            
+            # Índices para la paginación por cursor (timestamp, id) y los filtros
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp
+                ON access_logs (timestamp, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_access_logs_person
+                ON access_logs (person_id, timestamp, id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_access_logs_unauthorized
+                ON access_logs (timestamp, id) WHERE person_id IS NULL
+            ''')
+            
+            # Conteos por intervalo y persona, y el último id ya contabilizado
+            for table, _ in ROLLUP_TABLES:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        bucket TEXT NOT NULL,
+                        person_id TEXT NOT NULL,
+                        allowed INTEGER NOT NULL DEFAULT 0,
+                        unauthorized INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (bucket, person_id)
+                    ) WITHOUT ROWID
+                ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS access_rollup_state (
+                    name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
+                )
+            ''')
+            # Contabilizar los registros previos (la primera vez, toda la tabla)
+            self._update_rollups(cursor)
+            
+            # Visitantes desconocidos: cada uno agrupa todas las veces que se vio
+            # a la misma persona no autorizada, con una única imagen representativa
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS unknown_visitors (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    first_seen DATETIME NOT NULL,
+                    last_seen DATETIME NOT NULL,
+                    sightings INTEGER NOT NULL DEFAULT 1,  -- Veces que se vio su rostro
+                    face_image_path TEXT,                  -- Imagen representativa
+                    encoding BLOB NOT NULL                 -- Centroide de sus encodings (float32)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_unknown_visitors_last_seen
+                ON unknown_visitors (last_seen)
+            ''')
+            
+            self._conn.commit()
+    
+    def _update_rollups(self, cursor):
+        """
+        Suma a los conteos pre-agregados los accesos con id posterior al último
+        contabilizado
+        
+        Se llama dentro de la misma transacción que inserta los accesos, así los
+        conteos nunca quedan a medias; como avanza por id, también incorpora
+        filas escritas por otros procesos.
+        
+        Returns:
+            int: Último id contabilizado
+        """
+        row = cursor.execute(
+            "SELECT last_id FROM access_rollup_state WHERE name = 'access_logs'"
+        ).fetchone()
+        last_id = row[0] if row else 0
+        max_id = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM access_logs').fetchone()[0]
+        if max_id <= last_id:
+            return last_id
+        
+        for table, length in ROLLUP_TABLES:
+            cursor.execute(f'''
+                INSERT INTO {table} (bucket, person_id, allowed, unauthorized)
+                SELECT * FROM (
+                    SELECT substr(timestamp, 1, {length}), COALESCE(person_id, ?),
+                           SUM(person_id IS NOT NULL), SUM(person_id IS NULL)
+                    FROM access_logs WHERE id > ? AND id <= ?
+                    GROUP BY 1, 2
+                    UNION ALL
+                    SELECT substr(timestamp, 1, {length}), ?,
+                           SUM(person_id IS NOT NULL), SUM(person_id IS NULL)
+                    FROM access_logs WHERE id > ? AND id <= ?
+                    GROUP BY 1
+                ) WHERE true
+                ON CONFLICT (bucket, person_id) DO UPDATE SET
+                    allowed = allowed + excluded.allowed,
+                    unauthorized = unauthorized + excluded.unauthorized
+            ''', (ROLLUP_UNAUTHORIZED, last_id, max_id, ROLLUP_ALL, last_id, max_id))
+        cursor.execute('''
+            INSERT INTO access_rollup_state (name, last_id) VALUES ('access_logs', ?)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id
+        ''', (max_id,))
+        return max_id
     
     def register_access(self, name, person_id=None, face_image_path=None):
         """
@@ -44,18 +202,251 @@ class DatabaseManager:
             face_image_path (str, optional): Ruta a la imagen del rostro guardada
         
         Returns:
-            int: ID del registro creado
+            int: ID del registro creado, o None si la escritura quedó encolada
+        """
+        row = (name, person_id, datetime.now().strftime(TIMESTAMP_FORMAT), face_image_path)
+        
+        if self._closed:
+            # La conexión ya está cerrada (o cerrándose): no hay dónde escribirlo
+            print(f"Acceso de {name} descartado: la base de datos ya fue cerrada")
+            return None
+        
+        if self.async_writes:
+            self._queue.put(row)
+            return None
+        
+        return self._insert_batch([row])
+    
+    def register_accesses(self, accesses, chunk_size=5000):
+        """
+        Registra muchos accesos ya fechados (p. ej. de un procesamiento offline)
+        en transacciones grandes, sin pasar por la cola del hilo escritor
+        
+        Args:
+            accesses: Iterable de tuplas (name, person_id, timestamp, face_image_path)
+                donde timestamp es un datetime
+            chunk_size (int): Cantidad de accesos por transacción
+        
+        Returns:
+            int: Cantidad de accesos registrados
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        total = 0
+        chunk = []
+        for name, person_id, timestamp, face_image_path in accesses:
+            chunk.append((name, person_id, timestamp.strftime(TIMESTAMP_FORMAT), face_image_path))
+            if len(chunk) >= chunk_size:
+                self._insert_batch(chunk)
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            self._insert_batch(chunk)
+            total += len(chunk)
+        return total
+    
+    def _insert_batch(self, rows):
+        """Inserta varios accesos en una única transacción"""
+        with self._conn_lock, REGISTRY.span('db_insert'):
+            cursor = self._conn.cursor()
+            try:
+                insert = '''
+                    INSERT INTO access_logs (name, person_id, timestamp, face_image_path)
+                    VALUES (?, ?, ?, ?)
+                '''
+                # executemany no informa lastrowid: una sola fila va con execute
+                if len(rows) == 1:
+                    cursor.execute(insert, rows[0])
+                else:
+                    cursor.executemany(insert, rows)
+                last_row_id = cursor.lastrowid
+                self._update_rollups(cursor)
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+            DB_ROWS.inc(len(rows))
+            return last_row_id
+    
+    def _write_loop(self):
+        """Hilo escritor: agrupa los accesos encolados y los escribe por tamaño o por tiempo"""
+        batch = []
+        waiters = []
+        deadline = None
+        stop = False
+        
+        while not stop:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
             
-            cursor.execute('''
-                INSERT INTO access_logs (name, person_id, timestamp, face_image_path)
-                VALUES (?, ?, ?, ?)
-            ''', (name, person_id, datetime.now(), face_image_path))
+            if item is None:
+                pass
+            elif isinstance(item, threading.Event):
+                # Pedido de flush: escribir lo pendiente y avisar
+                waiters.append(item)
+            elif item == 'stop':
+                stop = True
+            elif callable(item):
+                # Otras escrituras encoladas (visitantes desconocidos): se ejecutan en orden
+                try:
+                    item()
+                except sqlite3.Error as e:
+                    print(f"Error al guardar los visitantes desconocidos: {str(e)}")
+            else:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
             
-            conn.commit()
-            return cursor.lastrowid
+            expired = deadline is not None and time.monotonic() >= deadline
+            if batch and (len(batch) >= self.batch_size or expired or waiters or stop):
+                try:
+                    self._insert_batch(batch)
+                except sqlite3.Error as e:
+                    print(f"Error al guardar {len(batch)} registros de acceso: {str(e)}")
+                batch = []
+                deadline = None
+            
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+    
+    def flush(self, timeout=None):
+        """
+        Espera a que se escriban todos los accesos encolados hasta el momento
+        
+        Args:
+            timeout (float, optional): Segundos máximos de espera
+        
+        Returns:
+            bool: True si la cola quedó escrita
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self):
+        """Escribe los accesos pendientes, detiene el hilo escritor y cierra la conexión"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put('stop')
+            self._writer.join()
+        # Accesos y escrituras que hayan llegado mientras se cerraba
+        pending = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if isinstance(item, tuple):
+                pending.append(item)
+            elif callable(item):
+                try:
+                    item()
+                except sqlite3.Error as e:
+                    print(f"Error al guardar los visitantes desconocidos: {str(e)}")
+        if pending:
+            try:
+                self._insert_batch(pending)
+            except sqlite3.Error as e:
+                print(f"Error al guardar {len(pending)} registros de acceso: {str(e)}")
+        with self._conn_lock:
+            self._conn.close()
+    
+    def _submit(self, operation, *args):
+        """Ejecuta una escritura en el hilo escritor, o en el momento si no hay escritura asíncrona"""
+        if self._closed:
+            print("Escritura de visitantes descartada: la base de datos ya fue cerrada")
+            return None
+        if self.async_writes:
+            self._queue.put(partial(operation, *args))
+            return None
+        return operation(*args)
+    
+    def create_visitor(self, encoding, seen_at, face_image_path=None, on_created=None):
+        """
+        Crea un visitante desconocido (se encola como los accesos)
+        
+        El ID lo asigna SQLite al insertar, así varios procesos pueden registrar
+        visitantes en la misma base; on_created lo recibe apenas se inserta (en
+        el hilo escritor si la escritura es asíncrona).
+        
+        Args:
+            encoding (bytes): Centroide inicial de sus encodings
+            seen_at (datetime): Momento en que se lo vio por primera vez
+            face_image_path (str, optional): Ruta a su imagen representativa
+            on_created (callable, optional): Se llama con el ID una vez insertado
+        
+        Returns:
+            int: ID del visitante, o None si la escritura quedó encolada
+        """
+        timestamp = seen_at.strftime(TIMESTAMP_FORMAT)
+        return self._submit(self._insert_visitor, (timestamp, timestamp, face_image_path, encoding), on_created)
+    
+    def _insert_visitor(self, row, on_created):
+        with self._conn_lock:
+            try:
+                cursor = self._conn.execute('''
+                    INSERT INTO unknown_visitors (first_seen, last_seen, face_image_path, encoding)
+                    VALUES (?, ?, ?, ?)
+                ''', row)
+                visitor_id = cursor.lastrowid
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+        if on_created is not None:
+            on_created(visitor_id)
+        return visitor_id
+    
+    def update_visitors(self, visitors):
+        """
+        Actualiza en una única transacción los visitantes que se volvieron a ver
+        (se encola como los accesos)
+        
+        Args:
+            visitors: Iterable de tuplas (visitor_id, last_seen, sightings, encoding)
+                donde last_seen es un datetime
+        """
+        rows = [(last_seen.strftime(TIMESTAMP_FORMAT), sightings, encoding, visitor_id)
+                for visitor_id, last_seen, sightings, encoding in visitors]
+        if not rows:
+            return
+        self._submit(self._update_visitor_rows, rows)
+    
+    def _update_visitor_rows(self, rows):
+        with self._conn_lock:
+            try:
+                self._conn.executemany('''
+                    UPDATE unknown_visitors SET last_seen = ?, sightings = ?, encoding = ?
+                    WHERE id = ?
+                ''', rows)
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+    
+    def get_visitors(self, since=None):
+        """
+        Obtiene los visitantes desconocidos vistos desde una fecha
+        
+        Args:
+            since (datetime, optional): Solo los vistos a partir de este momento
+        
+        Returns:
+            list: Tuplas (id, first_seen, last_seen, sightings, face_image_path, encoding)
+        """
+        since = since.strftime(TIMESTAMP_FORMAT) if since is not None else ''
+        with self._conn_lock:
+            cursor = self._conn.cursor()
+            cursor.execute('''
+                SELECT id, first_seen, last_seen, sightings, face_image_path, encoding
+                FROM unknown_visitors
+                WHERE last_seen >= ?
+                ORDER BY id
+            ''', (since,))
+            return cursor.fetchall()
     
     def get_access_logs(self, limit=100):
         """
@@ -63,18 +454,18 @@ class DatabaseManager:
         
         Args:
             limit (int): Número máximo de registros a retornar
-            
+        
         Returns:
             list: Lista de registros de acceso
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._conn_lock:
+            cursor = self._conn.cursor()
             
             cursor.execute('''
                 SELECT id, name, person_id, timestamp, face_image_path
                 FROM access_logs
-                ORDER BY timestamp DESC
+                ORDER BY timestamp DESC, id DESC
                 LIMIT ?
             ''', (limit,))
             
-            return cursor.fetchall() 
\ No newline at end of file
+            return cursor.fetchall()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import numpy as np
+from typing import Dict, Iterable, Optional
+
+# 2: con varios rostros en la imagen se guarda el encoding del más grande (antes, el primero)
+CACHE_VERSION = 2
+
+
+def file_sha1(path: str, chunk_size: int = 1 << 20) -> str:
+    """Calcula el hash SHA-1 del contenido de un archivo"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class EncodingCache:
+    """
+    Caché en disco de encodings faciales y nombres extraídos por OCR
+
+    Se guarda como una matriz .npy (N x 128, float32) que se abre con
+    memory-map, más un índice JSON que asocia cada imagen con su fila.
+    Cada entrada se valida por tamaño y fecha de modificación; si estos
+    cambian se compara el hash del contenido antes de volver a procesarla.
+    """
+
+    def __init__(self, cache_dir: str = 'data/cache'):
+        """
+        Args:
+            cache_dir (str): Directorio donde se guardan la matriz y el índice
+        """
+        self.cache_dir = cache_dir
+        self.matrix_path = os.path.join(cache_dir, 'encodings.npy')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self._entries: Dict[str, dict] = {}
+        self._matrix = np.empty((0, 128), dtype=np.float32)
+        self._pending: Dict[str, np.ndarray] = {}
+        self._dirty = False
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self):
+        """Lee el índice y abre la matriz de encodings (memory-map)"""
+        self._entries = {}
+        self._pending = {}
+        self._dirty = False
+        if not (os.path.exists(self.index_path) and os.path.exists(self.matrix_path)):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != CACHE_VERSION:
+                return
+            self._matrix = np.load(self.matrix_path, mmap_mode='r')
+            self._entries = index.get('entries', {})
+        except (OSError, ValueError) as e:
+            print(f"Caché de encodings inválida, se reconstruirá: {str(e)}")
+            self._entries = {}
+
+    def lookup(self, image_path: str) -> Optional[dict]:
+        """
+        Busca una imagen en la caché
+
+        Args:
+            image_path (str): Ruta a la imagen
+
+        Returns:
+            dict: Entrada con 'name' y 'encoding' (None si la imagen no tenía rostro),
+                o None si la imagen es nueva o cambió
+        """
+        entry = self._entries.get(image_path)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+
+        if stat.st_size != entry['size']:
+            return None
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # Cambió la fecha pero quizás no el contenido (copia, touch...)
+            if file_sha1(image_path) != entry['sha1']:
+                return None
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._dirty = True
+
+        return {'name': entry['name'], 'encoding': self._encoding_for(image_path, entry)}
+
+    def _encoding_for(self, image_path: str, entry: dict) -> Optional[np.ndarray]:
+        """Devuelve el encoding de una entrada, pendiente o desde la matriz"""
+        if image_path in self._pending:
+            return self._pending[image_path]
+        row = entry['row']
+        if row < 0:
+            return None
+        return self._matrix[row]
+
+    def store(self, image_path: str, person_name: str, face_encoding: Optional[np.ndarray],
+              sha1: Optional[str] = None):
+        """
+        Guarda (o reemplaza) el resultado de procesar una imagen
+
+        Args:
+            image_path (str): Ruta a la imagen
+            person_name (str): Nombre asignado a la persona
+            face_encoding (np.ndarray, optional): Encoding, o None si no se encontró rostro
+            sha1 (str, optional): Hash del contenido si ya fue calculado
+        """
+        stat = os.stat(image_path)
+        self._entries[image_path] = {
+            'name': person_name,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha1': sha1 or file_sha1(image_path),
+            'row': -1,
+        }
+        if face_encoding is not None:
+            self._pending[image_path] = np.asarray(face_encoding, dtype=np.float32)
+        else:
+            self._pending.pop(image_path, None)
+        self._dirty = True
+
+    def retain(self, image_paths: Iterable[str]):
+        """Elimina de la caché las imágenes que ya no existen en el directorio"""
+        keep = set(image_paths)
+        for image_path in list(self._entries):
+            if image_path not in keep:
+                del self._entries[image_path]
+                self._pending.pop(image_path, None)
+                self._dirty = True
+
+    def save(self):
+        """Escribe la matriz y el índice en disco si hubo cambios (de forma atómica)"""
+        if not self._dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Compactar: solo quedan las filas de entradas vigentes con rostro
+        paths = [p for p, e in self._entries.items() if self._encoding_for(p, e) is not None]
+        matrix = np.empty((len(paths), 128), dtype=np.float32)
+        for row, image_path in enumerate(paths):
+            matrix[row] = self._encoding_for(image_path, self._entries[image_path])
+        for image_path, entry in self._entries.items():
+            entry['row'] = -1
+        for row, image_path in enumerate(paths):
+            self._entries[image_path]['row'] = row
+
+        tmp_matrix = self.matrix_path + '.tmp.npy'
+        tmp_index = self.index_path + '.tmp'
+        np.save(tmp_matrix, matrix)
+        with open(tmp_index, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': self._entries}, f)
+        # Soltar el memory-map anterior antes de reemplazar el archivo
+        self._matrix = matrix
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+
+        self._pending = {}
+        self._dirty = False
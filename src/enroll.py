@@ -0,0 +1,59 @@
+import argparse
+import os
+import sys
+from face_detector import FaceDetector
+from encoding_cache import EncodingCache
+from enrollment import enroll_directory
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Importa en bloque un directorio de rostros autorizados a la caché de encodings"
+    )
+    parser.add_argument('faces_dir', nargs='?', default=os.path.join('data', 'authorized_faces'),
+                        help="Directorio con las imágenes autorizadas")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Cantidad de procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument('--cache-dir', default=os.path.join('data', 'cache'),
+                        help="Directorio de la caché de encodings")
+    parser.add_argument('--exportar', metavar='ARCHIVO',
+                        help="Guardar además la galería en formato compacto (p. ej. data/galeria.fgal)")
+    parser.add_argument('--dtype', choices=('float32', 'float16', 'int8'), default='float32',
+                        help="Precisión de los encodings en el archivo exportado")
+    parser.add_argument('--quiet', action='store_true',
+                        help="No informar el resultado de cada imagen")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.faces_dir):
+        print(f"No existe el directorio: {args.faces_dir}")
+        return 2
+
+    detector = FaceDetector()
+    cache = EncodingCache(args.cache_dir)
+    report = enroll_directory(detector, args.faces_dir, workers=max(1, args.workers),
+                              cache=cache, verbose=not args.quiet)
+
+    total = report.cached + report.processed
+    rate = report.processed / report.elapsed if report.elapsed > 0 else 0.0
+    print(f"Imágenes: {total} ({report.cached} desde caché, {report.processed} procesadas)")
+    print(f"Rostros cargados: {report.loaded}")
+    print(f"Tiempo: {report.elapsed:.2f}s ({rate:.1f} imágenes/s)")
+
+    if args.exportar:
+        detector.gallery.save(args.exportar, dtype=args.dtype)
+        print(f"Galería exportada a {args.exportar} ({args.dtype}, "
+              f"{os.path.getsize(args.exportar) / 1024:.1f} KB)")
+
+    if report.failures:
+        print(f"Imágenes con errores: {len(report.failures)}")
+        for failure in report.failures:
+            print(f"  - {failure.image_path}: {failure.error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
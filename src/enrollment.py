@@ -0,0 +1,265 @@
+import hashlib
+import os
+import time
+import cv2
+import face_recognition
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, NamedTuple, Optional
+from face_detector import largest_face_location
+from face_locators import DLIB_LOCK
+from text_recognizer import TextRecognizer
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class EnrollmentResult(NamedTuple):
+    """Resultado de procesar una imagen de una persona autorizada"""
+    image_path: str
+    person_name: str
+    encoding: Optional[np.ndarray]
+    sha1: Optional[str]
+    error: Optional[str]
+
+
+class EnrollmentReport(NamedTuple):
+    """Resumen de una carga de rostros autorizados"""
+    loaded: int
+    cached: int
+    processed: int
+    failures: List[EnrollmentResult]
+    elapsed: float
+
+
+def is_numeric_filename(filename):
+    """Verifica si el nombre del archivo (sin extensión) contiene solo números"""
+    name = os.path.splitext(filename)[0]
+    return name.isdigit()
+
+
+def list_authorized_images(faces_dir):
+    """
+    Lista (en orden estable) las imágenes del directorio de autorizados
+
+    Además de las imágenes sueltas incluye las de cada subdirectorio, que se
+    devuelven como 'subdirectorio/archivo': todas las imágenes de un
+    subdirectorio son muestras de la persona que le da nombre.
+    """
+    images = []
+    for entry in os.listdir(faces_dir):
+        path = os.path.join(faces_dir, entry)
+        if os.path.isdir(path):
+            images.extend(
+                os.path.join(entry, filename) for filename in os.listdir(path)
+                if filename.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            images.append(entry)
+    return sorted(images)
+
+
+def person_directory(relative_path):
+    """Nombre del subdirectorio de una imagen listada por list_authorized_images (None si está suelta)"""
+    return os.path.dirname(relative_path) or None
+
+
+def resolve_person_name(image_path, filename, text_recognizer, image=None, verbose=True):
+    """
+    Determina el nombre de una persona autorizada a partir de su imagen
+
+    Si el nombre del archivo es numérico se intenta leer la credencial por OCR;
+    en caso contrario (o si el OCR falla) se usa el nombre del archivo.
+
+    Args:
+        image_path: Ruta a la imagen
+        filename: Nombre del archivo
+        text_recognizer: Instancia de TextRecognizer
+        image: Imagen ya decodificada en BGR (opcional, se lee del disco si falta)
+        verbose: Si es True se informa por consola cómo se obtuvo el nombre
+
+    Returns:
+        str: Nombre de la persona
+    """
+    log = print if verbose else (lambda *args: None)
+
+    # Si el nombre del archivo es numérico, buscar credencial
+    if is_numeric_filename(filename):
+        log(f"Procesando imagen con nombre numérico: {filename}")
+        if image is None:
+            image = cv2.imread(image_path)
+        if image is not None:
+            # Intentar extraer texto de la credencial
+            extracted_text = text_recognizer.extract_text(image)
+            if extracted_text:
+                person_name = extracted_text
+                log(f"Texto extraído de credencial: {person_name}")
+            else:
+                person_name = os.path.splitext(filename)[0]
+                log(f"No se encontró credencial, usando nombre del archivo: {person_name}")
+        else:
+            person_name = os.path.splitext(filename)[0]
+            log(f"Error al leer la imagen, usando nombre del archivo: {person_name}")
+    else:
+        # Si el nombre tiene letras, usar el nombre del archivo
+        person_name = os.path.splitext(filename)[0]
+        log(f"Usando nombre del archivo: {person_name}")
+    return person_name
+
+
+# Estado por proceso del pool (se inicializa una vez por worker)
+_worker_text_recognizer = None
+_worker_ocr_executor = None
+_worker_verbose = False
+
+
+def _init_worker(verbose=False):
+    """Inicializa los recursos reutilizables de cada proceso del pool"""
+    global _worker_text_recognizer, _worker_ocr_executor, _worker_verbose
+    _worker_text_recognizer = TextRecognizer()
+    # El OCR corre en un hilo (Tesseract es un proceso externo) mientras el
+    # hilo principal calcula el encoding
+    _worker_ocr_executor = ThreadPoolExecutor(max_workers=1)
+    _worker_verbose = verbose
+
+
+def process_authorized_image(image_path, person_name=None):
+    """
+    Procesa una imagen autorizada: la lee y decodifica una sola vez, y
+    resuelve el nombre (OCR) y el encoding facial en paralelo
+
+    Args:
+        image_path: Ruta a la imagen
+        person_name: Nombre ya conocido (p. ej. el del subdirectorio); si falta
+            se resuelve con resolve_person_name
+
+    Returns:
+        EnrollmentResult: Nombre, encoding (None si no hay rostro) y error si lo hubo
+    """
+    if _worker_text_recognizer is None:
+        _init_worker()
+
+    filename = os.path.basename(image_path)
+    known_name = person_name
+    if person_name is None:
+        person_name = os.path.splitext(filename)[0]
+    try:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+        sha1 = hashlib.sha1(data).hexdigest()
+
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return EnrollmentResult(image_path, person_name, None, sha1, "No se pudo decodificar la imagen")
+
+        name_future = None
+        if known_name is None:
+            name_future = _worker_ocr_executor.submit(
+                resolve_person_name, image_path, filename, _worker_text_recognizer,
+                image, _worker_verbose
+            )
+
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        with DLIB_LOCK:
+            face_location = largest_face_location(face_recognition.face_locations(rgb_image))
+        if name_future is not None:
+            person_name = name_future.result()
+
+        if face_location is None:
+            return EnrollmentResult(image_path, person_name, None, sha1, "No se encontró ningún rostro")
+
+        # Si hay varios rostros (p. ej. alguien de fondo) tomamos el más grande
+        with DLIB_LOCK:
+            face_encoding = face_recognition.face_encodings(rgb_image, [face_location])[0]
+        return EnrollmentResult(image_path, person_name, face_encoding, sha1, None)
+
+    except Exception as e:
+        return EnrollmentResult(image_path, person_name, None, None, str(e))
+
+
+def enroll_directory(detector, faces_dir, workers=1, cache=None, verbose=True):
+    """
+    Carga las imágenes autorizadas de un directorio en el detector
+
+    Las imágenes sin cambios se toman de la caché; el resto se procesa en
+    un pool de procesos. Los resultados se agregan a la galería en orden
+    alfabético de archivo, sin importar el orden en que terminen.
+
+    Las imágenes que resuelven al mismo nombre (las de un subdirectorio, o
+    varias credenciales de la misma persona) quedan como muestras de una
+    única identidad.
+
+    Args:
+        detector: Instancia de FaceDetector
+        faces_dir: Directorio con las imágenes autorizadas
+        workers: Cantidad de procesos (1 procesa en el proceso actual)
+        cache: EncodingCache opcional
+        verbose: Si es True se informa el resultado de cada imagen
+
+    Returns:
+        EnrollmentReport: Resumen de la carga, con las imágenes que fallaron
+    """
+    start = time.perf_counter()
+    filenames = list_authorized_images(faces_dir)
+    image_paths = [os.path.join(faces_dir, filename) for filename in filenames]
+    known_names = dict(zip(image_paths, map(person_directory, filenames)))
+
+    # Resolver primero lo que ya está en caché
+    slots = []
+    pending = []
+    for image_path in image_paths:
+        cached = cache.lookup(image_path) if cache is not None else None
+        if cached is not None:
+            slots.append(EnrollmentResult(image_path, cached['name'], cached['encoding'], None, None))
+        else:
+            slots.append(None)
+            pending.append(image_path)
+    cached_count = len(image_paths) - len(pending)
+
+    if workers > 1 and len(pending) > 1:
+        chunksize = max(1, min(64, len(pending) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(verbose,)) as executor:
+            processed = list(executor.map(process_authorized_image, pending,
+                                          [known_names[image_path] for image_path in pending],
+                                          chunksize=chunksize))
+    else:
+        _init_worker(verbose)
+        processed = [process_authorized_image(image_path, known_names[image_path]) for image_path in pending]
+
+    results = iter(processed)
+    slots = [slot if slot is not None else next(results) for slot in slots]
+
+    encodings = []
+    names = []
+    failures = []
+    for result in slots:
+        if result.encoding is not None:
+            encodings.append(result.encoding)
+            names.append(result.person_name)
+        if result.error is not None:
+            failures.append(result)
+
+        if result.sha1 is not None:
+            if verbose:
+                if result.error is None:
+                    print(f"Imagen cargada exitosamente como: {result.person_name}")
+                else:
+                    print(f"Error al cargar la imagen de {result.person_name}: {result.error}")
+            if cache is not None:
+                cache.store(result.image_path, result.person_name, result.encoding, sha1=result.sha1)
+
+    if encodings:
+        detector.gallery.add_many(encodings, names)
+
+    if cache is not None:
+        # Descartar imágenes eliminadas y persistir los cambios
+        cache.retain(image_paths)
+        cache.save()
+
+    return EnrollmentReport(
+        loaded=len(encodings),
+        cached=cached_count,
+        processed=len(pending),
+        failures=failures,
+        elapsed=time.perf_counter() - start,
+    )
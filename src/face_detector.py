@@ -1,15 +1,142 @@
+import copy
 import cv2
 import face_recognition
 import numpy as np
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+from face_gallery import FaceGallery, TemplateGallery
+from face_locators import DLIB_LOCK, HogLocator
+from metrics import FACES, REGISTRY
+
+UNKNOWN_NAME = "Desconocido"
+
+def largest_face_location(face_locations: List[tuple]) -> Optional[tuple]:
+    """Ubicación (top, right, bottom, left) del rostro de mayor área, o None si no hay"""
+    if not face_locations:
+        return None
+    return max(face_locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+
+class _SharedGallery:
+    """Galería y versión compartidas entre un detector y sus copias de with_locator"""
+    __slots__ = ('gallery', 'version')
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+        self.version = 0
 
 class FaceDetector:
-    def __init__(self):
+    def __init__(self, tolerance: float = 0.6, index=None, detection_scale: float = 1.0,
+                 roi: Optional[Tuple[int, int, int, int]] = None, templates: bool = True,
+                 locator=None):
         """
         Inicializa el detector de rostros
+        
+        Args:
+            tolerance (float): Distancia máxima para considerar que dos rostros coinciden
+            index: Índice de búsqueda para la galería (ver face_gallery.create_index)
+            detection_scale (float): Escala a la que se buscan los rostros (p. ej. 0.5 detecta
+                sobre la imagen a la mitad de resolución); los encodings se calculan siempre
+                a resolución completa
+            roi (tuple, optional): Región de interés (x, y, ancho, alto); fuera de ella
+                no se procesa ningún pixel
+            templates (bool): Si es True las imágenes de una misma persona se agrupan en
+                una plantilla con umbral propio (TemplateGallery); si es False cada imagen
+                es una fila independiente con la tolerancia global (FaceGallery)
+            locator: Detector que ubica los rostros (ver face_locators.create_face_locator);
+                por defecto HOG de dlib. Los encodings se calculan siempre con dlib
+        """
+        if not 0 < detection_scale <= 1:
+            raise ValueError("detection_scale debe estar en el rango (0, 1]")
+        self.tolerance = tolerance
+        self._shared = _SharedGallery(TemplateGallery(index=index) if templates else FaceGallery(index=index))
+        self.locator = locator if locator is not None else HogLocator()
+        self.detection_scale = detection_scale
+        self.roi = roi
+
+    @property
+    def gallery(self):
+        """Galería de identidades autorizadas"""
+        return self._shared.gallery
+
+    @gallery.setter
+    def gallery(self, gallery):
+        self._shared.gallery = gallery
+
+    @property
+    def gallery_version(self) -> int:
+        """Se incrementa con cada reemplazo de la galería (ver replace_gallery)"""
+        return self._shared.version
+
+    def with_locator(self, locator) -> 'FaceDetector':
+        """
+        Copia del detector que ubica los rostros con otro backend
+        
+        La copia comparte la galería con el original: un replace_gallery en
+        cualquiera de los dos lo ven ambos (p. ej. una cámara con YuNet y otra
+        con HOG sobre la misma galería recargable).
+        
+        Args:
+            locator: Detector de rostros (ver face_locators.create_face_locator)
         """
-        self.known_face_encodings = []
-        self.known_face_names = []
+        detector = copy.copy(self)
+        detector.locator = locator
+        return detector
+
+    @property
+    def known_face_encodings(self) -> List[np.ndarray]:
+        """Encodings cargados (vista de compatibilidad sobre la galería)"""
+        return list(self.gallery.encodings)
+
+    @property
+    def known_face_names(self) -> List[str]:
+        """Nombres cargados (vista de compatibilidad sobre la galería)"""
+        return list(self.gallery.names)
+
+    def add_known_face(self, face_encoding: np.ndarray, person_name: str):
+        """
+        Agrega un encoding ya calculado a la galería
+        
+        Args:
+            face_encoding (np.ndarray): Encoding facial de 128 dimensiones
+            person_name (str): Nombre de la persona
+        """
+        self.gallery.add(face_encoding, person_name)
+
+    def replace_gallery(self, gallery: FaceGallery):
+        """
+        Reemplaza la galería completa de forma atómica
+        
+        El índice de la galería nueva se construye antes del cambio, así las
+        búsquedas nunca esperan ni ven una galería a medio cargar: cada
+        identificación usa la galería anterior o la nueva, completa.
+        
+        Args:
+            gallery (FaceGallery): Galería ya cargada
+        """
+        gallery.prepare()
+        self._shared.gallery = gallery
+        self._shared.version += 1
+
+    def encode_image_file(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Calcula el encoding del rostro más grande de una imagen
+        
+        Args:
+            image_path (str): Ruta a la imagen
+            
+        Returns:
+            np.ndarray: Encoding facial, o None si la imagen no tiene rostros
+        """
+        # Cargar la imagen y obtener los encodings faciales
+        image = face_recognition.load_image_file(image_path)
+        with DLIB_LOCK:
+            face_location = largest_face_location(face_recognition.face_locations(image))
+        
+        if face_location is None:
+            return None
+        
+        # Si hay varios rostros, el de la persona es el más cercano a la cámara
+        with DLIB_LOCK:
+            return face_recognition.face_encodings(image, [face_location])[0]
 
     def load_authorized_face(self, image_path: str, person_name: str) -> bool:
         """
@@ -23,27 +150,130 @@ class FaceDetector:
             bool: True si se pudo cargar la imagen correctamente, False en caso contrario
         """
         try:
-            # Cargar la imagen y obtener los encodings faciales
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
+            face_encoding = self.encode_image_file(image_path)
             
-            if len(face_encodings) == 0:
+            if face_encoding is None:
                 print(f"No se encontró ningún rostro en la imagen de {person_name}")
                 return False
-                
-            # Tomamos el primer rostro encontrado
-            face_encoding = face_encodings[0]
             
-            # Agregamos el encoding y el nombre a nuestras listas
-            self.known_face_encodings.append(face_encoding)
-            self.known_face_names.append(person_name)
+            # Agregamos el encoding y el nombre a la galería
+            self.add_known_face(face_encoding, person_name)
             
             return True
             
         except Exception as e:
             print(f"Error al cargar la imagen de {person_name}: {str(e)}")
             return False
+
+    def identify(self, face_encodings) -> List[Tuple[str, float]]:
+        """
+        Identifica un conjunto de encodings contra la galería en una sola búsqueda
+        
+        Args:
+            face_encodings: Lista o matriz de encodings faciales
+            
+        Returns:
+            List[Tuple[str, float]]: Por cada encoding, el nombre de la identidad más
+                cercana ("Desconocido" si supera la tolerancia) y su distancia
+        """
+        if len(face_encodings) == 0:
+            return []
+        # Referencia local: la galería puede reemplazarse durante la búsqueda
+        gallery = self.gallery
+        if len(gallery) == 0:
+            FACES.inc(len(face_encodings), result='desconocido')
+            return [(UNKNOWN_NAME, float('inf')) for _ in face_encodings]
+        
+        with REGISTRY.span('matching'):
+            matches = gallery.match(face_encodings, tolerance=self.tolerance)
+        identities = [(name if name is not None else UNKNOWN_NAME, distance) for name, distance in matches]
+        if REGISTRY.enabled:
+            unknown = sum(1 for name, _ in identities if name == UNKNOWN_NAME)
+            FACES.inc(len(identities) - unknown, result='match')
+            FACES.inc(unknown, result='desconocido')
+        return identities
+            
+    def _roi_bounds(self, shape) -> Tuple[int, int, int, int]:
+        """Límites (top, bottom, left, right) de la región de interés dentro de la imagen"""
+        height, width = shape[:2]
+        if self.roi is None:
+            return 0, height, 0, width
+        x, y, w, h = self.roi
+        left = min(max(0, x), width)
+        top = min(max(0, y), height)
+        return top, min(height, top + h), left, min(width, left + w)
+
+    def _locate_in_region(self, rgb_region: np.ndarray) -> List[tuple]:
+        """Busca rostros en una región, reducida según detection_scale, en coordenadas de la región"""
+        if rgb_region.size == 0:
+            return []
+        with REGISTRY.span('ubicacion'):
+            if self.detection_scale == 1:
+                return self.locator.locate(rgb_region)
+            
+            small = cv2.resize(rgb_region, None, fx=self.detection_scale, fy=self.detection_scale,
+                               interpolation=cv2.INTER_AREA)
+            height, width = rgb_region.shape[:2]
+            scale = 1.0 / self.detection_scale
+            return [
+                (max(0, int(top * scale)), min(width, int(right * scale)),
+                 min(height, int(bottom * scale)), max(0, int(left * scale)))
+                for top, right, bottom, left in self.locator.locate(small)
+            ]
+
+    @staticmethod
+    def _offset_locations(face_locations: List[tuple], top: int, left: int) -> List[tuple]:
+        """Traslada ubicaciones relativas a una región a coordenadas de la imagen completa"""
+        if top == 0 and left == 0:
+            return face_locations
+        return [(t + top, r + left, b + top, l + left) for t, r, b, l in face_locations]
+
+    def locate_faces(self, rgb_image: np.ndarray) -> List[tuple]:
+        """
+        Encuentra la ubicación de los rostros en una imagen RGB
+        
+        Respeta la región de interés y la escala de detección configuradas.
+        
+        Args:
+            rgb_image (np.ndarray): Imagen en RGB
             
+        Returns:
+            List[tuple]: Ubicaciones (top, right, bottom, left) de cada rostro
+        """
+        top, bottom, left, right = self._roi_bounds(rgb_image.shape)
+        face_locations = self._locate_in_region(rgb_image[top:bottom, left:right])
+        return self._offset_locations(face_locations, top, left)
+
+    def encode_faces(self, rgb_image: np.ndarray, face_locations: List[tuple]) -> List[np.ndarray]:
+        """
+        Calcula el encoding de cada rostro ubicado en una imagen RGB
+        
+        Args:
+            rgb_image (np.ndarray): Imagen en RGB
+            face_locations (List[tuple]): Ubicaciones (top, right, bottom, left)
+            
+        Returns:
+            List[np.ndarray]: Un encoding por ubicación
+        """
+        if not face_locations:
+            return []
+        with DLIB_LOCK, REGISTRY.span('encoding'):
+            return face_recognition.face_encodings(rgb_image, face_locations)
+
+    def _locate_and_encode(self, image: np.ndarray) -> Tuple[List[tuple], List[np.ndarray]]:
+        """Ubica los rostros de una imagen BGR y calcula sus encodings (sin identificarlos)"""
+        # Recortar la región de interés y convertir solo esos pixeles de BGR
+        # (OpenCV) a RGB (face_recognition)
+        top, bottom, left, right = self._roi_bounds(image.shape)
+        with REGISTRY.span('color'):
+            rgb_region = cv2.cvtColor(image[top:bottom, left:right], cv2.COLOR_BGR2RGB)
+        
+        # Encontrar los rostros sobre la imagen reducida y calcular los
+        # encodings sobre la región a resolución completa
+        face_locations = self._locate_in_region(rgb_region)
+        face_encodings = self.encode_faces(rgb_region, face_locations)
+        return self._offset_locations(face_locations, top, left), face_encodings
+
     def detect_faces(self, image: np.ndarray) -> List[Tuple[tuple, str]]:
         """
         Detecta y reconoce rostros en una imagen
@@ -54,24 +284,30 @@ class FaceDetector:
         Returns:
             List[Tuple[tuple, str]]: Lista de tuplas con las coordenadas del rostro y el nombre de la persona
         """
-        # Convertir la imagen de BGR (OpenCV) a RGB (face_recognition)
-        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        face_locations, face_encodings = self._locate_and_encode(image)
         
-        # Encontrar todos los rostros en la imagen
-        face_locations = face_recognition.face_locations(rgb_image)
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
-        
-        results = []
+        # Comparar todos los rostros del frame contra la galería de una vez,
+        # quedándonos con la identidad más cercana de cada uno
+        identities = self.identify(face_encodings)
+        return [(face_location, name) for face_location, (name, _) in zip(face_locations, identities)]
+
+    def detect_faces_batch(self, images: List[np.ndarray]) -> List[List[Tuple[tuple, str, float]]]:
+        """
+        Detecta y reconoce rostros en varias imágenes, identificando todos los
+        encodings del lote en una única búsqueda contra la galería
         
-        for face_location, face_encoding in zip(face_locations, face_encodings):
-            # Comparar el rostro con nuestra base de datos de rostros conocidos
-            matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding, tolerance=0.6)
-            name = "Desconocido"
-            
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = self.known_face_names[first_match_index]
-            
-            results.append((face_location, name))
+        Args:
+            images (List[np.ndarray]): Imágenes en formato OpenCV/NumPy
             
-        return results 
\ No newline at end of file
+        Returns:
+            List[List[Tuple[tuple, str, float]]]: Por cada imagen, las coordenadas,
+                el nombre y la distancia de cada rostro
+        """
+        located = [self._locate_and_encode(image) for image in images]
+        all_encodings = [encoding for _, face_encodings in located for encoding in face_encodings]
+        identities = iter(self.identify(all_encodings))
+        
+        results = []
+        for face_locations, _ in located:
+            results.append([(location, *next(identities)) for location in face_locations])
+        return results
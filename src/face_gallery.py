@@ -0,0 +1,658 @@
+import threading
+import numpy as np
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from gallery_file import read_gallery_file, write_gallery_file
+
+ENCODING_DIM = 128
+
+
+def _squared_norms(matrix: np.ndarray) -> np.ndarray:
+    """Calcula la norma al cuadrado de cada fila (en float32)"""
+    return np.einsum('ij,ij->i', matrix, matrix, dtype=np.float32)
+
+
+def _pairwise_distances(queries: np.ndarray, matrix: np.ndarray, matrix_sq: np.ndarray) -> np.ndarray:
+    """
+    Distancias euclídeas entre cada consulta y cada fila de la matriz
+
+    Usa la identidad ||q - x||² = ||q||² + ||x||² - 2·q·x para resolver todo
+    con una sola multiplicación matricial (BLAS).
+    """
+    queries_sq = _squared_norms(queries)
+    squared = queries_sq[:, None] + matrix_sq[None, :] - 2.0 * (queries @ matrix.T)
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+class BruteForceIndex:
+    """Búsqueda exhaustiva: una multiplicación matricial contra toda la galería"""
+
+    def __init__(self):
+        # (matriz, normas): se reemplaza entera en build() para que una búsqueda
+        # concurrente nunca combine la matriz nueva con las normas viejas
+        self._state = (np.empty((0, ENCODING_DIM), dtype=np.float32), np.empty(0, dtype=np.float32))
+
+    def clone(self) -> 'BruteForceIndex':
+        """Índice vacío con la misma configuración"""
+        return BruteForceIndex()
+
+    def build(self, matrix: np.ndarray):
+        """Prepara el índice para la matriz de encodings (N x 128)"""
+        self._state = (matrix, _squared_norms(matrix))
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los k vecinos más cercanos de cada consulta
+
+        Args:
+            queries (np.ndarray): Matriz de consultas (Q x 128) en float32
+            k (int): Cantidad de vecinos por consulta
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Índices y distancias (Q x k), ordenados por distancia.
+                Si la galería tiene menos de k filas, se completa con -1 / inf.
+        """
+        matrix, matrix_sq = self._state
+        n = matrix.shape[0]
+        num_queries = queries.shape[0]
+        indices = np.full((num_queries, k), -1, dtype=np.int64)
+        distances = np.full((num_queries, k), np.inf, dtype=np.float32)
+        if n == 0 or num_queries == 0:
+            return indices, distances
+
+        all_distances = _pairwise_distances(queries, matrix, matrix_sq)
+        kk = min(k, n)
+        if kk < n:
+            nearest = np.argpartition(all_distances, kk - 1, axis=1)[:, :kk]
+        else:
+            nearest = np.tile(np.arange(n), (num_queries, 1))
+        nearest_distances = np.take_along_axis(all_distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        indices[:, :kk] = np.take_along_axis(nearest, order, axis=1)
+        distances[:, :kk] = np.take_along_axis(nearest_distances, order, axis=1)
+        return indices, distances
+
+
+class IVFIndex:
+    """
+    Índice particionado (estilo IVF): agrupa la galería con k-means y en cada
+    consulta solo compara contra las particiones más cercanas.
+
+    Con galerías chicas (menos de min_train_size filas) delega en búsqueda
+    exhaustiva, donde el particionado no aporta.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8,
+                 min_train_size: int = 4096, kmeans_iterations: int = 10,
+                 max_train_samples: int = 50000, seed: int = 0):
+        """
+        Args:
+            n_lists (int, optional): Cantidad de particiones. Por defecto ~sqrt(N)
+            n_probe (int): Particiones a revisar por consulta
+            min_train_size (int): Tamaño mínimo de galería para particionar
+            kmeans_iterations (int): Iteraciones de k-means al entrenar
+            max_train_samples (int): Máximo de filas usadas para entrenar
+            seed (int): Semilla para que el entrenamiento sea reproducible
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.max_train_samples = max_train_samples
+        self.seed = seed
+        # (índice exhaustivo, particiones o None): build() lo reemplaza entero, así
+        # una búsqueda concurrente ve siempre un estado completo
+        self._state = (BruteForceIndex(), None)
+
+    def _train(self, matrix: np.ndarray, n_lists: int) -> np.ndarray:
+        """Entrena los centroides con k-means (Lloyd) sobre una muestra"""
+        rng = np.random.default_rng(self.seed)
+        n = matrix.shape[0]
+        if n > self.max_train_samples:
+            sample = matrix[rng.choice(n, self.max_train_samples, replace=False)]
+        else:
+            sample = matrix
+        centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignments = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists).astype(np.float32)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        return centroids
+
+    @staticmethod
+    def _assign(matrix: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        """Asigna cada fila a su centroide más cercano, por bloques"""
+        centroids_sq = _squared_norms(centroids)
+        assignments = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], chunk):
+            block = matrix[start:start + chunk]
+            distances = _pairwise_distances(block, centroids, centroids_sq)
+            assignments[start:start + chunk] = np.argmin(distances, axis=1)
+        return assignments
+
+    def clone(self) -> 'IVFIndex':
+        """Índice vacío (sin entrenar) con la misma configuración"""
+        return IVFIndex(n_lists=self.n_lists, n_probe=self.n_probe, min_train_size=self.min_train_size,
+                        kmeans_iterations=self.kmeans_iterations,
+                        max_train_samples=self.max_train_samples, seed=self.seed)
+
+    def build(self, matrix: np.ndarray):
+        """Entrena las particiones y ordena la galería por partición"""
+        n = matrix.shape[0]
+        fallback = BruteForceIndex()
+        fallback.build(matrix)
+        if n < self.min_train_size:
+            self._state = (fallback, None)
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        centroids = self._train(matrix, n_lists)
+
+        assignments = self._assign(matrix, centroids)
+        sorted_rows = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=n_lists)
+        list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        # Copia contigua ordenada por partición para leer cada lista de corrido
+        sorted_matrix = np.ascontiguousarray(matrix[sorted_rows])
+        partitions = (centroids, _squared_norms(centroids), list_offsets, sorted_rows,
+                      sorted_matrix, _squared_norms(sorted_matrix))
+        self._state = (fallback, partitions)
+
+    def search(self, queries: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Busca los k vecinos más cercanos revisando solo n_probe particiones"""
+        fallback, partitions = self._state
+        if partitions is None:
+            return fallback.search(queries, k)
+        centroids, centroids_sq, list_offsets, sorted_rows, sorted_matrix, sorted_sq = partitions
+
+        num_queries = queries.shape[0]
+        indices = np.full((num_queries, k), -1, dtype=np.int64)
+        distances = np.full((num_queries, k), np.inf, dtype=np.float32)
+        if num_queries == 0:
+            return indices, distances
+
+        n_probe = min(self.n_probe, centroids.shape[0])
+        centroid_distances = _pairwise_distances(queries, centroids, centroids_sq)
+        probes = np.argpartition(centroid_distances, n_probe - 1, axis=1)[:, :n_probe]
+
+        for q in range(num_queries):
+            candidates = np.concatenate([
+                np.arange(list_offsets[l], list_offsets[l + 1]) for l in probes[q]
+            ])
+            if candidates.size == 0:
+                continue
+            candidate_distances = _pairwise_distances(
+                queries[q:q + 1], sorted_matrix[candidates], sorted_sq[candidates]
+            )[0]
+            kk = min(k, candidates.size)
+            if kk < candidates.size:
+                best = np.argpartition(candidate_distances, kk - 1)[:kk]
+            else:
+                best = np.arange(candidates.size)
+            best = best[np.argsort(candidate_distances[best])]
+            indices[q, :kk] = sorted_rows[candidates[best]]
+            distances[q, :kk] = candidate_distances[best]
+        return indices, distances
+
+
+INDEX_TYPES = {
+    'brute': BruteForceIndex,
+    'ivf': IVFIndex,
+}
+
+
+def create_index(kind: str = 'brute', **kwargs):
+    """
+    Crea un índice de búsqueda por nombre
+
+    Args:
+        kind (str): 'brute' (exhaustivo, BLAS) o 'ivf' (particionado)
+
+    Returns:
+        Índice con los métodos build() y search()
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {kind} (opciones: {', '.join(INDEX_TYPES)})")
+    return INDEX_TYPES[kind](**kwargs)
+
+
+class FaceGallery:
+    """
+    Galería de identidades autorizadas
+
+    Guarda los encodings en una matriz float32 contigua (N x 128) con un
+    arreglo de nombres paralelo, y resuelve todas las caras de un frame con
+    una única búsqueda vectorizada.
+    """
+
+    def __init__(self, index=None, dim: int = ENCODING_DIM):
+        """
+        Args:
+            index: Índice de búsqueda (BruteForceIndex por defecto)
+            dim (int): Dimensión de los encodings
+        """
+        self.dim = dim
+        self.index = index if index is not None else BruteForceIndex()
+        self._encodings = np.empty((0, dim), dtype=np.float32)
+        self._names = np.empty(0, dtype=object)
+        self._size = 0
+        self._index_ready = False
+        self._lock = threading.Lock()
+        # Archivo float32 mapeado en memoria del que salen los encodings, si lo hay
+        self._backing_file = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getstate__(self):
+        # El lock no se puede serializar (p. ej. al enviar la galería a otro proceso)
+        state = self.__dict__.copy()
+        del state['_lock']
+        if self._backing_file is not None:
+            # El otro proceso vuelve a mapear el archivo en lugar de recibir una copia
+            state['_encodings'] = None
+            state['index'] = self.index.clone()
+            state['_index_ready'] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if self._encodings is None:
+            self._encodings, _, _ = read_gallery_file(self._backing_file)
+
+    @classmethod
+    def load(cls, path: str, index=None) -> 'FaceGallery':
+        """
+        Abre una galería guardada con save()
+
+        Si el archivo es float32 la matriz queda mapeada en memoria y se
+        comparte entre los procesos que la abran (o que reciban la galería).
+
+        Args:
+            path (str): Archivo de galería
+            index: Índice de búsqueda (BruteForceIndex por defecto)
+        """
+        encodings, names, info = read_gallery_file(path)
+        gallery = cls(index=index, dim=info.dim)
+        gallery._encodings = encodings
+        gallery._names = np.array(names, dtype=object)
+        gallery._size = info.count
+        if info.dtype == 'float32':
+            gallery._backing_file = path
+        return gallery
+
+    def save(self, path: str, dtype: str = 'float32'):
+        """
+        Guarda la galería en el formato compacto de gallery_file
+
+        Args:
+            path (str): Archivo de destino
+            dtype (str): 'float32', 'float16' o 'int8'
+        """
+        write_gallery_file(path, self.encodings, list(self.names), dtype=dtype)
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """Matriz (N x dim) con los encodings cargados"""
+        return self._encodings[:self._size]
+
+    @property
+    def names(self) -> np.ndarray:
+        """Arreglo de nombres, alineado con encodings"""
+        return self._names[:self._size]
+
+    def _reserve(self, extra: int):
+        """Asegura capacidad para extra filas más (crecimiento geométrico)"""
+        needed = self._size + extra
+        capacity = self._encodings.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 16)
+        encodings = np.empty((new_capacity, self.dim), dtype=np.float32)
+        encodings[:self._size] = self._encodings[:self._size]
+        names = np.empty(new_capacity, dtype=object)
+        names[:self._size] = self._names[:self._size]
+        self._encodings = encodings
+        self._names = names
+
+    def add(self, encoding: np.ndarray, name: str):
+        """Agrega una identidad a la galería"""
+        self.add_many(np.asarray(encoding).reshape(1, -1), [name])
+
+    def add_many(self, encodings: np.ndarray, names: Sequence[str]):
+        """
+        Agrega varias identidades de una vez
+
+        Args:
+            encodings (np.ndarray): Matriz (M x dim)
+            names (Sequence[str]): M nombres, en el mismo orden
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if encodings.shape[0] != len(names):
+            raise ValueError("La cantidad de encodings y de nombres no coincide")
+        if encodings.shape[0] == 0:
+            return
+        with self._lock:
+            # Al crecer se copia a memoria propia: deja de depender del archivo
+            self._backing_file = None
+            self._reserve(encodings.shape[0])
+            end = self._size + encodings.shape[0]
+            self._encodings[self._size:end] = encodings
+            self._names[self._size:end] = list(names)
+            self._size = end
+            self._index_ready = False
+
+    def empty_like(self) -> 'FaceGallery':
+        """Galería vacía con el mismo tipo y configuración de índice"""
+        return FaceGallery(index=self.index.clone(), dim=self.dim)
+
+    def prepare(self):
+        """Construye el índice ya, en lugar de en la primera búsqueda"""
+        self._ensure_index()
+
+    def _ensure_index(self):
+        """Reconstruye el índice si la galería cambió desde la última búsqueda"""
+        if self._index_ready:
+            return
+        with self._lock:
+            if not self._index_ready:
+                self.index.build(np.ascontiguousarray(self.encodings))
+                self._index_ready = True
+
+    def search(self, encodings, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los k vecinos más cercanos de cada encoding
+
+        Args:
+            encodings: Lista o matriz de encodings (Q x dim)
+            k (int): Vecinos por consulta
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Índices de fila y distancias (Q x k)
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        self._ensure_index()
+        return self.index.search(queries, k)
+
+    def match(self, encodings, tolerance: float = 0.6) -> List[Tuple[Optional[str], float]]:
+        """
+        Resuelve la identidad más cercana de cada encoding
+
+        Args:
+            encodings: Lista o matriz de encodings (Q x dim)
+            tolerance (float): Distancia máxima para aceptar la coincidencia
+
+        Returns:
+            List[Tuple[Optional[str], float]]: Por cada encoding, el nombre más
+                cercano (None si supera la tolerancia) y su distancia
+        """
+        indices, distances = self.search(encodings, k=1)
+        names = self.names
+        results = []
+        for index, distance in zip(indices[:, 0], distances[:, 0]):
+            if index >= 0 and distance <= tolerance:
+                results.append((names[index], float(distance)))
+            else:
+                results.append((None, float(distance)))
+        return results
+
+
+class _Templates(NamedTuple):
+    """Plantillas construidas a partir de las filas de una galería"""
+    index: object                     # Índice sobre los centroides (o sobre las filas)
+    matrix: np.ndarray                # Encodings de la galería (la matriz mapeada, sin copiar)
+    identity_names: np.ndarray        # Nombre de cada identidad
+    spreads: np.ndarray               # Dispersión de sus muestras (NaN con una sola)
+    overrides: np.ndarray             # Umbral fijado con set_threshold (NaN si no hay)
+    exemplar_rows: Optional[np.ndarray]  # Filas de los ejemplares agrupadas por identidad
+    exemplars_sq: np.ndarray          # Norma al cuadrado de cada ejemplar
+    exemplar_offsets: np.ndarray      # Inicio de los ejemplares de cada identidad
+
+
+class TemplateGallery(FaceGallery):
+    """
+    Galería con varias muestras por identidad
+
+    Guarda todas las muestras como filas (igual que FaceGallery, con el mismo
+    formato de archivo) y al construir el índice las resume en una plantilla
+    por identidad: el centroide (media de sus muestras) y hasta max_exemplars
+    ejemplares elegidos por muestreo del punto más lejano a partir del medoide,
+    para cubrir las variaciones (luz, ángulo, anteojos). Los ejemplares se
+    guardan como números de fila de la matriz de encodings, que con un archivo
+    mapeado sigue compartida entre procesos.
+
+    La búsqueda es en dos etapas: primero contra los centroides (con el índice
+    configurado) y luego solo contra los ejemplares de las identidades
+    candidatas, así el costo por rostro depende de la cantidad de identidades
+    y no de las imágenes cargadas por cada una. Si cada identidad tiene una
+    sola muestra el índice se arma directamente sobre la matriz y alcanza con
+    la primera etapa.
+
+    Cada identidad tiene su propio umbral: parte de la tolerancia global y,
+    si sus muestras están más lejos entre sí que esa tolerancia (la mayor
+    distancia de una muestra a la más cercana de las demás), se ensancha
+    hasta esa distancia, con un máximo de max_widening por encima de la
+    tolerancia. Nunca es más estricto que el de una identidad con una sola
+    muestra, que usa la tolerancia global como en FaceGallery.
+    """
+
+    def __init__(self, index=None, dim: int = ENCODING_DIM, max_exemplars: int = 5,
+                 candidates: int = 3, max_widening: float = 0.1):
+        """
+        Args:
+            index: Índice de búsqueda sobre los centroides (BruteForceIndex por defecto)
+            dim (int): Dimensión de los encodings
+            max_exemplars (int): Máximo de ejemplares que se guardan por identidad
+            candidates (int): Identidades (por cercanía del centroide) que pasan a la segunda etapa
+            max_widening (float): Cuánto puede superar el umbral de una identidad a la tolerancia global
+        """
+        super().__init__(index=index, dim=dim)
+        self.max_exemplars = max(1, max_exemplars)
+        self.candidates = max(1, candidates)
+        self.max_widening = max_widening
+        self.threshold_overrides = {}
+        # Se reemplaza entero en cada construcción: una búsqueda concurrente
+        # nunca combina el índice nuevo con plantillas viejas
+        self._templates = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        if self._backing_file is not None:
+            # Las plantillas salen de la matriz mapeada: el otro proceso las arma
+            # en su primera búsqueda en lugar de recibir una copia
+            state['_templates'] = None
+        return state
+
+    @property
+    def identity_names(self) -> np.ndarray:
+        """Nombres de las identidades, alineados con los índices de search()"""
+        return self._built_templates().identity_names
+
+    @property
+    def identity_count(self) -> int:
+        """Cantidad de identidades distintas"""
+        return len(self.identity_names)
+
+    def set_threshold(self, name: str, threshold: Optional[float]):
+        """
+        Fija el umbral de una identidad (None vuelve al umbral adaptativo)
+
+        Args:
+            name (str): Nombre de la identidad
+            threshold (float, optional): Distancia máxima para aceptarla
+        """
+        with self._lock:
+            if threshold is None:
+                self.threshold_overrides.pop(name, None)
+            else:
+                self.threshold_overrides[name] = float(threshold)
+            self._index_ready = False
+
+    def empty_like(self) -> 'TemplateGallery':
+        """Galería vacía con la misma configuración (incluidos los umbrales fijados)"""
+        gallery = TemplateGallery(index=self.index.clone(), dim=self.dim, max_exemplars=self.max_exemplars,
+                                  candidates=self.candidates, max_widening=self.max_widening)
+        gallery.threshold_overrides = dict(self.threshold_overrides)
+        return gallery
+
+    def _select_exemplars(self, samples: np.ndarray) -> np.ndarray:
+        """Índices de hasta max_exemplars muestras: el medoide y luego siempre la más lejana a las elegidas"""
+        centroid = samples.mean(axis=0, keepdims=True)
+        samples_sq = _squared_norms(samples)
+        selected = [int(np.argmin(_pairwise_distances(centroid, samples, samples_sq)[0]))]
+        nearest = _pairwise_distances(samples[selected], samples, samples_sq)[0]
+        while len(selected) < self.max_exemplars:
+            farthest = int(np.argmax(nearest))
+            if nearest[farthest] <= 0:
+                break
+            selected.append(farthest)
+            np.minimum(nearest, _pairwise_distances(samples[farthest:farthest + 1], samples, samples_sq)[0],
+                       out=nearest)
+        return np.sort(np.array(selected, dtype=np.int64))
+
+    @staticmethod
+    def _spread(samples: np.ndarray) -> float:
+        """Mayor distancia de una muestra a la más cercana de las demás"""
+        distances = _pairwise_distances(samples, samples, _squared_norms(samples))
+        np.fill_diagonal(distances, np.inf)
+        return float(distances.min(axis=1).max())
+
+    def _build_templates(self) -> _Templates:
+        """Agrupa las filas por nombre y arma el índice, los ejemplares y las dispersiones"""
+        matrix = np.ascontiguousarray(self.encodings)
+        names = self.names
+        identity_names, inverse, counts = np.unique(names.astype(str), return_inverse=True, return_counts=True)
+        index = self.index.clone()
+
+        if np.all(counts == 1):
+            # Una muestra por identidad: cada fila es su propio centroide y
+            # el índice usa la matriz tal cual (sin copias privadas)
+            index.build(matrix)
+            overrides = np.array([self.threshold_overrides.get(name, np.nan) for name in names],
+                                 dtype=np.float32)
+            return _Templates(index, matrix, names, np.full(len(names), np.nan, dtype=np.float32),
+                              overrides, None, np.empty(0, dtype=np.float32), np.zeros(1, dtype=np.int64))
+
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        # Copia temporal agrupada por identidad, solo para calcular los centroides
+        centroids = np.add.reduceat(matrix[order], starts, axis=0) / counts[:, None].astype(np.float32)
+
+        spreads = np.full(len(identity_names), np.nan, dtype=np.float32)
+        keep = np.ones(len(order), dtype=bool)
+        for identity in np.flatnonzero(counts > 1):
+            start, count = starts[identity], counts[identity]
+            samples = matrix[order[start:start + count]]
+            spreads[identity] = self._spread(samples)
+            if count > self.max_exemplars:
+                keep[start:start + count] = False
+                keep[start + self._select_exemplars(samples)] = True
+
+        exemplar_rows = order[keep]
+        exemplar_counts = np.bincount(inverse[exemplar_rows], minlength=len(identity_names))
+        index.build(np.ascontiguousarray(centroids, dtype=np.float32))
+        overrides = np.array([self.threshold_overrides.get(name, np.nan) for name in identity_names],
+                             dtype=np.float32)
+        return _Templates(index, matrix, identity_names.astype(object), spreads, overrides, exemplar_rows,
+                          _squared_norms(matrix[exemplar_rows]),
+                          np.concatenate(([0], np.cumsum(exemplar_counts))).astype(np.int64))
+
+    def _ensure_index(self):
+        """Reconstruye plantillas e índice de centroides si la galería cambió"""
+        if self._index_ready:
+            return
+        with self._lock:
+            if not self._index_ready:
+                self._templates = self._build_templates()
+                self._index_ready = True
+
+    def _built_templates(self) -> _Templates:
+        self._ensure_index()
+        return self._templates
+
+    def thresholds(self, tolerance: float = 0.6) -> np.ndarray:
+        """
+        Umbral de cada identidad para una tolerancia global dada
+
+        Returns:
+            np.ndarray: Umbrales alineados con identity_names
+        """
+        return self._thresholds(self._built_templates(), tolerance)
+
+    def _thresholds(self, templates: _Templates, tolerance: float) -> np.ndarray:
+        spreads = templates.spreads
+        # La dispersión solo ensancha el umbral: una identidad compacta se queda en la tolerancia global
+        adaptive = np.clip(spreads, tolerance, tolerance + self.max_widening)
+        adaptive = np.where(np.isnan(spreads), tolerance, adaptive)
+        return np.where(np.isnan(templates.overrides), adaptive, templates.overrides)
+
+    def _search(self, templates: _Templates, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        candidates, candidate_distances = templates.index.search(queries, max(k, self.candidates))
+        if templates.exemplar_rows is None:
+            return candidates[:, :k], candidate_distances[:, :k]
+
+        offsets = templates.exemplar_offsets
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        distances = np.full((queries.shape[0], k), np.inf, dtype=np.float32)
+        for q in range(queries.shape[0]):
+            identities = candidates[q][candidates[q] >= 0]
+            if identities.size == 0:
+                continue
+            rows = np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in identities])
+            # Los ejemplares se leen de la matriz compartida recién al comparar
+            exemplar_distances = _pairwise_distances(
+                queries[q:q + 1], templates.matrix[templates.exemplar_rows[rows]], templates.exemplars_sq[rows]
+            )[0]
+            segment_starts = np.concatenate(([0], np.cumsum(offsets[identities + 1] - offsets[identities])[:-1]))
+            best = np.minimum.reduceat(exemplar_distances, segment_starts)
+            order = np.argsort(best, kind='stable')[:k]
+            indices[q, :order.size] = identities[order]
+            distances[q, :order.size] = best[order]
+        return indices, distances
+
+    def search(self, encodings, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca las k identidades más cercanas de cada encoding en dos etapas
+
+        Args:
+            encodings: Lista o matriz de encodings (Q x dim)
+            k (int): Identidades por consulta
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Índices de identidad (ver identity_names) y
+                distancia al ejemplar más cercano de cada una (Q x k)
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        return self._search(self._built_templates(), queries, k)
+
+    def match(self, encodings, tolerance: float = 0.6) -> List[Tuple[Optional[str], float]]:
+        """
+        Resuelve la identidad más cercana de cada encoding con su propio umbral
+
+        Args:
+            encodings: Lista o matriz de encodings (Q x dim)
+            tolerance (float): Tolerancia global (umbral mínimo de cualquier identidad)
+
+        Returns:
+            List[Tuple[Optional[str], float]]: Por cada encoding, el nombre más
+                cercano (None si supera su umbral) y su distancia
+        """
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        # Las mismas plantillas para buscar, nombrar y elegir el umbral
+        templates = self._built_templates()
+        indices, distances = self._search(templates, queries, 1)
+        names = templates.identity_names
+        thresholds = self._thresholds(templates, tolerance)
+        results = []
+        for index, distance in zip(indices[:, 0], distances[:, 0]):
+            if index >= 0 and distance <= thresholds[index]:
+                results.append((names[index], float(distance)))
+            else:
+                results.append((None, float(distance)))
+        return results
@@ -0,0 +1,265 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import cv2
+import face_recognition
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Directorio por defecto de los modelos de OpenCV (no se descargan solos)
+MODELS_DIR = os.path.join('data', 'models')
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+YUNET_MODEL = 'face_detection_yunet_2023mar.onnx'
+SSD_PROTOTXT = 'deploy.prototxt'
+SSD_WEIGHTS = 'res10_300x300_ssd_iter_140000.caffemodel'
+
+# face_recognition usa un único detector HOG y un único modelo de encodings de
+# dlib por proceso, que no admiten llamadas concurrentes: todo uso desde hilos
+# (pool de inferencia, cámaras del servicio, recarga de la galería) pasa por este lock
+DLIB_LOCK = threading.Lock()
+
+
+def _require_file(path: str, description: str) -> str:
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No se encontró el modelo {description}: {path}")
+    return path
+
+
+def boxes_to_locations(boxes, shape, box_scale: float = 1.0) -> List[tuple]:
+    """
+    Convierte cajas (x, y, ancho, alto) a ubicaciones (top, right, bottom, left)
+
+    Las cajas se llevan a un cuadrado centrado de lado box_scale veces el
+    promedio de ancho y alto (el encoder de dlib espera recortes parecidos a
+    los de su detector HOG) y se recortan a los límites de la imagen.
+
+    Args:
+        boxes: Cajas (x, y, ancho, alto) en pixeles
+        shape: Forma de la imagen
+        box_scale (float): Factor de tamaño del cuadrado respecto de la caja
+
+    Returns:
+        List[tuple]: Ubicaciones en el formato de face_recognition
+    """
+    height, width = shape[:2]
+    locations = []
+    for x, y, w, h in boxes:
+        side = (w + h) / 2.0 * box_scale
+        cx, cy = x + w / 2.0, y + h / 2.0
+        top = max(0, int(round(cy - side / 2)))
+        left = max(0, int(round(cx - side / 2)))
+        bottom = min(height, int(round(cy + side / 2)))
+        right = min(width, int(round(cx + side / 2)))
+        if bottom > top and right > left:
+            locations.append((top, right, bottom, left))
+    return locations
+
+
+class _ThreadLocalModel(ABC):
+    """
+    Base de los detectores de OpenCV: cada hilo carga su propia instancia
+    del modelo (no son seguros para usar desde varios hilos a la vez)
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Los modelos de OpenCV no se serializan: el otro proceso los vuelve a cargar
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _model(self):
+        model = getattr(self._local, 'model', None)
+        if model is None:
+            model = self._local.model = self._load()
+        return model
+
+    @abstractmethod
+    def _load(self):
+        """Carga una instancia nueva del modelo para el hilo actual"""
+
+
+class HogLocator:
+    """
+    Detector de face_recognition (dlib): HOG por defecto, o 'cnn' con GPU
+
+    Las llamadas se serializan con DLIB_LOCK; para ubicar rostros en paralelo
+    desde varios hilos conviene un detector de OpenCV o un pool de procesos.
+    """
+    name = 'hog'
+
+    def __init__(self, model: str = 'hog', upsample: int = 1):
+        """
+        Args:
+            model (str): 'hog' o 'cnn'
+            upsample (int): Veces que se amplía la imagen para encontrar rostros chicos
+        """
+        self.model = model
+        self.upsample = upsample
+
+    def locate(self, rgb_image: np.ndarray) -> List[tuple]:
+        with DLIB_LOCK:
+            return face_recognition.face_locations(rgb_image, number_of_times_to_upsample=self.upsample,
+                                                   model=self.model)
+
+
+class HaarLocator(_ThreadLocalModel):
+    """Cascada de Haar de OpenCV: la opción más rápida, con más falsos positivos"""
+    name = 'haar'
+
+    def __init__(self, cascade_path: Optional[str] = None, scale_factor: float = 1.1,
+                 min_neighbors: int = 5, min_size: Tuple[int, int] = (40, 40), box_scale: float = 1.0,
+                 models_dir: str = MODELS_DIR):
+        """
+        Args:
+            cascade_path (str, optional): Archivo XML de la cascada. Por defecto el que
+                trae opencv-python, o haarcascade_frontalface_default.xml en models_dir
+            scale_factor (float): Reducción entre escalas de la pirámide
+            min_neighbors (int): Detecciones vecinas necesarias para aceptar un rostro
+            min_size (tuple): Tamaño mínimo (ancho, alto) de un rostro en pixeles
+            box_scale (float): Ver boxes_to_locations
+            models_dir (str): Directorio de los modelos
+        """
+        super().__init__()
+        if cascade_path is None:
+            bundled = getattr(getattr(cv2, 'data', None), 'haarcascades', None)
+            cascade_path = os.path.join(bundled, HAAR_CASCADE) if bundled else ''
+            if not os.path.isfile(cascade_path):
+                cascade_path = os.path.join(models_dir, HAAR_CASCADE)
+        self.cascade_path = _require_file(cascade_path, 'de la cascada de Haar')
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+        self.box_scale = box_scale
+
+    def _load(self):
+        cascade = cv2.CascadeClassifier(self.cascade_path)
+        if cascade.empty():
+            raise ValueError(f"No se pudo cargar la cascada: {self.cascade_path}")
+        return cascade
+
+    def locate(self, rgb_image: np.ndarray) -> List[tuple]:
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        boxes = self._model().detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                               minNeighbors=self.min_neighbors, minSize=self.min_size)
+        return boxes_to_locations(boxes, rgb_image.shape, self.box_scale)
+
+
+class YuNetLocator(_ThreadLocalModel):
+    """Red YuNet de OpenCV (cv2.FaceDetectorYN): rápida y precisa en CPU"""
+    name = 'yunet'
+
+    def __init__(self, model_path: Optional[str] = None, score_threshold: float = 0.8,
+                 nms_threshold: float = 0.3, top_k: int = 5000, box_scale: float = 1.0,
+                 models_dir: str = MODELS_DIR):
+        """
+        Args:
+            model_path (str, optional): Modelo ONNX (por defecto face_detection_yunet_2023mar.onnx en models_dir)
+            score_threshold (float): Confianza mínima de una detección
+            nms_threshold (float): Solapamiento máximo entre detecciones (supresión de no máximos)
+            top_k (int): Candidatos que se conservan antes de la supresión
+            box_scale (float): Ver boxes_to_locations
+            models_dir (str): Directorio de los modelos
+        """
+        super().__init__()
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            raise ImportError("La versión instalada de OpenCV no incluye FaceDetectorYN (requiere 4.5.4+)")
+        self.model_path = _require_file(model_path or os.path.join(models_dir, YUNET_MODEL), 'YuNet')
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+        self.box_scale = box_scale
+
+    def _load(self):
+        return cv2.FaceDetectorYN.create(self.model_path, '', (320, 320), self.score_threshold,
+                                         self.nms_threshold, self.top_k)
+
+    def locate(self, rgb_image: np.ndarray) -> List[tuple]:
+        height, width = rgb_image.shape[:2]
+        model = self._model()
+        model.setInputSize((width, height))
+        _, faces = model.detect(cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR))
+        if faces is None:
+            return []
+        # Cada fila: caja (x, y, ancho, alto), 5 puntos de referencia y confianza
+        return boxes_to_locations(faces[:, :4], rgb_image.shape, self.box_scale)
+
+
+class SSDLocator(_ThreadLocalModel):
+    """Detector SSD ResNet-10 de OpenCV (cv2.dnn, modelo Caffe de 300x300)"""
+    name = 'ssd'
+
+    def __init__(self, prototxt_path: Optional[str] = None, weights_path: Optional[str] = None,
+                 confidence: float = 0.5, input_size: int = 300, box_scale: float = 1.0,
+                 models_dir: str = MODELS_DIR):
+        """
+        Args:
+            prototxt_path (str, optional): Definición de la red (por defecto deploy.prototxt en models_dir)
+            weights_path (str, optional): Pesos (por defecto res10_300x300_ssd_iter_140000.caffemodel
+                en models_dir)
+            confidence (float): Confianza mínima de una detección
+            input_size (int): Lado de la imagen de entrada de la red
+            box_scale (float): Ver boxes_to_locations
+            models_dir (str): Directorio de los modelos
+        """
+        super().__init__()
+        self.prototxt_path = _require_file(prototxt_path or os.path.join(models_dir, SSD_PROTOTXT),
+                                           'SSD (prototxt)')
+        self.weights_path = _require_file(weights_path or os.path.join(models_dir, SSD_WEIGHTS),
+                                          'SSD (pesos)')
+        self.confidence = confidence
+        self.input_size = input_size
+        self.box_scale = box_scale
+
+    def _load(self):
+        return cv2.dnn.readNetFromCaffe(self.prototxt_path, self.weights_path)
+
+    def locate(self, rgb_image: np.ndarray) -> List[tuple]:
+        height, width = rgb_image.shape[:2]
+        size = (self.input_size, self.input_size)
+        # Reducir primero y convertir a BGR solo la imagen chica
+        small = cv2.resize(rgb_image, size, interpolation=cv2.INTER_AREA)[:, :, ::-1]
+        blob = cv2.dnn.blobFromImage(np.ascontiguousarray(small), 1.0, size, (104.0, 177.0, 123.0))
+        net = self._model()
+        net.setInput(blob)
+        detections = net.forward().reshape(-1, 7)
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = []
+        for x1, y1, x2, y2 in detections[:, 3:7] * np.array([width, height, width, height]):
+            boxes.append((x1, y1, x2 - x1, y2 - y1))
+        return boxes_to_locations(boxes, rgb_image.shape, self.box_scale)
+
+
+LOCATOR_TYPES = {
+    'hog': HogLocator,
+    'haar': HaarLocator,
+    'yunet': YuNetLocator,
+    'ssd': SSDLocator,
+}
+
+
+def create_face_locator(kind: str = 'hog', models_dir: Optional[str] = None, **kwargs):
+    """
+    Crea un detector de rostros por nombre
+
+    Todos devuelven ubicaciones (top, right, bottom, left) sobre una imagen
+    RGB, así cualquiera puede combinarse con el encoder de dlib.
+
+    Args:
+        kind (str): 'hog' (dlib), 'haar', 'yunet' o 'ssd' (OpenCV)
+        models_dir (str, optional): Directorio de los modelos de OpenCV (data/models por defecto)
+
+    Returns:
+        Detector con el método locate(rgb_image)
+    """
+    if kind not in LOCATOR_TYPES:
+        raise ValueError(f"Detector desconocido: {kind} (opciones: {', '.join(LOCATOR_TYPES)})")
+    if models_dir is not None and kind != 'hog':
+        kwargs['models_dir'] = models_dir
+    return LOCATOR_TYPES[kind](**kwargs)
@@ -0,0 +1,203 @@
+import threading
+import cv2
+import dlib
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+from face_detector import UNKNOWN_NAME
+from metrics import REGISTRY
+
+
+def iou(a: tuple, b: tuple) -> float:
+    """Intersección sobre unión de dos ubicaciones (top, right, bottom, left)"""
+    top = max(a[0], b[0])
+    right = min(a[1], b[1])
+    bottom = min(a[2], b[2])
+    left = max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """Rostro seguido entre frames, con la identidad que se le asignó"""
+
+    def __init__(self, track_id: int, location: tuple, name: str, distance: float, rgb_image: np.ndarray):
+        self.track_id = track_id
+        self.location = location
+        self.name = name
+        self.distance = distance
+        self.age = 0
+        self._tracker = dlib.correlation_tracker()
+        self.restart(location, rgb_image)
+
+    def restart(self, location: tuple, rgb_image: np.ndarray):
+        """Reinicia el seguimiento a partir de una ubicación detectada"""
+        top, right, bottom, left = location
+        self.location = location
+        self._tracker.start_track(rgb_image, dlib.rectangle(left, top, right, bottom))
+
+    def update(self, rgb_image: np.ndarray) -> float:
+        """
+        Actualiza la ubicación con el correlation tracker
+
+        Returns:
+            float: Calidad del seguimiento (peak-to-sidelobe ratio)
+        """
+        quality = self._tracker.update(rgb_image)
+        position = self._tracker.get_position()
+        height, width = rgb_image.shape[:2]
+        self.location = (
+            max(0, int(position.top())),
+            min(width, int(position.right())),
+            min(height, int(position.bottom())),
+            max(0, int(position.left())),
+        )
+        self.age += 1
+        return quality
+
+
+class FaceTracker:
+    """
+    Reconocimiento con detección espaciada y seguimiento entre frames
+
+    La detección completa (ubicación + encoding) corre cada detect_interval
+    frames o cuando se pierde algún rostro. Entre detecciones cada rostro se
+    sigue con un correlation tracker de dlib que conserva su identidad, y en
+    cada detección solo se calcula el encoding de los rostros nuevos o
+    todavía desconocidos.
+    """
+
+    def __init__(self, detector, detect_interval: int = 10, iou_threshold: float = 0.3,
+                 min_quality: float = 7.0, unknown_handler: Optional[Callable] = None):
+        """
+        Args:
+            detector: Instancia de FaceDetector
+            detect_interval (int): Frames entre detecciones completas
+            iou_threshold (float): IoU mínimo para asociar una detección con un rostro seguido
+            min_quality (float): Calidad mínima del tracker para no considerar perdido el rostro
+            unknown_handler (callable, optional): Se llama con (encoding, ubicación, imagen RGB,
+                track_id) por cada encoding de un rostro desconocido, p. ej.
+                UnknownFaceRecorder.observe
+        """
+        self.detector = detector
+        self.detect_interval = detect_interval
+        self.iou_threshold = iou_threshold
+        self.min_quality = min_quality
+        self.unknown_handler = unknown_handler
+        self.tracks: List[Track] = []
+        self.frames = 0
+        self.full_detections = 0
+        self.encodings_computed = 0
+        self._frames_since_detection = 0
+        self._next_track_id = 1
+        self._force_detection = True
+        self._gallery_version = detector.gallery_version
+        # El seguimiento depende del orden de los frames: se procesan de a uno
+        self._lock = threading.Lock()
+
+    def detect_faces(self, image: np.ndarray) -> List[Tuple[tuple, str]]:
+        """Misma interfaz que FaceDetector.detect_faces, usando seguimiento"""
+        with self._lock:
+            return self.process(image)
+
+    def process(self, image: np.ndarray) -> List[Tuple[tuple, str]]:
+        """
+        Procesa un frame en BGR
+
+        Returns:
+            List[Tuple[tuple, str]]: Ubicación y nombre de cada rostro seguido
+        """
+        self.frames += 1
+        if self.detector.gallery_version != self._gallery_version:
+            # La galería cambió: volver a identificar a todos los rostros seguidos
+            self._force_detection = True
+        with REGISTRY.span('color'):
+            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+        if self._force_detection or not self.tracks or self._frames_since_detection >= self.detect_interval:
+            self._detect(rgb_image)
+        else:
+            with REGISTRY.span('seguimiento'):
+                self._follow(rgb_image)
+
+        return [(track.location, track.name) for track in self.tracks]
+
+    def _follow(self, rgb_image: np.ndarray):
+        """Actualiza los rostros seguidos; si alguno se pierde se fuerza una detección"""
+        self._frames_since_detection += 1
+        alive = []
+        for track in self.tracks:
+            if track.update(rgb_image) >= self.min_quality:
+                alive.append(track)
+            else:
+                self._force_detection = True
+        self.tracks = alive
+
+    def _detect(self, rgb_image: np.ndarray):
+        """Detección completa: asocia ubicaciones a rostros seguidos y codifica solo lo necesario"""
+        self.full_detections += 1
+        self._frames_since_detection = 0
+        self._force_detection = False
+        reidentify = self.detector.gallery_version != self._gallery_version
+        self._gallery_version = self.detector.gallery_version
+
+        locations = self.detector.locate_faces(rgb_image)
+
+        # Asociación voraz por IoU, de mayor a menor superposición
+        pairs = sorted(
+            ((iou(track.location, location), t, l)
+             for t, track in enumerate(self.tracks)
+             for l, location in enumerate(locations)),
+            reverse=True,
+        )
+        matched_tracks = {}
+        used_locations = set()
+        for overlap, t, l in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or l in used_locations:
+                continue
+            matched_tracks[t] = l
+            used_locations.add(l)
+
+        tracks = []
+        to_encode: List[Tuple[Optional[Track], tuple]] = []
+        for t, l in matched_tracks.items():
+            track = self.tracks[t]
+            track.restart(locations[l], rgb_image)
+            tracks.append(track)
+            if reidentify or track.name == UNKNOWN_NAME:
+                # Reintentar la identificación (p. ej. la persona se acercó)
+                to_encode.append((track, locations[l]))
+        for l, location in enumerate(locations):
+            if l not in used_locations:
+                to_encode.append((None, location))
+
+        if to_encode:
+            encodings = self.detector.encode_faces(rgb_image, [location for _, location in to_encode])
+            self.encodings_computed += len(encodings)
+            identities = self.detector.identify(encodings)
+            for (track, location), encoding, (name, distance) in zip(to_encode, encodings, identities):
+                if track is None:
+                    track = Track(self._next_track_id, location, name, distance, rgb_image)
+                    tracks.append(track)
+                    self._next_track_id += 1
+                else:
+                    track.name = name
+                    track.distance = distance
+                if name == UNKNOWN_NAME and self.unknown_handler is not None:
+                    self.unknown_handler(encoding, location, rgb_image, track.track_id)
+
+        self.tracks = tracks
+
+    def stats(self) -> dict:
+        """Proporción de frames con detección completa y encodings calculados"""
+        return {
+            'frames': self.frames,
+            'detecciones_completas': self.full_detections,
+            'encodings': self.encodings_computed,
+            'rostros_seguidos': len(self.tracks),
+        }
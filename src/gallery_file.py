@@ -0,0 +1,159 @@
+import os
+import struct
+import numpy as np
+from typing import List, NamedTuple, Sequence, Tuple
+
+MAGIC = b'FGAL'
+FORMAT_VERSION = 1
+
+# Cabecera de 64 bytes, little-endian:
+# magic, versión, tipo, reservado, dimensión, cantidad, y los offsets/tamaños
+# de los bloques de encodings, escalas (solo int8) y tabla de nombres
+_HEADER = struct.Struct('<4sHBBIQQQQQ')
+HEADER_SIZE = 64
+ALIGNMENT = 64
+
+DTYPES = {
+    'float32': (0, np.dtype('<f4')),
+    'float16': (1, np.dtype('<f2')),
+    'int8': (2, np.dtype('i1')),
+}
+_DTYPE_BY_CODE = {code: (name, dtype) for name, (code, dtype) in DTYPES.items()}
+
+
+class GalleryFileInfo(NamedTuple):
+    """Metadatos de un archivo de galería"""
+    path: str
+    dtype: str
+    dim: int
+    count: int
+    size_bytes: int
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def quantize_int8(encodings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cuantiza cada fila a int8 con una escala propia (simétrica)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Matriz int8 (N x dim) y escalas float32 (N)
+    """
+    scales = np.abs(encodings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(encodings / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def write_gallery_file(path: str, encodings: np.ndarray, names: Sequence[str], dtype: str = 'float32'):
+    """
+    Guarda una galería en el formato compacto
+
+    El archivo tiene una cabecera fija, el bloque contiguo de encodings
+    (alineado a 64 bytes para poder mapearlo directamente), las escalas por
+    fila si se cuantizó a int8, y una tabla de nombres (offsets + UTF-8).
+    Se escribe en un archivo temporal y se reemplaza de forma atómica.
+
+    Args:
+        path (str): Archivo de destino
+        encodings (np.ndarray): Matriz (N x dim)
+        names (Sequence[str]): N nombres, en el mismo orden
+        dtype (str): 'float32', 'float16' o 'int8'
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Tipo no soportado: {dtype} (opciones: {', '.join(DTYPES)})")
+    encodings = np.asarray(encodings, dtype=np.float32)
+    count, dim = encodings.shape
+    if count != len(names):
+        raise ValueError("La cantidad de encodings y de nombres no coincide")
+    code, file_dtype = DTYPES[dtype]
+
+    scales = None
+    if dtype == 'int8':
+        block, scales = quantize_int8(encodings)
+    else:
+        block = encodings.astype(file_dtype)
+
+    encoded_names = [name.encode('utf-8') for name in names]
+    name_offsets = np.zeros(count + 1, dtype='<u8')
+    name_offsets[1:] = np.cumsum([len(name) for name in encoded_names])
+    names_blob = b''.join(encoded_names)
+
+    data_offset = HEADER_SIZE
+    data_end = data_offset + block.nbytes
+    scales_offset = _align(data_end) if scales is not None else 0
+    names_offset = _align(scales_offset + scales.nbytes if scales is not None else data_end)
+    names_size = name_offsets.nbytes + len(names_blob)
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, code, 0, dim, count,
+                          data_offset, scales_offset, names_offset, names_size)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(block).tobytes())
+        if scales is not None:
+            f.write(b'\0' * (scales_offset - data_end))
+            f.write(scales.astype('<f4').tobytes())
+            f.write(b'\0' * (names_offset - scales_offset - scales.nbytes))
+        else:
+            f.write(b'\0' * (names_offset - data_end))
+        f.write(name_offsets.tobytes())
+        f.write(names_blob)
+    os.replace(tmp_path, path)
+
+
+def read_gallery_file(path: str) -> Tuple[np.ndarray, List[str], GalleryFileInfo]:
+    """
+    Abre un archivo de galería
+
+    Los archivos float32 se mapean con np.memmap en modo lectura: los
+    procesos que abren el mismo archivo comparten las páginas del sistema
+    operativo sin copiar la matriz. Los float16 e int8 se convierten a
+    float32 en memoria propia para la búsqueda (ocupan menos en disco y se
+    leen más rápido, pero no se comparten).
+
+    Returns:
+        Tuple[np.ndarray, List[str], GalleryFileInfo]: Encodings float32 (N x dim),
+            nombres y metadatos del archivo
+    """
+    with open(path, 'rb') as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ValueError(f"Archivo de galería inválido: {path}")
+    (magic, version, code, _, dim, count, data_offset,
+     scales_offset, names_offset, names_size) = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError(f"Archivo de galería inválido: {path}")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Versión de galería no soportada: {version}")
+    if code not in _DTYPE_BY_CODE:
+        raise ValueError(f"Tipo de encodings desconocido en {path}: {code}")
+    dtype_name, file_dtype = _DTYPE_BY_CODE[code]
+
+    if count == 0:
+        encodings = np.empty((0, dim), dtype=np.float32)
+    else:
+        block = np.memmap(path, dtype=file_dtype, mode='r', offset=data_offset, shape=(count, dim))
+        if dtype_name == 'float32':
+            encodings = block
+        elif dtype_name == 'float16':
+            encodings = np.array(block, dtype=np.float32)
+        else:
+            scales = np.memmap(path, dtype='<f4', mode='r', offset=scales_offset, shape=(count,))
+            encodings = np.array(block, dtype=np.float32) * np.asarray(scales)[:, None]
+
+    with open(path, 'rb') as f:
+        f.seek(names_offset)
+        table = f.read(names_size)
+    name_offsets = np.frombuffer(table, dtype='<u8', count=count + 1)
+    blob = table[name_offsets.nbytes:]
+    names = [blob[name_offsets[i]:name_offsets[i + 1]].decode('utf-8') for i in range(count)]
+
+    info = GalleryFileInfo(path, dtype_name, dim, count, os.path.getsize(path))
+    return encodings, names, info
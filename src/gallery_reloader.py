@@ -0,0 +1,123 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from enrollment import enroll_directory, list_authorized_images
+
+
+def directory_snapshot(faces_dir: str) -> Dict[str, Tuple[int, int]]:
+    """Tamaño y fecha de modificación (ns) de cada imagen autorizada del directorio"""
+    snapshot = {}
+    for filename in list_authorized_images(faces_dir):
+        try:
+            stat = os.stat(os.path.join(faces_dir, filename))
+        except FileNotFoundError:
+            continue
+        snapshot[filename] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+class GalleryReloader(threading.Thread):
+    """
+    Recarga la galería del detector cuando cambia el directorio de autorizados
+
+    Revisa el directorio cada poll_interval segundos y espera a que dos
+    revisiones seguidas coincidan (para no leer una imagen a medio copiar).
+    La galería nueva se arma en este hilo: las imágenes sin cambios salen de
+    la caché y solo se procesan las nuevas o modificadas. Luego se reemplaza
+    de una vez con FaceDetector.replace_gallery, sin detener el reconocimiento.
+
+    Solo actualiza el detector de este proceso: un pool de inferencia en
+    procesos separados conserva la galería con la que se inició.
+    """
+
+    def __init__(self, detector, faces_dir: str, cache=None, workers: int = 1,
+                 poll_interval: float = 2.0, logger=None):
+        """
+        Args:
+            detector: FaceDetector cuya galería se mantiene actualizada
+            faces_dir (str): Directorio con las imágenes autorizadas
+            cache: EncodingCache compartida con la carga inicial
+            workers (int): Procesos para codificar las imágenes nuevas
+            poll_interval (float): Segundos entre revisiones del directorio
+            logger: Logger opcional para informar cada recarga
+        """
+        super().__init__(name='recarga-galeria', daemon=True)
+        self.detector = detector
+        self.faces_dir = faces_dir
+        self.cache = cache
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.reloads = 0
+        self.last_report = None
+        self._snapshot = directory_snapshot(faces_dir) if os.path.isdir(faces_dir) else {}
+        self._reload_requested = threading.Event()
+        self._stop_event = threading.Event()
+
+    def request_reload(self):
+        """Pide una recarga inmediata, haya o no cambios detectados"""
+        self._reload_requested.set()
+
+    def run(self):
+        pending_snapshot = None
+        while not self._stop_event.is_set():
+            forced = self._reload_requested.wait(self.poll_interval)
+            if self._stop_event.is_set():
+                break
+            self._reload_requested.clear()
+
+            current = directory_snapshot(self.faces_dir) if os.path.isdir(self.faces_dir) else {}
+            if forced:
+                pending_snapshot = None
+            elif current == self._snapshot:
+                pending_snapshot = None
+                continue
+            elif current != pending_snapshot:
+                # Cambio nuevo: esperar a que el directorio se estabilice
+                pending_snapshot = current
+                continue
+
+            try:
+                self.reload(current)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Error al recargar la galería: {str(e)}")
+            pending_snapshot = None
+
+    def reload(self, snapshot: Optional[Dict[str, Tuple[int, int]]] = None):
+        """
+        Arma una galería nueva con el contenido actual del directorio y la
+        instala en el detector
+
+        Returns:
+            EnrollmentReport: Resumen de la carga
+        """
+        if snapshot is None:
+            snapshot = directory_snapshot(self.faces_dir)
+        previous = self._snapshot
+
+        staging = type(self.detector)()
+        staging.gallery = self.detector.gallery.empty_like()
+        report = enroll_directory(staging, self.faces_dir, workers=self.workers,
+                                  cache=self.cache, verbose=False)
+        self.detector.replace_gallery(staging.gallery)
+
+        self._snapshot = snapshot
+        self.reloads += 1
+        self.last_report = report
+        if self.logger is not None:
+            added = len(set(snapshot) - set(previous))
+            removed = len(set(previous) - set(snapshot))
+            modified = sum(1 for name in set(snapshot) & set(previous) if snapshot[name] != previous[name])
+            self.logger.info(
+                f"Galería recargada: {len(staging.gallery)} rostros "
+                f"({added} nuevas, {modified} modificadas, {removed} eliminadas; "
+                f"{report.processed} procesadas en {report.elapsed:.2f}s)"
+            )
+            for failure in report.failures:
+                self.logger.warning(f"No se pudo cargar {os.path.basename(failure.image_path)}: {failure.error}")
+        return report
+
+    def stop(self):
+        self._stop_event.set()
+        self._reload_requested.set()
@@ -1,9 +1,20 @@
 import cv2
 import os
 from face_detector import FaceDetector
-from text_recognizer import TextRecognizer
+from face_locators import create_face_locator
+from face_tracker import FaceTracker
 from database_manager import DatabaseManager
-import uuid
+from encoding_cache import EncodingCache
+from enrollment import enroll_directory
+from pipeline import AccessDeduplicator, RecognitionPipeline
+from snapshot_writer import SnapshotWriter
+from metrics import ACCESSES, REGISTRY, LogAggregator, MetricsServer
+from gallery_reloader import GalleryReloader
+from unknown_faces import UnknownFaceRecorder
+from retention import AccessArchiver, DailyLogHandler, RetentionJob
+from motion_gate import MotionGate
+import signal
+import time
 from datetime import datetime, timedelta
 import logging
 
@@ -20,205 +31,325 @@ def setup_logger():
         handlers=[
             # Handler para mostrar en consola
             logging.StreamHandler(),
-            # Handler para guardar en archivo
-            logging.FileHandler(os.path.join(log_dir, f'access_log_{datetime.now().strftime("%Y%m%d")}.txt'))
+            # Handler para guardar en archivo (uno por día, cambia a medianoche)
+            DailyLogHandler(log_dir)
         ]
     )
     return logging.getLogger('AccessControl')
 
-def is_numeric_filename(filename):
-    """Verifica si el nombre del archivo (sin extensión) contiene solo números"""
-    name = os.path.splitext(filename)[0]
-    return name.isdigit()
+def persist_access(db_manager, snapshot_writer, face_image, name, current_time, logger):
+    """
+    Guarda la imagen del rostro y registra el acceso (se ejecuta en la etapa de persistencia)
+    
+    Args:
+        db_manager: Instancia de DatabaseManager
+        snapshot_writer: Instancia de SnapshotWriter (la imagen se escribe en este hilo,
+            que ya está fuera del camino de captura)
+        face_image: Recorte del rostro
+        name: Nombre de la persona reconocida
+        current_time: Momento en que se detectó el rostro
+        logger: Logger de la aplicación
+    """
+    face_image_path = snapshot_writer.write(face_image, name, current_time)
+    
+    # Registrar el acceso en la base de datos
+    db_manager.register_access(
+        name=name,
+        person_id=name,  # Usamos el nombre como ID
+        face_image_path=face_image_path
+    )
+    
+    ACCESSES.inc()
+    
+    # Log detallado del registro
+    logger.info(f"Nuevo registro de acceso - {name}")
+    logger.info(f"  ├─ ID: {name}")
+    logger.info(f"  ├─ Hora: {current_time.strftime('%H:%M:%S')}")
+    logger.info(f"  └─ Imagen: {os.path.basename(face_image_path)}")
 
-def save_face_image(frame, face_location, name):
+def draw_face(frame, face_location, display_text, color):
     """
-    Guarda la imagen recortada del rostro
+    Dibuja el recuadro y la etiqueta de un rostro sobre el frame
     
     Args:
-        frame: Imagen completa
+        frame: Imagen sobre la que se dibuja
         face_location: Tupla (top, right, bottom, left) con la ubicación del rostro
-        name: Nombre de la persona para el archivo
-        
-    Returns:
-        str: Ruta donde se guardó la imagen
+        display_text: Texto a mostrar debajo del recuadro
+        color: Color BGR del recuadro y del fondo del texto
     """
     top, right, bottom, left = face_location
-    face_image = frame[top:bottom, left:right]
     
-    # Crear directorio si no existe
-    faces_dir = os.path.join('data', 'detected_faces')
-    os.makedirs(faces_dir, exist_ok=True)
+    # Calcular el padding para hacer el cuadrado más grande
+    height = bottom - top
+    width = right - left
+    padding_v = int(height * 0.2)  # 20% de padding vertical
+    padding_h = int(width * 0.2)   # 20% de padding horizontal
+    
+    # Ajustar las coordenadas con padding
+    top_pad = max(0, top - padding_v)
+    bottom_pad = min(frame.shape[0], bottom + padding_v)
+    left_pad = max(0, left - padding_h)
+    right_pad = min(frame.shape[1], right + padding_h)
     
-    # Generar nombre único para la imagen
-    filename = f"{name}_{uuid.uuid4().hex[:8]}.jpg"
-    image_path = os.path.join(faces_dir, filename)
+    # Dibujar un rectángulo alrededor del rostro
+    cv2.rectangle(frame, (left_pad, top_pad), (right_pad, bottom_pad), color, 3)
     
-    # Guardar imagen
-    cv2.imwrite(image_path, face_image)
-    return image_path
+    # Dibujar el texto
+    text_size = 0.8
+    text_thickness = 2
+    
+    # Calcular el tamaño del texto para el fondo
+    (text_width, text_height), _ = cv2.getTextSize(display_text, 
+                                                 cv2.FONT_HERSHEY_DUPLEX, 
+                                                 text_size, 
+                                                 text_thickness)
+    
+    # Dibujar el fondo del texto
+    text_bg_height = int(text_height + 10)
+    cv2.rectangle(frame, 
+                 (left_pad, bottom_pad), 
+                 (left_pad + text_width + 10, bottom_pad + text_bg_height), 
+                 color, 
+                 cv2.FILLED)
+    
+    # Dibujar el texto
+    cv2.putText(frame, 
+               display_text, 
+               (left_pad + 5, bottom_pad + text_height + 2), 
+               cv2.FONT_HERSHEY_DUPLEX, 
+               text_size, 
+               (255, 255, 255), 
+               text_thickness)
 
-def load_authorized_faces(detector, faces_dir):
-    """Carga todas las imágenes de personas autorizadas desde el directorio"""
-    text_recognizer = TextRecognizer()
+def format_pipeline_metrics(metrics):
+    """Resume en una línea la profundidad de colas y la latencia de cada etapa"""
+    colas = ', '.join(f"{name}={depth}" for name, depth in metrics['colas'].items())
+    etapas = ', '.join(
+        f"{name}={stats['avg_ms']:.1f}ms (n={stats['count']}, descartados={stats['dropped']})"
+        for name, stats in metrics['etapas'].items()
+    )
+    return f"Colas: {colas} | Etapas: {etapas}"
+
+def load_authorized_faces(detector, faces_dir, cache=None, workers=1):
+    """
+    Carga todas las imágenes de personas autorizadas desde el directorio
     
-    for filename in os.listdir(faces_dir):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            image_path = os.path.join(faces_dir, filename)
-            
-            # Si el nombre del archivo es numérico, buscar credencial
-            if is_numeric_filename(filename):
-                print(f"Procesando imagen con nombre numérico: {filename}")
-                image = cv2.imread(image_path)
-                if image is not None:
-                    # Intentar extraer texto de la credencial
-                    extracted_text = text_recognizer.extract_text(image)
-                    if extracted_text:
-                        person_name = extracted_text
-                        print(f"Texto extraído de credencial: {person_name}")
-                    else:
-                        person_name = os.path.splitext(filename)[0]
-                        print(f"No se encontró credencial, usando nombre del archivo: {person_name}")
-                else:
-                    person_name = os.path.splitext(filename)[0]
-                    print(f"Error al leer la imagen, usando nombre del archivo: {person_name}")
-            else:
-                # Si el nombre tiene letras, usar el nombre del archivo
-                person_name = os.path.splitext(filename)[0]
-                print(f"Usando nombre del archivo: {person_name}")
-            
-            # Cargar la imagen para reconocimiento facial
-            if detector.load_authorized_face(image_path, person_name):
-                print(f"Imagen cargada exitosamente como: {person_name}")
-            else:
-                print(f"Error al cargar la imagen: {person_name}")
+    Args:
+        detector: Instancia de FaceDetector
+        faces_dir: Directorio con las imágenes autorizadas
+        cache: EncodingCache opcional; solo se procesan las imágenes nuevas o modificadas
+        workers: Cantidad de procesos para procesar las imágenes en paralelo
+        
+    Returns:
+        EnrollmentReport: Resumen de la carga
+    """
+    return enroll_directory(detector, faces_dir, workers=workers, cache=cache)
 
 def main():
     # Configurar logger
     logger = setup_logger()
     logger.info("=== Sistema de Control de Acceso Iniciado ===")
     
+    # Escala de detección (1.0 = resolución nativa) y región de interés
+    # opcional (x, y, ancho, alto), p. ej. la zona de la puerta
+    DETECTION_SCALE = 1.0
+    DETECTION_ROI = None
+    # Detector que ubica los rostros: 'hog' (dlib), o 'haar', 'yunet' y 'ssd'
+    # de OpenCV con los modelos en data/models; el encoding es siempre de dlib
+    DETECTOR_BACKEND = 'hog'
+    
     # Inicializar el detector y la base de datos
-    detector = FaceDetector()
+    detector = FaceDetector(detection_scale=DETECTION_SCALE, roi=DETECTION_ROI,
+                            locator=create_face_locator(DETECTOR_BACKEND))
     db_manager = DatabaseManager()
     
-    # Diccionario para almacenar el último tiempo de registro por persona
-    last_register_time = {}
+    # Imágenes de rostros: calidad JPEG, tamaño máximo y retención
+    snapshot_writer = SnapshotWriter(quality=85, max_size=256, max_age_days=90,
+                                     max_total_bytes=5 * 1024 ** 3)
+    
     # Tiempo mínimo entre registros (10 minutos)
     MIN_TIME_BETWEEN_REGISTERS = timedelta(minutes=10)
+    # Último tiempo de registro por persona
+    deduplicator = AccessDeduplicator(MIN_TIME_BETWEEN_REGISTERS)
+    # Registro de personas no autorizadas (requiere seguimiento): cada desconocido
+    # se agrupa en un visitante con una sola imagen y se registra como mucho una
+    # vez por intervalo; distancia máxima entre encodings del mismo visitante
+    UNKNOWN_RECORDING_ENABLED = True
+    UNKNOWN_CLUSTER_THRESHOLD = 0.5
+    # Hilos de inferencia (se deja un núcleo libre para captura y render)
+    INFERENCE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+    # Seguimiento entre frames: detección completa solo cada N frames
+    TRACKING_ENABLED = True
+    DETECT_INTERVAL = 10
+    # Filtro de movimiento: sin movimiento en la región de interés (y sin rostros
+    # en pantalla) no se detecta, salvo una vez cada MOTION_HEARTBEAT segundos.
+    # MOTION_SENSITIVITY es la fracción de la región que debe cambiar
+    MOTION_GATING_ENABLED = True
+    MOTION_SENSITIVITY = 0.01
+    MOTION_HEARTBEAT = 5.0
+    # Cada cuántos segundos se informan las métricas del pipeline
+    METRICS_LOG_INTERVAL = 60
+    # Recarga de la galería al agregar, modificar o borrar imágenes autorizadas
+    # (también con `kill -HUP <pid>`)
+    GALLERY_RELOAD_ENABLED = True
+    GALLERY_POLL_INTERVAL = 2.0
+    # Archivado: los accesos de meses que terminaron hace más de estos días pasan
+    # a data/archive (un SQLite y un ZIP de imágenes por mes, consultables desde
+    # la API) y los logs de días anteriores se comprimen; se revisa cada hora
+    RETENTION_ENABLED = True
+    ARCHIVE_AFTER_DAYS = 60
+    # Métricas en formato Prometheus en http://localhost:9108/metrics
+    METRICS_ENABLED = True
+    METRICS_PORT = 9108
+    # Interfaz donde escucha el servidor de métricas; '0.0.0.0' lo expone a la red
+    METRICS_HOST = '127.0.0.1'
+    # Los avisos repetidos (p. ej. un desconocido frente a la cámara) se
+    # resumen en una línea por intervalo
+    unknown_log = LogAggregator(logger, interval=METRICS_LOG_INTERVAL)
     
     # Cargar rostros autorizados
     faces_dir = os.path.join('data', 'authorized_faces')
     logger.info("Cargando rostros autorizados...")
-    load_authorized_faces(detector, faces_dir)
+    encoding_cache = EncodingCache()
+    load_authorized_faces(detector, faces_dir, cache=encoding_cache, workers=os.cpu_count() or 1)
+    logger.info(f"Rostros autorizados cargados: {len(detector.gallery)} "
+                f"({detector.gallery.identity_count} personas)")
+    
+    gallery_reloader = None
+    if GALLERY_RELOAD_ENABLED:
+        gallery_reloader = GalleryReloader(detector, faces_dir, cache=encoding_cache,
+                                           workers=os.cpu_count() or 1,
+                                           poll_interval=GALLERY_POLL_INTERVAL, logger=logger)
+        gallery_reloader.start()
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: gallery_reloader.request_reload())
+    
+    retention_job = None
+    if RETENTION_ENABLED:
+        retention_job = RetentionJob(AccessArchiver(db_manager.db_path, faces_dir=snapshot_writer.base_dir,
+                                                    keep_days=ARCHIVE_AFTER_DAYS), logger=logger)
+        retention_job.start()
     
     # Iniciar la webcam
     logger.info("Iniciando webcam... Presiona 'q' para salir.")
     cap = cv2.VideoCapture(0)
     
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            logger.error("Error al capturar imagen de la webcam")
-            break
-            
-        # Detectar rostros en el frame
-        results = detector.detect_faces(frame)
-        
-        # Tiempo actual
-        current_time = datetime.now()
-        
-        # Dibujar resultados
-        for (top, right, bottom, left), name in results:
-            # Definir color basado en si el rostro es reconocido o no
-            if name == "Desconocido":
-                display_text = "No autorizado"
-                color = (0, 0, 255)  # Rojo en BGR
-                logger.warning(f"Persona no autorizada detectada - {current_time.strftime('%H:%M:%S')}")
-            else:
-                color = (0, 255, 0)  # Verde en BGR
-                display_text = name
-                
-                # Solo procesar registro para personas autorizadas
-                # Verificar si ha pasado suficiente tiempo desde el último registro
-                last_time = last_register_time.get(name)
-                should_register = last_time is None or (current_time - last_time) >= MIN_TIME_BETWEEN_REGISTERS
-                
-                if should_register:
-                    # Guardar imagen del rostro
-                    face_location = (top, right, bottom, left)
-                    face_image_path = save_face_image(frame, face_location, name)
-                    
-                    # Registrar el acceso en la base de datos
-                    db_manager.register_access(
-                        name=name,
-                        person_id=name,  # Usamos el nombre como ID
-                        face_image_path=face_image_path
-                    )
-                    
-                    # Actualizar el tiempo del último registro
-                    last_register_time[name] = current_time
-                    
-                    # Log detallado del registro
-                    logger.info(f"Nuevo registro de acceso - {name}")
-                    logger.info(f"  ├─ ID: {name}")
-                    logger.info(f"  ├─ Hora: {current_time.strftime('%H:%M:%S')}")
-                    logger.info(f"  └─ Imagen: {os.path.basename(face_image_path)}")
-                elif last_time is not None:
-                    # Calcular tiempo restante para próximo registro
-                    time_until_next = (last_time + MIN_TIME_BETWEEN_REGISTERS - current_time).seconds
-                    minutes = time_until_next // 60
-                    seconds = time_until_next % 60
-                    logger.debug(f"Esperando {minutes}m {seconds}s para próximo registro de {name}")
-            
-            # Calcular el padding para hacer el cuadrado más grande
-            height = bottom - top
-            width = right - left
-            padding_v = int(height * 0.2)  # 20% de padding vertical
-            padding_h = int(width * 0.2)   # 20% de padding horizontal
+    # Pipeline por etapas: captura en su propio hilo, inferencia en paralelo
+    # y guardado asíncrono; siempre se muestra el resultado más reciente
+    unknown_recorder = None
+    if TRACKING_ENABLED and UNKNOWN_RECORDING_ENABLED:
+        unknown_recorder = UnknownFaceRecorder(db_manager, snapshot_writer, threshold=UNKNOWN_CLUSTER_THRESHOLD,
+                                               min_interval=MIN_TIME_BETWEEN_REGISTERS, logger=logger)
+        logger.info(f"Visitantes desconocidos recientes: {len(unknown_recorder)}")
+    if TRACKING_ENABLED:
+        # El seguimiento procesa los frames en orden, con un único worker
+        recognizer = FaceTracker(detector, detect_interval=DETECT_INTERVAL,
+                                 unknown_handler=unknown_recorder.observe if unknown_recorder is not None else None)
+        workers = 1
+    else:
+        recognizer = detector
+        workers = INFERENCE_WORKERS
+    motion_gate = None
+    if MOTION_GATING_ENABLED:
+        recognizer = motion_gate = MotionGate(recognizer, roi=DETECTION_ROI, min_changed=MOTION_SENSITIVITY,
+                                              heartbeat=MOTION_HEARTBEAT)
+    pipeline = RecognitionPipeline(cap, recognizer, workers=workers, logger=logger)
+    metrics_server = None
+    if METRICS_ENABLED:
+        REGISTRY.enabled = True
+        REGISTRY.gauge('queue_depth', "Elementos en cada cola del pipeline", ('cola',),
+                       function=lambda: pipeline.metrics()['colas'])
+        REGISTRY.gauge('gallery_size', "Identidades cargadas en la galería", function=lambda: len(detector.gallery))
+        try:
+            metrics_server = MetricsServer(host=METRICS_HOST, port=METRICS_PORT).start()
+            logger.info(f"Métricas disponibles en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            logger.error(f"No se pudo iniciar el servidor de métricas: {str(e)}")
+    pipeline.start()
+    last_seq = 0
+    last_metrics_log = time.monotonic()
+    
+    try:
+        while True:
+            result = pipeline.next_result(last_seq, timeout=0.1)
+            if result is None:
+                if pipeline.finished:
+                    if pipeline.capture.failed:
+                        logger.error("Error al capturar imagen de la webcam")
+                    break
+                # Mantener la ventana respondiendo mientras no hay resultados nuevos
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+                continue
             
-            # Ajustar las coordenadas con padding
-            top_pad = max(0, top - padding_v)
-            bottom_pad = min(frame.shape[0], bottom + padding_v)
-            left_pad = max(0, left - padding_h)
-            right_pad = min(frame.shape[1], right + padding_h)
+            last_seq = result.frame.seq
+            frame = result.frame.image
+            render_start = time.perf_counter()
             
-            # Dibujar un rectángulo alrededor del rostro
-            cv2.rectangle(frame, (left_pad, top_pad), (right_pad, bottom_pad), color, 3)
+            # Tiempo actual
+            current_time = datetime.now()
             
-            # Dibujar el texto
-            text_size = 0.8
-            text_thickness = 2
+            # Dibujar resultados
+            for (top, right, bottom, left), name in result.faces:
+                # Definir color basado en si el rostro es reconocido o no
+                if name == "Desconocido":
+                    display_text = "No autorizado"
+                    color = (0, 0, 255)  # Rojo en BGR
+                    unknown_log.warning('desconocido', f"Persona no autorizada detectada - {current_time.strftime('%H:%M:%S')}")
+                else:
+                    color = (0, 255, 0)  # Verde en BGR
+                    display_text = name
+                    
+                    # Solo procesar registro para personas autorizadas
+                    # Verificar si ha pasado suficiente tiempo desde el último registro
+                    should_register, time_remaining = deduplicator.check(name, current_time)
+                    
+                    if should_register:
+                        # Guardar imagen y registro en segundo plano (se copia el
+                        # recorte porque el frame se dibuja a continuación)
+                        face_image = frame[top:bottom, left:right].copy()
+                        pipeline.persistence.submit(persist_access, db_manager, snapshot_writer,
+                                                    face_image, name, current_time, logger)
+                    elif time_remaining is not None:
+                        # Calcular tiempo restante para próximo registro
+                        time_until_next = time_remaining.seconds
+                        minutes = time_until_next // 60
+                        seconds = time_until_next % 60
+                        logger.debug(f"Esperando {minutes}m {seconds}s para próximo registro de {name}")
+                
+                draw_face(frame, (top, right, bottom, left), display_text, color)
             
-            # Calcular el tamaño del texto para el fondo
-            (text_width, text_height), _ = cv2.getTextSize(display_text, 
-                                                         cv2.FONT_HERSHEY_DUPLEX, 
-                                                         text_size, 
-                                                         text_thickness)
+            # Mostrar el frame
+            cv2.imshow('Reconocimiento Facial', frame)
+            render_time = time.perf_counter() - render_start
+            pipeline.stats['render'].record(render_time)
+            REGISTRY.stage_seconds.observe(render_time, stage='render')
             
-            # Dibujar el fondo del texto
-            text_bg_height = int(text_height + 10)
-            cv2.rectangle(frame, 
-                         (left_pad, bottom_pad), 
-                         (left_pad + text_width + 10, bottom_pad + text_bg_height), 
-                         color, 
-                         cv2.FILLED)
+            # Informar periódicamente el estado del pipeline
+            if time.monotonic() - last_metrics_log >= METRICS_LOG_INTERVAL:
+                logger.info(format_pipeline_metrics(pipeline.metrics()))
+                if motion_gate is not None:
+                    logger.info(f"Frames sin movimiento (detección omitida): {motion_gate.skipped} de "
+                                f"{motion_gate.frames} ({motion_gate.skipped_ratio:.1%})")
+                last_metrics_log = time.monotonic()
             
-            # Dibujar el texto
-            cv2.putText(frame, 
-                       display_text, 
-                       (left_pad + 5, bottom_pad + text_height + 2), 
-                       cv2.FONT_HERSHEY_DUPLEX, 
-                       text_size, 
-                       (255, 255, 255), 
-                       text_thickness)
-        
-        # Mostrar el frame
-        cv2.imshow('Reconocimiento Facial', frame)
-        
-        # Salir si se presiona 'q'
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            # Salir si se presiona 'q'
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        # Detener las etapas; los registros pendientes se guardan antes de salir
+        if gallery_reloader is not None:
+            gallery_reloader.stop()
+        if retention_job is not None:
+            retention_job.stop()
+        pipeline.stop()
+        if unknown_recorder is not None:
+            unknown_recorder.flush()
+        snapshot_writer.close()
+        db_manager.close()
+        unknown_log.flush()
+        if metrics_server is not None:
+            metrics_server.stop()
     
     logger.info("=== Sistema de Control de Acceso Finalizado ===")
     cap.release()
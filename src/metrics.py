@@ -0,0 +1,324 @@
+import bisect
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Límites (en segundos) de los histogramas de latencia: de 0.5 ms a 5 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class _Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str, labels: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    @abstractmethod
+    def samples(self):
+        """Muestras a exportar: tuplas (sufijo, nombres de etiquetas, valores, valor)"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {value}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Contador monótono, opcionalmente con etiquetas"""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', self.labels, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    Valor instantáneo; puede calcularse al exportar con una función, que
+    devuelve un número o, si el gauge tiene etiquetas, un dict {valor: número}
+    """
+    kind = 'gauge'
+
+    def __init__(self, *args, function: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            if isinstance(value, dict):
+                return [('', self.labels, key if isinstance(key, tuple) else (key,), v)
+                        for key, v in value.items()]
+            return [('', (), (), value)]
+        with self._lock:
+            return [('', self.labels, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo de latencias"""
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        samples = []
+        bucket_labels = self.labels + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    samples.append(('_bucket', bucket_labels, key + (le,), cumulative))
+                samples.append(('_sum', self.labels, key, total))
+                samples.append(('_count', self.labels, key, count))
+        return samples
+
+
+class _Span:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas en memoria con exportación en formato Prometheus
+
+    Deshabilitado, cada span y cada contador es una única comprobación de un
+    booleano, así la instrumentación puede quedar en los caminos críticos.
+    Las métricas son por proceso: lo que se mide dentro de un pool de
+    procesos no aparece en el registro del proceso principal.
+    """
+
+    def __init__(self, enabled: bool = False, namespace: str = 'reconocimiento'):
+        self.enabled = enabled
+        self.namespace = namespace
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.stage_seconds = self.histogram('stage_seconds', "Latencia por etapa del procesamiento", ('stage',))
+
+    def _get_or_create(self, cls, name: str, help_text: str, labels: Sequence[str], **kwargs):
+        full_name = f"{self.namespace}_{name}" if self.namespace else name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(self, full_name, help_text, labels, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self._get_or_create(Gauge, name, help_text, labels)
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def span(self, stage: str):
+        """
+        Mide la duración de un bloque en el histograma de etapas
+
+        Uso:
+            with REGISTRY.span('encoding'):
+                ...
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self.stage_seconds, {'stage': stage})
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# Registro compartido por los módulos del reconocedor; se habilita al iniciar
+REGISTRY = MetricsRegistry()
+
+FRAMES = REGISTRY.counter('frames_total', "Frames capturados")
+FRAMES_DROPPED = REGISTRY.counter('frames_dropped_total', "Frames descartados antes de procesarse")
+FACES = REGISTRY.counter('faces_total', "Rostros detectados por resultado", ('result',))
+ACCESSES = REGISTRY.counter('accesses_registered_total', "Accesos registrados")
+UNKNOWN_VISITORS = REGISTRY.counter('unknown_visitors_total', "Visitantes desconocidos nuevos")
+UNKNOWN_VISITS = REGISTRY.counter('unknown_visits_total', "Visitas de desconocidos registradas")
+MOTION_FRAMES = REGISTRY.counter('motion_gate_frames_total', "Frames evaluados por el filtro de movimiento por resultado",
+                                 ('result',))
+SNAPSHOTS = REGISTRY.counter('snapshots_total', "Imágenes de rostros guardadas por resultado", ('result',))
+DB_ROWS = REGISTRY.counter('db_rows_inserted_total', "Accesos insertados en la base")
+
+
+class MetricsServer:
+    """
+    Servidor HTTP mínimo que expone /metrics en un hilo propio
+
+    Por defecto escucha solo en 127.0.0.1; para que lo lea un Prometheus de
+    otra máquina hay que pasar host explícitamente (p. ej. '0.0.0.0').
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = '127.0.0.1', port: int = 9108):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Sin una línea de log por cada scrape
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metricas', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LogAggregator:
+    """
+    Agrupa mensajes repetidos del log
+
+    La primera ocurrencia de cada clave se registra enseguida; las siguientes
+    se cuentan y se resumen en una sola línea como mucho cada interval segundos.
+    """
+
+    def __init__(self, logger, interval: float = 60.0):
+        self.logger = logger
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def log(self, level: int, key: str, message: str):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is not None and now - state[0] < self.interval:
+                # Suprimido: solo se cuenta y se recuerda el último mensaje
+                state[1] += 1
+                state[2] = message
+                return
+            repeated = state[1] if state is not None else 0
+            self._state[key] = [now, 0, message, level]
+        self.logger.log(level, self._summary(message, repeated))
+
+    def _summary(self, message: str, repeated: int) -> str:
+        if not repeated:
+            return message
+        return f"{message} (+{repeated} repeticiones en los últimos {self.interval:.0f}s)"
+
+    def warning(self, key: str, message: str):
+        self.log(logging.WARNING, key, message)
+
+    def info(self, key: str, message: str):
+        self.log(logging.INFO, key, message)
+
+    def flush(self):
+        """Registra el resumen de los mensajes suprimidos pendientes"""
+        with self._lock:
+            pending = [state[1:] for state in self._state.values() if state[1]]
+            for state in self._state.values():
+                state[1] = 0
+        for repeated, message, level in pending:
+            self.logger.log(level, self._summary(message, repeated - 1))
@@ -0,0 +1,129 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+import cv2
+import numpy as np
+from metrics import MOTION_FRAMES, REGISTRY
+
+
+class MotionGate:
+    """
+    Filtro de movimiento previo al reconocimiento
+
+    Cada frame se reduce a escala de grises de width pixeles de ancho (solo
+    la región de interés) y se compara contra un fondo que se actualiza como
+    promedio móvil. La detección completa corre solo si cambió al menos
+    min_changed de la región, si en el frame anterior había rostros (una
+    persona quieta frente a la puerta sigue siendo reconocida) o si pasaron
+    heartbeat segundos desde la última detección. Con la escena vacía el
+    costo por frame es el de reducir y comparar una imagen chica.
+    """
+
+    def __init__(self, recognizer, roi: Optional[Tuple[int, int, int, int]] = None, width: int = 160,
+                 pixel_threshold: int = 25, min_changed: float = 0.01, heartbeat: float = 5.0,
+                 learning_rate: float = 0.05):
+        """
+        Args:
+            recognizer: FaceDetector o FaceTracker (cualquier objeto con detect_faces)
+            roi (tuple, optional): Región de interés (x, y, ancho, alto) donde se busca movimiento
+            width (int): Ancho en pixeles de la imagen reducida que se compara
+            pixel_threshold (int): Diferencia mínima de gris (0-255) para que un pixel cuente como cambio
+            min_changed (float): Fracción de pixeles cambiados a partir de la cual hay movimiento
+                (sensibilidad: más chico detecta movimientos más pequeños)
+            heartbeat (float): Segundos máximos sin detección completa aunque no haya movimiento
+            learning_rate (float): Peso de cada frame en el fondo (más alto se adapta más rápido
+                a cambios de luz, pero absorbe antes a quien se queda quieto)
+        """
+        self.recognizer = recognizer
+        self.roi = roi
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.heartbeat = heartbeat
+        self.learning_rate = learning_rate
+        self.frames = 0
+        self.skipped = 0
+        self.last_changed = 0.0
+        self._background = None
+        self._last_faces = []
+        # Frame al que corresponde _last_faces (con varios workers los resultados llegan desordenados)
+        self._last_faces_frame = 0
+        self._last_detection = None
+        # El fondo depende del orden de los frames: se compara de a uno
+        self._lock = threading.Lock()
+
+    def _region(self, image: np.ndarray) -> np.ndarray:
+        if self.roi is None:
+            return image
+        x, y, w, h = self.roi
+        return image[max(0, y):max(0, y) + h, max(0, x):max(0, x) + w]
+
+    def _changed_fraction(self, image: np.ndarray) -> float:
+        """Fracción de pixeles de la región que difieren del fondo (1.0 si no hay fondo aún)"""
+        region = self._region(image)
+        height, width = region.shape[:2]
+        if height == 0 or width == 0:
+            return 0.0
+        # Saltear pixeles antes de promediar: a 1080p reducir la imagen completa cuesta más que el resto
+        step = max(1, width // (2 * self.width))
+        region = region[::step, ::step]
+        height, width = region.shape[:2]
+        scale = min(1.0, self.width / float(width))
+        small = cv2.resize(region, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            return 1.0
+        difference = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        changed = np.count_nonzero(difference > self.pixel_threshold) / float(difference.size)
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+        return changed
+
+    def should_detect(self, image: np.ndarray) -> bool:
+        """Decide si el frame (BGR) merece la detección completa"""
+        return self._should_detect(image)[0]
+
+    def _should_detect(self, image: np.ndarray) -> Tuple[bool, int]:
+        """should_detect más el número de frame, para ordenar los resultados"""
+        with self._lock, REGISTRY.span('movimiento'):
+            self.frames += 1
+            self.last_changed = self._changed_fraction(image)
+            now = time.monotonic()
+            detect = (
+                self.last_changed >= self.min_changed
+                or bool(self._last_faces)
+                or self._last_detection is None
+                or now - self._last_detection >= self.heartbeat
+            )
+            if detect:
+                self._last_detection = now
+            else:
+                self.skipped += 1
+            MOTION_FRAMES.inc(result='detectado' if detect else 'omitido')
+            return detect, self.frames
+
+    def detect_faces(self, image: np.ndarray) -> List[Tuple[tuple, str]]:
+        """Misma interfaz que FaceDetector.detect_faces; sin movimiento devuelve []"""
+        detect, frame = self._should_detect(image)
+        if not detect:
+            return []
+        faces = self.recognizer.detect_faces(image)
+        with self._lock:
+            # Un resultado atrasado no pisa el de un frame más nuevo
+            if frame > self._last_faces_frame:
+                self._last_faces = faces
+                self._last_faces_frame = frame
+        return faces
+
+    @property
+    def skipped_ratio(self) -> float:
+        """Proporción de frames en los que se omitió la detección"""
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'frames': self.frames,
+            'omitidos': self.skipped,
+            'proporcion_omitidos': self.skipped_ratio,
+        }
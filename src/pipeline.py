@@ -0,0 +1,404 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from metrics import FRAMES, FRAMES_DROPPED, REGISTRY
+
+
+class Frame(NamedTuple):
+    """Frame capturado, numerado en orden de llegada"""
+    seq: int
+    captured_at: float
+    image: Any
+
+
+class InferenceResult(NamedTuple):
+    """Resultado de la detección sobre un frame"""
+    frame: Frame
+    faces: List[Tuple[tuple, str]]
+    finished_at: float
+
+
+class StageStats:
+    """Métricas de una etapa: cantidad procesada, latencias y descartes"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.count = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float):
+        """Registra la latencia (en segundos) de un elemento procesado"""
+        with self._lock:
+            self.count += 1
+            self.total_latency += latency
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_drop(self, amount: int = 1):
+        """Registra elementos descartados por la etapa"""
+        with self._lock:
+            self.dropped += amount
+
+    def snapshot(self) -> Dict[str, float]:
+        """Devuelve una copia de las métricas (latencias en milisegundos)"""
+        with self._lock:
+            avg = self.total_latency / self.count if self.count else 0.0
+            return {
+                'count': self.count,
+                'dropped': self.dropped,
+                'avg_ms': avg * 1000,
+                'last_ms': self.last_latency * 1000,
+                'max_ms': self.max_latency * 1000,
+            }
+
+
+class FrameBuffer:
+    """Buffer acotado de frames: si está lleno descarta el más viejo"""
+
+    def __init__(self, maxsize: int = 2, stats: Optional[StageStats] = None):
+        self._frames = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = stats
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._frames)
+
+    def put(self, frame: Frame):
+        """Agrega un frame, descartando el más viejo si no hay lugar"""
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                FRAMES_DROPPED.inc()
+                if self.stats is not None:
+                    self.stats.record_drop()
+            self._frames.append(frame)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Retira el frame más viejo del buffer; None si se cerró o venció el timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._frames or self._closed, timeout):
+                return None
+            if not self._frames:
+                return None
+            return self._frames.popleft()
+
+    def close(self):
+        """Despierta a los consumidores y deja de entregar frames"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class LatestResult:
+    """Conserva solo el resultado del frame más reciente"""
+
+    def __init__(self, stats: Optional[StageStats] = None):
+        self._result = None
+        self._condition = threading.Condition()
+        self.stats = stats
+
+    def publish(self, result: InferenceResult):
+        """Publica un resultado; se descarta si ya hay uno de un frame posterior"""
+        with self._condition:
+            if self._result is not None and result.frame.seq <= self._result.frame.seq:
+                if self.stats is not None:
+                    self.stats.record_drop()
+                return
+            self._result = result
+            self._condition.notify_all()
+
+    def wait_newer(self, last_seq: int, timeout: Optional[float] = None) -> Optional[InferenceResult]:
+        """Espera un resultado de un frame posterior a last_seq"""
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._result is not None and self._result.frame.seq > last_seq, timeout
+            ):
+                return None
+            return self._result
+
+
+class CaptureThread(threading.Thread):
+    """Lee frames de una fuente de video y los deja en un FrameBuffer"""
+
+    def __init__(self, capture, buffer: FrameBuffer, stats: Optional[StageStats] = None,
+                 pace_fps: Optional[float] = None, name: str = 'captura'):
+        """
+        Args:
+            capture: Fuente con método read() (p. ej. cv2.VideoCapture)
+            buffer (FrameBuffer): Buffer donde se dejan los frames
+            stats (StageStats, optional): Métricas de la etapa de captura
+            pace_fps (float, optional): Limita la lectura a estos frames por segundo
+                (para reproducir archivos de video al ritmo de una cámara)
+            name (str): Nombre del hilo
+        """
+        super().__init__(name=name, daemon=True)
+        self.capture = capture
+        self.buffer = buffer
+        self.stats = stats
+        self.pace_fps = pace_fps
+        self.failed = False
+        self._stop_event = threading.Event()
+        self._seq = 0
+
+    def run(self):
+        interval = 1.0 / self.pace_fps if self.pace_fps else 0.0
+        next_read = time.perf_counter()
+        while not self._stop_event.is_set():
+            if interval:
+                delay = next_read - time.perf_counter()
+                if delay > 0 and self._stop_event.wait(delay):
+                    break
+                next_read = max(next_read + interval, time.perf_counter() - interval)
+            start = time.perf_counter()
+            ret, image = self.capture.read()
+            if not ret:
+                self.failed = True
+                break
+            now = time.perf_counter()
+            if self.stats is not None:
+                self.stats.record(now - start)
+            REGISTRY.stage_seconds.observe(now - start, stage='captura')
+            FRAMES.inc()
+            self._seq += 1
+            self.buffer.put(Frame(self._seq, now, image))
+        self.buffer.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class AccessDeduplicator:
+    """Evita registrar a la misma persona más de una vez por intervalo"""
+
+    def __init__(self, min_interval: timedelta = timedelta(minutes=10)):
+        self.min_interval = min_interval
+        self._last_register_time: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def check(self, name: str, now: datetime) -> Tuple[bool, Optional[timedelta]]:
+        """
+        Verifica si corresponde registrar a una persona y, si es así, marca el registro
+
+        Returns:
+            Tuple[bool, Optional[timedelta]]: Si se debe registrar y, si no, cuánto
+                falta para el próximo registro
+        """
+        with self._lock:
+            last_time = self._last_register_time.get(name)
+            if last_time is None or (now - last_time) >= self.min_interval:
+                self._last_register_time[name] = now
+                return True, None
+            return False, last_time + self.min_interval - now
+
+    def __len__(self) -> int:
+        return len(self._last_register_time)
+
+
+# Detector de cada proceso del pool de inferencia
+_process_detector = None
+
+
+def _init_inference_process(detector):
+    global _process_detector
+    _process_detector = detector
+
+
+def _detect_in_process(image):
+    return _process_detector.detect_faces(image)
+
+
+class InferenceStage:
+    """
+    Pool de inferencia: toma frames del buffer y ejecuta la detección en
+    hasta `workers` frames a la vez, publicando siempre el resultado más nuevo
+
+    Con use_processes=True cada proceso recibe una copia del detector al
+    iniciar, evitando el GIL a costa de copiar cada frame al proceso.
+    """
+
+    def __init__(self, detector, buffer: FrameBuffer, output: LatestResult,
+                 workers: int = 2, use_processes: bool = False,
+                 stats: Optional[StageStats] = None, queue_stats: Optional[StageStats] = None):
+        self.detector = detector
+        self.buffer = buffer
+        self.output = output
+        self.workers = workers
+        self.stats = stats
+        self.queue_stats = queue_stats
+        self._slots = threading.Semaphore(workers)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_inference_process,
+                                                 initargs=(detector,))
+            self._detect = _detect_in_process
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inferencia')
+            self._detect = detector.detect_faces
+        self._dispatcher = threading.Thread(target=self._dispatch, name='despacho', daemon=True)
+        self._done = threading.Event()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def start(self):
+        self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            while True:
+                frame = self.buffer.get(timeout=0.5)
+                if frame is not None or self.buffer.closed:
+                    break
+            if frame is None:
+                break
+            if self.queue_stats is not None:
+                self.queue_stats.record(time.perf_counter() - frame.captured_at)
+            with self._lock:
+                self._in_flight += 1
+            started = time.perf_counter()
+            try:
+                future = self._executor.submit(self._detect, frame.image)
+            except RuntimeError:
+                # El pool ya se cerró
+                with self._lock:
+                    self._in_flight -= 1
+                break
+            future.add_done_callback(lambda f, frame=frame, started=started: self._finish(f, frame, started))
+        self._done.set()
+
+    def _finish(self, future, frame: Frame, started: float):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+        try:
+            faces = future.result()
+        except Exception:
+            if self.stats is not None:
+                self.stats.record_drop()
+            return
+        finished = time.perf_counter()
+        if self.stats is not None:
+            self.stats.record(finished - started)
+        self.output.publish(InferenceResult(frame, faces, finished))
+
+    @property
+    def finished(self) -> bool:
+        """True cuando la fuente se agotó y no quedan frames en proceso"""
+        return self._done.is_set() and self._in_flight == 0
+
+    def stop(self):
+        self.buffer.close()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class PersistenceWorker(threading.Thread):
+    """Ejecuta en segundo plano las tareas de guardado (disco y base de datos)"""
+
+    def __init__(self, stats: Optional[StageStats] = None, logger=None):
+        super().__init__(name='persistencia', daemon=True)
+        self._tasks = queue.Queue()
+        self.stats = stats
+        self.logger = logger
+
+    @property
+    def depth(self) -> int:
+        return self._tasks.qsize()
+
+    def submit(self, task: Callable, *args, **kwargs):
+        """Encola una tarea para ejecutarla fuera del hilo de video"""
+        self._tasks.put((task, args, kwargs))
+
+    def run(self):
+        while True:
+            item = self._tasks.get()
+            if item is None:
+                break
+            task, args, kwargs = item
+            start = time.perf_counter()
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Error al guardar el registro de acceso: {str(e)}")
+            if self.stats is not None:
+                self.stats.record(time.perf_counter() - start)
+
+    def stop(self):
+        """Termina de ejecutar las tareas pendientes y detiene el hilo"""
+        self._tasks.put(None)
+        self.join()
+
+
+class RecognitionPipeline:
+    """
+    Pipeline de reconocimiento por etapas:
+    captura -> buffer acotado -> pool de inferencia -> resultado más reciente,
+    con una etapa de persistencia asíncrona para los registros de acceso
+    """
+
+    def __init__(self, capture, detector, workers: int = 2, buffer_size: int = 2,
+                 use_processes: bool = False, logger=None):
+        self.stats = {
+            'captura': StageStats('captura'),
+            'espera': StageStats('espera'),
+            'inferencia': StageStats('inferencia'),
+            'resultados': StageStats('resultados'),
+            'persistencia': StageStats('persistencia'),
+            'render': StageStats('render'),
+        }
+        self.buffer = FrameBuffer(buffer_size, stats=self.stats['espera'])
+        self.results = LatestResult(stats=self.stats['resultados'])
+        self.capture = CaptureThread(capture, self.buffer, stats=self.stats['captura'])
+        self.inference = InferenceStage(
+            detector, self.buffer, self.results, workers=workers, use_processes=use_processes,
+            stats=self.stats['inferencia'], queue_stats=self.stats['espera']
+        )
+        self.persistence = PersistenceWorker(stats=self.stats['persistencia'], logger=logger)
+
+    def start(self):
+        self.persistence.start()
+        self.inference.start()
+        self.capture.start()
+
+    def next_result(self, last_seq: int, timeout: float = 0.1) -> Optional[InferenceResult]:
+        """Devuelve el resultado más reciente posterior a last_seq (o None)"""
+        return self.results.wait_newer(last_seq, timeout)
+
+    @property
+    def finished(self) -> bool:
+        return self.inference.finished
+
+    def metrics(self) -> Dict[str, Any]:
+        """Profundidad de las colas y latencia de cada etapa"""
+        return {
+            'colas': {
+                'frames': len(self.buffer),
+                'inferencia_en_curso': self.inference.in_flight,
+                'persistencia': self.persistence.depth,
+            },
+            'etapas': {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+    def stop(self):
+        """Detiene la captura y la inferencia, y vacía la cola de persistencia"""
+        self.capture.stop()
+        self.capture.join(timeout=2)
+        self.inference.stop()
+        self.persistence.stop()
@@ -0,0 +1,482 @@
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Formato de ancho fijo de los timestamps (ver database_manager.py)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+ARCHIVE_DIR = os.path.join('data', 'archive')
+LOGS_DIR = os.path.join('data', 'logs')
+LOG_PREFIX = 'access_log_'
+IMAGE_POLICIES = ('zip', 'delete', 'keep')
+
+
+def month_start(month: str) -> str:
+    """Primer instante de un mes 'AAAA-MM' en el formato de la base"""
+    return f"{month}-01 00:00:00.000000"
+
+
+def next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f"{year:04d}-{number:02d}"
+
+
+def archive_path(archive_dir: str, month: str) -> str:
+    """Archivo SQLite con los accesos archivados de un mes"""
+    return os.path.join(archive_dir, f"access_{month.replace('-', '_')}.db")
+
+
+def images_archive_path(archive_dir: str, month: str) -> str:
+    """Archivo ZIP con las imágenes de rostros de un mes"""
+    return os.path.join(archive_dir, f"faces_{month.replace('-', '_')}.zip")
+
+
+class DailyLogHandler(logging.FileHandler):
+    """
+    Escribe el log en un archivo por día (access_log_AAAAMMDD.txt) y cambia
+    de archivo a medianoche, así un proceso que corre varios días no sigue
+    escribiendo en el archivo del día en que se inició
+    """
+
+    def __init__(self, log_dir: str = LOGS_DIR, prefix: str = LOG_PREFIX):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self._day = datetime.now().strftime('%Y%m%d')
+        super().__init__(self._path(self._day))
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.log_dir, f"{self.prefix}{day}.txt")
+
+    def emit(self, record):
+        day = datetime.fromtimestamp(record.created).strftime('%Y%m%d')
+        if day != self._day:
+            # Se llama con el lock del handler tomado: el archivo nuevo se abre al escribir
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = os.path.abspath(self._path(day))
+            self._day = day
+        super().emit(record)
+
+
+def rotate_logs(log_dir: str = LOGS_DIR, max_age_days: Optional[int] = 90, prefix: str = LOG_PREFIX) -> Dict[str, int]:
+    """
+    Comprime con gzip los logs de días anteriores y elimina los más viejos que max_age_days
+
+    Returns:
+        dict: Cantidad de archivos comprimidos y eliminados
+    """
+    stats = {'comprimidos': 0, 'eliminados': 0}
+    if not os.path.isdir(log_dir):
+        return stats
+    today = datetime.now().strftime('%Y%m%d')
+    oldest = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y%m%d') if max_age_days is not None else None
+    for filename in sorted(os.listdir(log_dir)):
+        if not filename.startswith(prefix):
+            continue
+        day = filename[len(prefix):len(prefix) + 8]
+        if not day.isdigit():
+            continue
+        path = os.path.join(log_dir, filename)
+        if oldest is not None and day < oldest:
+            os.remove(path)
+            stats['eliminados'] += 1
+        elif filename.endswith('.txt') and day < today:
+            with open(path, 'rb') as source, gzip.open(path + '.gz.tmp', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+            stats['comprimidos'] += 1
+    return stats
+
+
+class AccessArchiver:
+    """
+    Archiva los accesos viejos en un archivo SQLite por mes
+
+    Un mes se archiva cuando terminó hace más de keep_days días: primero se
+    copian sus filas al archivo del mes, luego se marca como archivado (tabla
+    access_archive, que la API usa para leer esos meses del archivo) y recién
+    después se borran de access_logs y sus imágenes pasan a un ZIP.
+    Las escrituras sobre la base en uso son lotes chicos de batch_size filas,
+    cada uno en su propia transacción y con una pausa entre lotes, así el
+    sistema de reconocimiento nunca queda esperando. Todo el proceso se puede
+    interrumpir y volver a ejecutar.
+    """
+
+    def __init__(self, db_path: str = os.path.join('data', 'access.db'), archive_dir: str = ARCHIVE_DIR,
+                 faces_dir: str = os.path.join('data', 'detected_faces'), keep_days: int = 60,
+                 images: str = 'zip', batch_size: int = 2000, pause: float = 0.05,
+                 vacuum_pages: int = 1000):
+        """
+        Args:
+            db_path (str): Base de datos en uso
+            archive_dir (str): Directorio de los archivos mensuales
+            faces_dir (str): Directorio de las imágenes de rostros (ver SnapshotWriter)
+            keep_days (int): Días que los accesos permanecen en la base en uso
+            images (str): Qué hacer con las imágenes de un mes archivado: 'zip' (se
+                guardan en un ZIP por mes), 'delete' (se borran) o 'keep' (no se tocan)
+            batch_size (int): Filas por transacción sobre la base en uso
+            pause (float): Segundos de pausa entre lotes
+            vacuum_pages (int): Páginas liberadas por paso de VACUUM incremental
+        """
+        if images not in IMAGE_POLICIES:
+            raise ValueError(f"Política de imágenes desconocida: {images} (opciones: {', '.join(IMAGE_POLICIES)})")
+        self.db_path = db_path
+        self.archive_dir = archive_dir
+        self.faces_dir = faces_dir
+        self.keep_days = keep_days
+        self.images = images
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self._archives: Dict[str, sqlite3.Connection] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS access_archive (
+                month TEXT PRIMARY KEY,    -- Mes archivado (AAAA-MM)
+                path TEXT NOT NULL,        -- Archivo SQLite con sus accesos
+                row_count INTEGER NOT NULL,
+                archived_at DATETIME NOT NULL
+            )
+        ''')
+        conn.commit()
+        return conn
+
+    def _archive(self, month: str) -> sqlite3.Connection:
+        """Conexión al archivo de un mes (se crea si no existe)"""
+        conn = self._archives.get(month)
+        if conn is None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            conn = sqlite3.connect(archive_path(self.archive_dir, month))
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS access_logs (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    person_id TEXT,
+                    timestamp DATETIME NOT NULL,
+                    face_image_path TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_access_logs_timestamp ON access_logs (timestamp, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_access_logs_person ON access_logs (person_id, timestamp, id)')
+            conn.commit()
+            self._archives[month] = conn
+        return conn
+
+    def _close_archives(self):
+        for conn in self._archives.values():
+            conn.close()
+        self._archives = {}
+
+    def archived_months(self, conn: sqlite3.Connection) -> List[str]:
+        return [row[0] for row in conn.execute('SELECT month FROM access_archive ORDER BY month')]
+
+    def _image_path(self, month: str, face_image_path: Optional[str]) -> Optional[str]:
+        """Ruta de la imagen de un acceso archivado según la política de imágenes"""
+        if not face_image_path or self.images == 'keep':
+            return face_image_path
+        prefix = os.path.join(self.faces_dir, month[:4], month[5:7]) + os.sep
+        if not face_image_path.startswith(prefix):
+            return face_image_path
+        if self.images == 'delete':
+            return None
+        # La imagen queda dentro del ZIP del mes, con su ruta relativa a faces_dir
+        relative = face_image_path[len(self.faces_dir) + 1:]
+        return os.path.join(images_archive_path(self.archive_dir, month), relative)
+
+    def _copy(self, rows) -> Dict[str, int]:
+        """Inserta filas de access_logs en el archivo de su mes (sin duplicar ids)"""
+        by_month: Dict[str, list] = {}
+        for row_id, name, person_id, timestamp, face_image_path in rows:
+            month = timestamp[:7]
+            by_month.setdefault(month, []).append(
+                (row_id, name, person_id, timestamp, self._image_path(month, face_image_path))
+            )
+        for month, month_rows in by_month.items():
+            archive = self._archive(month)
+            archive.executemany('INSERT OR IGNORE INTO access_logs VALUES (?, ?, ?, ?, ?)', month_rows)
+            archive.commit()
+        return {month: len(month_rows) for month, month_rows in by_month.items()}
+
+    def _pack_images(self, month: str) -> int:
+        """Guarda las imágenes del mes en su ZIP (sin recomprimir los JPEG)"""
+        month_dir = os.path.join(self.faces_dir, month[:4], month[5:7])
+        if not os.path.isdir(month_dir):
+            return 0
+        target = images_archive_path(self.archive_dir, month)
+        packed = 0
+        with zipfile.ZipFile(target + '.tmp', 'w', zipfile.ZIP_STORED) as archive:
+            if os.path.exists(target):
+                # Una ejecución anterior interrumpida: conservar lo ya guardado
+                with zipfile.ZipFile(target) as previous:
+                    for member in previous.namelist():
+                        archive.writestr(member, previous.read(member))
+            existing = set(archive.namelist())
+            for directory, _, filenames in os.walk(month_dir):
+                for filename in sorted(filenames):
+                    path = os.path.join(directory, filename)
+                    member = os.path.relpath(path, self.faces_dir).replace(os.sep, '/')
+                    if member not in existing:
+                        archive.write(path, member)
+                        packed += 1
+        os.replace(target + '.tmp', target)
+        return packed
+
+    def _archive_month(self, conn: sqlite3.Connection, month: str):
+        """Copia un mes al archivo y lo marca como archivado"""
+        start, end = month_start(month), month_start(next_month(month))
+        cursor_ts, cursor_id = start, -1
+        copied = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, name, person_id, timestamp, face_image_path FROM access_logs
+                WHERE (timestamp, id) > (?, ?) AND timestamp < ?
+                ORDER BY timestamp, id LIMIT ?
+            ''', (cursor_ts, cursor_id, end, self.batch_size)).fetchall()
+            if not rows:
+                break
+            self._copy(rows)
+            copied += len(rows)
+            cursor_ts, cursor_id = rows[-1][3], rows[-1][0]
+
+        archive = self._archive(month)
+        archive.execute('ANALYZE')
+        archive.commit()
+        total = archive.execute('SELECT COUNT(*) FROM access_logs').fetchone()[0]
+        conn.execute('''
+            INSERT INTO access_archive (month, path, row_count, archived_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET row_count = excluded.row_count, archived_at = excluded.archived_at
+        ''', (month, archive_path(self.archive_dir, month), total, datetime.now().strftime(TIMESTAMP_FORMAT)))
+        conn.commit()
+
+    def _release_images(self, conn: sqlite3.Connection, month: str) -> int:
+        """
+        Guarda en el ZIP (o descarta) las imágenes de un mes ya archivado, las borra
+        del directorio y actualiza las rutas de los visitantes desconocidos
+
+        Returns:
+            int: Imágenes guardadas en el ZIP
+        """
+        month_dir = os.path.join(self.faces_dir, month[:4], month[5:7])
+        if self.images == 'keep' or not os.path.isdir(month_dir):
+            return 0
+        packed = self._pack_images(month) if self.images == 'zip' else 0
+        prefix = month_dir + os.sep
+        try:
+            visitors = conn.execute(
+                'SELECT id, face_image_path FROM unknown_visitors WHERE face_image_path LIKE ?',
+                (prefix.replace('%', r'\%') + '%',)
+            ).fetchall()
+            conn.executemany('UPDATE unknown_visitors SET face_image_path = ? WHERE id = ?',
+                             [(self._image_path(month, path), visitor_id) for visitor_id, path in visitors])
+            conn.commit()
+        except sqlite3.OperationalError:
+            # Base sin registro de desconocidos
+            conn.rollback()
+        shutil.rmtree(month_dir, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(month_dir))
+        except OSError:
+            # El año todavía tiene otros meses
+            pass
+        return packed
+
+    def _move_archived_rows(self, conn: sqlite3.Connection, boundary: str) -> int:
+        """
+        Borra de access_logs las filas de meses archivados, en lotes
+
+        Cada lote se vuelve a copiar al archivo (sin duplicar), así tampoco se
+        pierden filas que llegaron tarde a un mes ya archivado.
+        """
+        moved = 0
+        while True:
+            rows = conn.execute('''
+                SELECT id, name, person_id, timestamp, face_image_path FROM access_logs
+                WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?
+            ''', (boundary, self.batch_size)).fetchall()
+            if not rows:
+                break
+            self._copy(rows)
+            conn.executemany('DELETE FROM access_logs WHERE id = ?', [(row[0],) for row in rows])
+            conn.commit()
+            moved += len(rows)
+            time.sleep(self.pause)
+        return moved
+
+    def _incremental_vacuum(self, conn: sqlite3.Connection) -> int:
+        """Devuelve al sistema las páginas libres de a vacuum_pages por transacción"""
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            return 0
+        released = 0
+        while True:
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if free == 0:
+                break
+            # executescript ejecuta el pragma hasta el final (execute libera una sola página)
+            conn.executescript(f'PRAGMA incremental_vacuum({self.vacuum_pages})')
+            released += min(free, self.vacuum_pages)
+            time.sleep(self.pause)
+        return released
+
+    def run(self, now: Optional[datetime] = None) -> Dict:
+        """
+        Archiva los meses vencidos, borra sus filas y libera espacio
+
+        Returns:
+            dict: Meses archivados, filas movidas, imágenes guardadas y páginas liberadas
+        """
+        now = now or datetime.now()
+        # Último mes que ya terminó hace más de keep_days días
+        limit = (now - timedelta(days=self.keep_days)).strftime('%Y-%m')
+        stats = {'meses': [], 'filas': 0, 'imagenes': 0, 'paginas_liberadas': 0, 'vacuum_incremental': True}
+        conn = self._connect()
+        try:
+            archived = self.archived_months(conn)
+            boundary = month_start(next_month(archived[-1])) if archived else None
+            while True:
+                oldest = conn.execute(
+                    'SELECT MIN(timestamp) FROM access_logs WHERE timestamp >= ?', (boundary or '',)
+                ).fetchone()[0]
+                if oldest is None or oldest[:7] >= limit:
+                    break
+                month = oldest[:7]
+                self._archive_month(conn, month)
+                stats['meses'].append(month)
+                boundary = month_start(next_month(month))
+            if boundary is not None:
+                stats['filas'] = self._move_archived_rows(conn, boundary)
+            # También los meses de una ejecución anterior que se interrumpió
+            for month in self.archived_months(conn):
+                stats['imagenes'] += self._release_images(conn, month)
+            stats['paginas_liberadas'] = self._incremental_vacuum(conn)
+            stats['vacuum_incremental'] = conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        finally:
+            self._close_archives()
+            conn.close()
+        return stats
+
+    def vacuum(self):
+        """
+        VACUUM completo que además habilita el VACUUM incremental en una base
+        existente. Bloquea la base mientras dura: ejecutar con el sistema detenido.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        finally:
+            conn.close()
+
+
+class RetentionJob(threading.Thread):
+    """
+    Tarea de fondo que archiva los accesos viejos y rota los logs cada interval segundos
+    """
+
+    def __init__(self, archiver: AccessArchiver, interval: float = 3600, initial_delay: float = 60,
+                 log_dir: Optional[str] = LOGS_DIR, log_max_age_days: Optional[int] = 90, logger=None):
+        """
+        Args:
+            archiver: Instancia de AccessArchiver
+            interval (float): Segundos entre ejecuciones
+            initial_delay (float): Segundos de espera antes de la primera ejecución
+            log_dir (str, optional): Directorio de los logs de texto (None para no rotarlos)
+            log_max_age_days (int, optional): Días que se conservan los logs comprimidos
+            logger: Logger opcional para informar cada ejecución
+        """
+        super().__init__(name='retencion', daemon=True)
+        self.archiver = archiver
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self.log_dir = log_dir
+        self.log_max_age_days = log_max_age_days
+        self.logger = logger
+        self.last_stats = None
+        self._stop_event = threading.Event()
+        self._warned_vacuum = False
+
+    def run(self):
+        self._stop_event.wait(self.initial_delay)
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Error en la retención de accesos: {str(e)}")
+            self._stop_event.wait(self.interval)
+
+    def run_once(self) -> Dict:
+        stats = self.archiver.run()
+        if self.log_dir is not None:
+            stats['logs'] = rotate_logs(self.log_dir, self.log_max_age_days)
+        self.last_stats = stats
+        if self.logger is not None:
+            if stats['meses'] or stats['filas']:
+                self.logger.info(f"Accesos archivados: {stats['filas']} filas de {', '.join(stats['meses']) or '-'} "
+                                 f"({stats['imagenes']} imágenes, {stats['paginas_liberadas']} páginas liberadas)")
+            if not stats['vacuum_incremental'] and not self._warned_vacuum:
+                self.logger.warning("La base no tiene VACUUM incremental: ejecutar una vez "
+                                    "'python src/retention.py --vacuum' con el sistema detenido")
+                self._warned_vacuum = True
+        return stats
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archiva los accesos viejos, sus imágenes y los logs")
+    parser.add_argument('--db', default=os.path.join('data', 'access.db'), help="Base de datos en uso")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help="Directorio de los archivos mensuales")
+    parser.add_argument('--faces-dir', default=os.path.join('data', 'detected_faces'),
+                        help="Directorio de las imágenes de rostros")
+    parser.add_argument('--keep-days', type=int, default=60,
+                        help="Días que los accesos permanecen en la base en uso")
+    parser.add_argument('--images', choices=IMAGE_POLICIES, default='zip',
+                        help="Imágenes de los meses archivados: guardarlas en un ZIP, borrarlas o no tocarlas")
+    parser.add_argument('--logs-dir', default=LOGS_DIR, help="Directorio de los logs de texto")
+    parser.add_argument('--log-max-age-days', type=int, default=90, help="Días que se conservan los logs")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="VACUUM completo que habilita el VACUUM incremental (con el sistema detenido)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.db):
+        print(f"No existe la base de datos: {args.db}")
+        return 2
+    archiver = AccessArchiver(args.db, archive_dir=args.archive_dir, faces_dir=args.faces_dir,
+                              keep_days=args.keep_days, images=args.images)
+    if args.vacuum:
+        start = time.perf_counter()
+        archiver.vacuum()
+        print(f"VACUUM completo en {time.perf_counter() - start:.1f}s ({os.path.getsize(args.db) / 1024 ** 2:.1f} MB)")
+
+    start = time.perf_counter()
+    stats = archiver.run()
+    logs = rotate_logs(args.logs_dir, args.log_max_age_days)
+    print(f"Meses archivados: {', '.join(stats['meses']) or 'ninguno'}")
+    print(f"Filas movidas: {stats['filas']} | Imágenes guardadas: {stats['imagenes']} | "
+          f"Páginas liberadas: {stats['paginas_liberadas']}")
+    print(f"Logs comprimidos: {logs['comprimidos']} | eliminados: {logs['eliminados']}")
+    print(f"Tiempo: {time.perf_counter() - start:.2f}s")
+    if not stats['vacuum_incremental']:
+        print("La base no tiene VACUUM incremental; para habilitarlo ejecutar con --vacuum (con el sistema detenido)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
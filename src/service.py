@@ -0,0 +1,377 @@
+import argparse
+import os
+import sys
+import threading
+import time
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from face_detector import FaceDetector, UNKNOWN_NAME
+from face_locators import LOCATOR_TYPES, create_face_locator
+from face_tracker import FaceTracker
+from database_manager import DatabaseManager
+from encoding_cache import EncodingCache
+from snapshot_writer import SnapshotWriter
+from pipeline import AccessDeduplicator, CaptureThread, FrameBuffer, PersistenceWorker, StageStats
+from metrics import REGISTRY, MetricsServer
+from gallery_reloader import GalleryReloader
+from unknown_faces import UnknownFaceRecorder
+from retention import AccessArchiver, RetentionJob
+from motion_gate import MotionGate
+from main import load_authorized_faces, persist_access, setup_logger
+
+
+def open_source(source: str):
+    """Abre una fuente de video: índice de dispositivo, archivo o URL (RTSP/HTTP)"""
+    return cv2.VideoCapture(int(source) if source.isdigit() else source)
+
+
+class Camera:
+    """Estado de una cámara: captura, seguimiento, deduplicación y métricas propias"""
+
+    def __init__(self, camera_id: str, source: str, recognizer, min_interval: timedelta,
+                 buffer_size: int = 1, pace_files: bool = True):
+        self.camera_id = camera_id
+        self.source = source
+        self.recognizer = recognizer
+        self.deduplicator = AccessDeduplicator(min_interval)
+        self.capture = open_source(source)
+        if not self.capture.isOpened():
+            raise RuntimeError(f"No se pudo abrir la fuente de video: {source}")
+
+        # Los archivos se reproducen a su velocidad nominal, como una cámara
+        pace_fps = None
+        if pace_files and not source.isdigit() and os.path.exists(source):
+            pace_fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+
+        self.stats = {
+            'captura': StageStats('captura'),
+            'espera': StageStats('espera'),
+            'inferencia': StageStats('inferencia'),
+        }
+        self.buffer = FrameBuffer(buffer_size, stats=self.stats['espera'])
+        self.capture_thread = CaptureThread(self.capture, self.buffer, stats=self.stats['captura'],
+                                            pace_fps=pace_fps, name=f'captura-{camera_id}')
+        self.motion_gate = recognizer if isinstance(recognizer, MotionGate) else None
+        self.in_flight = False
+        self.faces = 0
+        self.unknown = 0
+        self.registered = 0
+
+    @property
+    def finished(self) -> bool:
+        """True cuando la fuente se agotó y no queda nada por procesar"""
+        return self.buffer.closed and len(self.buffer) == 0 and not self.in_flight
+
+    def metrics(self) -> Dict:
+        return {
+            'fuente': self.source,
+            'rostros': self.faces,
+            'desconocidos': self.unknown,
+            'registros': self.registered,
+            'sin_movimiento': self.motion_gate.skipped_ratio if self.motion_gate is not None else None,
+            'etapas': {name: stats.snapshot() for name, stats in self.stats.items()},
+        }
+
+
+class RecognitionService:
+    """
+    Servicio de reconocimiento sin ventana para varias cámaras
+
+    Todas las cámaras comparten un único FaceDetector (una sola copia de la
+    galería en memoria). Un planificador reparte los frames más recientes de
+    cada cámara entre un pool de workers en ronda, con a lo sumo un frame en
+    proceso por cámara, de modo que ninguna cámara acapare la inferencia.
+    Las llamadas a los modelos de dlib que comparten los workers se serializan
+    (ver face_locators.DLIB_LOCK); los registros de acceso se guardan en un
+    hilo de persistencia, fuera de los workers. Con unknown_recorder (y seguimiento) los desconocidos de todas las cámaras
+    se agrupan en visitantes compartidos.
+    """
+
+    def __init__(self, detector: FaceDetector, sources: List[str], db_manager: DatabaseManager,
+                 snapshot_writer: SnapshotWriter, workers: int = 2, tracking: bool = True,
+                 detect_interval: int = 10, min_interval: timedelta = timedelta(minutes=10),
+                 pace_files: bool = True, logger=None, locators: Optional[List] = None,
+                 unknown_recorder: Optional[UnknownFaceRecorder] = None,
+                 motion_sensitivity: Optional[float] = None, motion_heartbeat: float = 5.0):
+        self.detector = detector
+        self.db_manager = db_manager
+        self.snapshot_writer = snapshot_writer
+        self.logger = logger
+        self.workers = workers
+        self.unknown_recorder = unknown_recorder
+        self.cameras = []
+        for index, source in enumerate(sources):
+            # Cada cámara puede ubicar rostros con su propio backend; la galería es la misma
+            camera_detector = detector
+            if locators is not None and locators[index] is not None:
+                camera_detector = detector.with_locator(locators[index])
+            camera_id = f"cam{index}"
+            if tracking:
+                # Los tracks se numeran por cámara: el registro de desconocidos los distingue por fuente
+                unknown_handler = None
+                if unknown_recorder is not None:
+                    unknown_handler = partial(unknown_recorder.observe, source=camera_id)
+                recognizer = FaceTracker(camera_detector, detect_interval=detect_interval,
+                                         unknown_handler=unknown_handler)
+            else:
+                recognizer = camera_detector
+            if motion_sensitivity is not None:
+                # Cada cámara tiene su propio fondo
+                recognizer = MotionGate(recognizer, roi=camera_detector.roi, min_changed=motion_sensitivity,
+                                        heartbeat=motion_heartbeat)
+            self.cameras.append(Camera(camera_id, source, recognizer, min_interval, pace_files=pace_files))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inferencia')
+        self.persistence = PersistenceWorker(stats=StageStats('persistencia'), logger=logger)
+        self._slots = threading.Semaphore(workers)
+        self._stop_event = threading.Event()
+        self._next_camera = 0
+
+    def start(self):
+        self.persistence.start()
+        for camera in self.cameras:
+            camera.capture_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _next_ready(self) -> Optional[tuple]:
+        """Busca en ronda la próxima cámara libre con un frame disponible"""
+        count = len(self.cameras)
+        for offset in range(count):
+            camera = self.cameras[(self._next_camera + offset) % count]
+            if camera.in_flight:
+                continue
+            frame = camera.buffer.get(timeout=0)
+            if frame is not None:
+                self._next_camera = (self._next_camera + offset + 1) % count
+                return camera, frame
+        return None
+
+    def run(self, duration: Optional[float] = None, metrics_interval: float = 60):
+        """
+        Ejecuta el planificador hasta que se agoten las fuentes, se llame a stop()
+        o pase duration segundos
+        """
+        self.start()
+        started = time.monotonic()
+        last_metrics = started
+        try:
+            while not self._stop_event.is_set():
+                if duration is not None and time.monotonic() - started >= duration:
+                    break
+                if all(camera.finished for camera in self.cameras):
+                    break
+                if time.monotonic() - last_metrics >= metrics_interval:
+                    self.log_metrics()
+                    last_metrics = time.monotonic()
+
+                if not self._slots.acquire(timeout=0.1):
+                    continue
+                ready = self._next_ready()
+                if ready is None:
+                    self._slots.release()
+                    time.sleep(0.005)
+                    continue
+                camera, frame = ready
+                camera.in_flight = True
+                camera.stats['espera'].record(time.perf_counter() - frame.captured_at)
+                self._executor.submit(self._process, camera, frame)
+        finally:
+            for camera in self.cameras:
+                camera.capture_thread.stop()
+            self._executor.shutdown(wait=True)
+            # Guardar los accesos que quedaron encolados
+            self.persistence.stop()
+            for camera in self.cameras:
+                camera.capture_thread.join(timeout=2)
+                camera.capture.release()
+            self.log_metrics()
+
+    def _process(self, camera: Camera, frame):
+        try:
+            start = time.perf_counter()
+            faces = camera.recognizer.detect_faces(frame.image)
+            camera.stats['inferencia'].record(time.perf_counter() - start)
+            self._handle_faces(camera, frame.image, faces)
+        except Exception as e:
+            camera.stats['inferencia'].record_drop()
+            if self.logger is not None:
+                self.logger.error(f"[{camera.camera_id}] Error al procesar frame: {str(e)}")
+        finally:
+            camera.in_flight = False
+            self._slots.release()
+
+    def _handle_faces(self, camera: Camera, image, faces):
+        current_time = datetime.now()
+        for (top, right, bottom, left), name in faces:
+            camera.faces += 1
+            if name == UNKNOWN_NAME:
+                camera.unknown += 1
+                continue
+            should_register, _ = camera.deduplicator.check(name, current_time)
+            if should_register:
+                camera.registered += 1
+                if self.logger is not None:
+                    self.logger.info(f"[{camera.camera_id}] Acceso detectado - {name}")
+                # Copia del recorte: no retener el frame completo mientras espera en la cola
+                self.persistence.submit(persist_access, self.db_manager, self.snapshot_writer,
+                                        image[top:bottom, left:right].copy(), name, current_time, self.logger)
+
+    def metrics(self) -> Dict:
+        return {camera.camera_id: camera.metrics() for camera in self.cameras}
+
+    def log_metrics(self):
+        if self.logger is None:
+            return
+        for camera_id, metrics in self.metrics().items():
+            etapas = metrics['etapas']
+            line = (
+                f"[{camera_id}] frames={etapas['captura']['count']} "
+                f"procesados={etapas['inferencia']['count']} "
+                f"descartados={etapas['espera']['dropped']} "
+                f"inferencia={etapas['inferencia']['avg_ms']:.1f}ms "
+                f"rostros={metrics['rostros']} desconocidos={metrics['desconocidos']} "
+                f"registros={metrics['registros']}"
+            )
+            if metrics['sin_movimiento'] is not None:
+                line += f" sin_movimiento={metrics['sin_movimiento']:.1%}"
+            self.logger.info(line)
+        if self.unknown_recorder is not None:
+            stats = self.unknown_recorder.stats()
+            self.logger.info(f"Desconocidos: visitantes={stats['visitantes']} "
+                             f"detecciones={stats['detecciones']} registros={stats['registros']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio de reconocimiento facial para varias cámaras (sin ventana)")
+    parser.add_argument('--source', action='append', required=True,
+                        help="Fuente de video: índice de dispositivo, archivo o URL RTSP (repetible)")
+    parser.add_argument('--detector', action='append', choices=list(LOCATOR_TYPES),
+                        help="Detector de rostros: uno para todas las cámaras o uno por --source, en el mismo orden")
+    parser.add_argument('--models-dir', default=os.path.join('data', 'models'),
+                        help="Directorio de los modelos de OpenCV (haar, yunet, ssd)")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Hilos de inferencia compartidos entre cámaras")
+    parser.add_argument('--no-tracking', action='store_true',
+                        help="Detectar en todos los frames en lugar de seguir rostros entre detecciones")
+    parser.add_argument('--detect-interval', type=int, default=10,
+                        help="Frames entre detecciones completas en modo seguimiento")
+    parser.add_argument('--min-interval', type=float, default=10,
+                        help="Minutos mínimos entre registros de la misma persona por cámara")
+    parser.add_argument('--duracion', type=float, help="Detener el servicio luego de estos segundos")
+    parser.add_argument('--metrics-interval', type=float, default=60,
+                        help="Segundos entre reportes de métricas")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Exponer métricas Prometheus en este puerto (/metrics)")
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help="Interfaz del servidor de métricas (0.0.0.0 lo expone a la red)")
+    parser.add_argument('--no-reload', action='store_true',
+                        help="No recargar la galería cuando cambian las imágenes autorizadas")
+    parser.add_argument('--no-unknown', action='store_true',
+                        help="No registrar a las personas no autorizadas")
+    parser.add_argument('--unknown-threshold', type=float, default=0.5,
+                        help="Distancia máxima entre rostros del mismo visitante desconocido")
+    parser.add_argument('--archive-after-days', type=int, default=60,
+                        help="Archivar los accesos de los meses que terminaron hace más de estos días")
+    parser.add_argument('--no-archive', action='store_true',
+                        help="No archivar accesos viejos ni rotar los logs")
+    parser.add_argument('--motion-sensitivity', type=float, default=0.01,
+                        help="Fracción de la imagen que debe cambiar para correr la detección")
+    parser.add_argument('--heartbeat', type=float, default=5.0,
+                        help="Segundos máximos sin detección aunque no haya movimiento")
+    parser.add_argument('--no-motion-gate', action='store_true',
+                        help="Detectar en todos los frames aunque la escena no cambie")
+    parser.add_argument('--no-pace', action='store_true',
+                        help="Leer los archivos de video lo más rápido posible")
+    args = parser.parse_args(argv)
+    if args.detector and len(args.detector) not in (1, len(args.source)):
+        parser.error("--detector debe indicarse una vez o una vez por cada --source")
+    return args
+
+
+def create_locators(kinds: List[str], count: int, models_dir: str) -> List:
+    """Detectores por cámara; las cámaras con el mismo tipo comparten la instancia"""
+    if len(kinds) == 1:
+        kinds = kinds * count
+    created = {kind: create_face_locator(kind, models_dir=models_dir) for kind in set(kinds)}
+    return [created[kind] for kind in kinds]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logger = setup_logger()
+    logger.info(f"=== Servicio de reconocimiento iniciado ({len(args.source)} cámaras) ===")
+
+    detector = FaceDetector()
+    db_manager = DatabaseManager()
+    snapshot_writer = SnapshotWriter(quality=85, max_size=256, max_age_days=90,
+                                     max_total_bytes=5 * 1024 ** 3)
+
+    faces_dir = os.path.join('data', 'authorized_faces')
+    logger.info("Cargando rostros autorizados...")
+    encoding_cache = EncodingCache()
+    load_authorized_faces(detector, faces_dir, cache=encoding_cache, workers=os.cpu_count() or 1)
+    logger.info(f"Rostros autorizados cargados: {len(detector.gallery)}")
+
+    gallery_reloader = None
+    if not args.no_reload:
+        gallery_reloader = GalleryReloader(detector, faces_dir, cache=encoding_cache,
+                                           workers=os.cpu_count() or 1, logger=logger)
+        gallery_reloader.start()
+
+    retention_job = None
+    if not args.no_archive:
+        retention_job = RetentionJob(AccessArchiver(db_manager.db_path, faces_dir=snapshot_writer.base_dir,
+                                                    keep_days=args.archive_after_days), logger=logger)
+        retention_job.start()
+
+    locators = None
+    if args.detector:
+        locators = create_locators(args.detector, len(args.source), args.models_dir)
+        for index, (source, locator) in enumerate(zip(args.source, locators)):
+            logger.info(f"cam{index} ({source}): detector {locator.name}")
+
+    unknown_recorder = None
+    if not args.no_unknown and not args.no_tracking:
+        unknown_recorder = UnknownFaceRecorder(db_manager, snapshot_writer, threshold=args.unknown_threshold,
+                                               min_interval=timedelta(minutes=args.min_interval), logger=logger)
+
+    service = RecognitionService(
+        detector, args.source, db_manager, snapshot_writer,
+        workers=args.workers, tracking=not args.no_tracking, detect_interval=args.detect_interval,
+        min_interval=timedelta(minutes=args.min_interval), pace_files=not args.no_pace, logger=logger,
+        locators=locators, unknown_recorder=unknown_recorder,
+        motion_sensitivity=None if args.no_motion_gate else args.motion_sensitivity, motion_heartbeat=args.heartbeat,
+    )
+    metrics_server = None
+    if args.metrics_port is not None:
+        REGISTRY.enabled = True
+        REGISTRY.gauge('camera_frames_buffered', "Frames en espera por cámara", ('camara',),
+                       function=lambda: {camera.camera_id: len(camera.buffer) for camera in service.cameras})
+        REGISTRY.gauge('gallery_size', "Identidades cargadas en la galería", function=lambda: len(detector.gallery))
+        metrics_server = MetricsServer(host=args.metrics_host, port=args.metrics_port).start()
+        logger.info(f"Métricas disponibles en http://{args.metrics_host}:{metrics_server.port}/metrics")
+    try:
+        service.run(duration=args.duracion, metrics_interval=args.metrics_interval)
+    except KeyboardInterrupt:
+        service.stop()
+    finally:
+        if gallery_reloader is not None:
+            gallery_reloader.stop()
+        if retention_job is not None:
+            retention_job.stop()
+        if unknown_recorder is not None:
+            unknown_recorder.flush()
+        snapshot_writer.close()
+        db_manager.close()
+        if metrics_server is not None:
+            metrics_server.stop()
+    logger.info("=== Servicio de reconocimiento finalizado ===")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import os
+import shutil
+import threading
+import uuid
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from metrics import REGISTRY, SNAPSHOTS
+
+
+class SnapshotWriter:
+    """
+    Guarda en segundo plano las imágenes de los rostros detectados
+
+    La ruta se decide al instante y el JPEG se codifica en un pool de hilos,
+    así quien registra el acceso nunca espera al disco; quien ya corre fuera
+    del hilo de captura (p. ej. la etapa de persistencia) puede escribir
+    directamente con write(). Las imágenes se
+    reparten en directorios por fecha (AAAA/MM/DD) y una política de
+    retención elimina los días más viejos por antigüedad o por tamaño total.
+    """
+
+    def __init__(self, base_dir: str = os.path.join('data', 'detected_faces'), quality: int = 90,
+                 max_size: Optional[int] = None, workers: int = 2,
+                 max_age_days: Optional[int] = None, max_total_bytes: Optional[int] = None,
+                 retention_interval: float = 3600):
+        """
+        Args:
+            base_dir (str): Directorio raíz de las imágenes
+            quality (int): Calidad JPEG (0-100)
+            max_size (int, optional): Lado máximo en pixeles; los recortes más grandes se reducen
+            workers (int): Hilos de codificación
+            max_age_days (int, optional): Días que se conservan las imágenes
+            max_total_bytes (int, optional): Tamaño total máximo del directorio
+            retention_interval (float): Segundos entre ejecuciones de la retención
+        """
+        self.base_dir = base_dir
+        self.quality = quality
+        self.max_size = max_size
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.retention_interval = retention_interval
+        self.written = 0
+        self.failed = 0
+        self.evicted = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='snapshots')
+        self._pending = 0
+        # Protege los contadores y _created_dirs (los modifican los hilos del pool y la retención)
+        self._lock = threading.Lock()
+        self._retention_lock = threading.Lock()
+        self._created_dirs = set()
+        self._stop_event = threading.Event()
+        self._retention_thread = None
+        if max_age_days is not None or max_total_bytes is not None:
+            self._retention_thread = threading.Thread(target=self._retention_loop,
+                                                      name='retencion-snapshots', daemon=True)
+            self._retention_thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Imágenes encoladas que todavía no se escribieron"""
+        return self._pending
+
+    def _path_for(self, name: str, when: Optional[datetime]):
+        """Directorio del día y ruta única para la imagen de una persona"""
+        when = when or datetime.now()
+        safe_name = name.replace(os.sep, '_').replace(' ', '_')
+        directory = os.path.join(self.base_dir, when.strftime('%Y'), when.strftime('%m'), when.strftime('%d'))
+        return directory, os.path.join(directory, f"{safe_name}_{uuid.uuid4().hex[:8]}.jpg")
+
+    def submit(self, face_image, name: str, when: Optional[datetime] = None) -> str:
+        """
+        Encola el guardado de un recorte de rostro
+
+        Args:
+            face_image: Recorte del rostro en BGR
+            name: Nombre de la persona para el archivo
+            when (datetime, optional): Momento de la detección (define el directorio)
+
+        Returns:
+            str: Ruta donde quedará guardada la imagen
+        """
+        directory, image_path = self._path_for(name, when)
+        with self._lock:
+            self._pending += 1
+        # Copia propia: el frame original se sigue dibujando en el hilo de video
+        self._executor.submit(self._write, directory, image_path, face_image.copy())
+        return image_path
+
+    def write(self, face_image, name: str, when: Optional[datetime] = None) -> str:
+        """
+        Guarda un recorte de rostro en el hilo actual (mismos argumentos que submit)
+
+        Returns:
+            str: Ruta de la imagen
+        """
+        directory, image_path = self._path_for(name, when)
+        with self._lock:
+            self._pending += 1
+        self._write(directory, image_path, face_image)
+        return image_path
+
+    def _write(self, directory: str, image_path: str, face_image):
+        with REGISTRY.span('snapshot'):
+            self._write_image(directory, image_path, face_image)
+
+    def _write_image(self, directory: str, image_path: str, face_image):
+        try:
+            with self._lock:
+                created = directory in self._created_dirs
+            if not created:
+                os.makedirs(directory, exist_ok=True)
+                with self._lock:
+                    self._created_dirs.add(directory)
+
+            if self.max_size is not None:
+                height, width = face_image.shape[:2]
+                longest = max(height, width)
+                if longest > self.max_size:
+                    scale = self.max_size / float(longest)
+                    face_image = cv2.resize(face_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            ok = cv2.imwrite(image_path, face_image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        except Exception as e:
+            ok = False
+            print(f"Error al guardar la imagen {image_path}: {str(e)}")
+        with self._lock:
+            self._pending -= 1
+            if ok:
+                self.written += 1
+            else:
+                self.failed += 1
+        SNAPSHOTS.inc(result='ok' if ok else 'error')
+
+    def _day_directories(self):
+        """Directorios de día existentes, del más viejo al más nuevo, con su fecha"""
+        days = []
+        if not os.path.isdir(self.base_dir):
+            return days
+        for year in sorted(os.listdir(self.base_dir)):
+            year_dir = os.path.join(self.base_dir, year)
+            if not (year.isdigit() and os.path.isdir(year_dir)):
+                continue
+            for month in sorted(os.listdir(year_dir)):
+                month_dir = os.path.join(year_dir, month)
+                if not (month.isdigit() and os.path.isdir(month_dir)):
+                    continue
+                for day in sorted(os.listdir(month_dir)):
+                    day_dir = os.path.join(month_dir, day)
+                    if day.isdigit() and os.path.isdir(day_dir):
+                        try:
+                            days.append((datetime(int(year), int(month), int(day)), day_dir))
+                        except ValueError:
+                            continue
+        return days
+
+    @staticmethod
+    def _directory_size(directory: str) -> int:
+        total = 0
+        for entry in os.scandir(directory):
+            if entry.is_file(follow_symlinks=False):
+                total += entry.stat(follow_symlinks=False).st_size
+        return total
+
+    def _remove_day(self, day_dir: str):
+        try:
+            removed = sum(1 for _ in os.scandir(day_dir))
+        except FileNotFoundError:
+            return
+        shutil.rmtree(day_dir, ignore_errors=True)
+        with self._lock:
+            self.evicted += removed
+            self._created_dirs.discard(day_dir)
+
+    def enforce_retention(self):
+        """
+        Elimina las imágenes que exceden la política de retención
+
+        Primero se borran los días más viejos que max_age_days; luego, si el
+        total sigue superando max_total_bytes, se borran días completos del
+        más viejo al más nuevo (el día actual solo archivo por archivo).
+        """
+        with self._retention_lock:
+            self._enforce_retention()
+
+    def _enforce_retention(self):
+        days = self._day_directories()
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        if self.max_age_days is not None:
+            limit = today - timedelta(days=self.max_age_days)
+            for date, day_dir in list(days):
+                if date < limit:
+                    self._remove_day(day_dir)
+                    days.remove((date, day_dir))
+
+        if self.max_total_bytes is None:
+            return
+
+        sizes = [(date, day_dir, self._directory_size(day_dir)) for date, day_dir in days]
+        total = sum(size for _, _, size in sizes)
+        for date, day_dir, size in sizes:
+            if total <= self.max_total_bytes:
+                break
+            if date < today:
+                self._remove_day(day_dir)
+                total -= size
+                continue
+            # Día actual: borrar los archivos más viejos primero
+            files = sorted(os.scandir(day_dir), key=lambda e: e.stat().st_mtime)
+            for entry in files:
+                if total <= self.max_total_bytes:
+                    break
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+                with self._lock:
+                    self.evicted += 1
+
+    def _retention_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.enforce_retention()
+            except OSError as e:
+                print(f"Error al aplicar la retención de imágenes: {str(e)}")
+            self._stop_event.wait(self.retention_interval)
+
+    def close(self):
+        """Espera a que se escriban las imágenes pendientes y detiene la retención"""
+        self._stop_event.set()
+        self._executor.shutdown(wait=True)
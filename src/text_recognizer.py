@@ -1,13 +1,116 @@
 import pytesseract
 import cv2
+import hashlib
 import numpy as np
+import os
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tesserocr
+    from PIL import Image
+except ImportError:
+    tesserocr = None
+
+# Modos de segmentación que se prueban en orden: línea única y bloque uniforme
+PAGE_SEG_MODES = (7, 6)
+
+class PytesseractBackend:
+    """OCR con el binario de Tesseract (un proceso por llamada)"""
+    name = 'pytesseract'
+
+    def image_to_string(self, image, psm):
+        return pytesseract.image_to_string(image, config=f'--psm {psm} --oem 3', lang='eng')
+
+    def close(self):
+        pass
+
+class TesserocrBackend:
+    """
+    OCR con la API de Tesseract dentro del proceso (tesserocr)
+    
+    Cada hilo conserva su propio handle de la API, que se inicializa una
+    sola vez; así no se lanza un proceso ni se escriben archivos temporales
+    por imagen. Los handles se liberan con close().
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+        self._local = threading.local()
+        self._apis = []
+        self._apis_lock = threading.Lock()
+        # Validar ahora que el idioma está disponible
+        self._api()
+
+    def _api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.lang, oem=tesserocr.OEM.DEFAULT)
+            self._local.api = api
+            with self._apis_lock:
+                self._apis.append(api)
+        return api
+
+    def image_to_string(self, image, psm):
+        api = self._api()
+        api.SetPageSegMode(psm)
+        api.SetImage(Image.fromarray(image))
+        return api.GetUTF8Text()
+
+    def close(self):
+        """Libera los handles de todos los hilos"""
+        with self._apis_lock:
+            apis, self._apis = self._apis, []
+            self._local = threading.local()
+        for api in apis:
+            api.End()
+
+def create_ocr_backend(preferred=None):
+    """
+    Crea el backend de OCR: tesserocr si está instalado, si no pytesseract
+    
+    Args:
+        preferred (str, optional): 'tesserocr' o 'pytesseract' para forzar uno
+    """
+    if preferred != 'pytesseract' and tesserocr is not None:
+        try:
+            return TesserocrBackend()
+        except Exception as e:
+            if preferred == 'tesserocr':
+                raise
+            print(f"No se pudo iniciar tesserocr, se usa pytesseract: {str(e)}")
+    elif preferred == 'tesserocr':
+        raise ImportError("tesserocr no está instalado")
+    return PytesseractBackend()
 
 class TextRecognizer:
-    def __init__(self):
+    def __init__(self, backend=None, cache_size=256, min_card_area=1000):
+        """
+        Inicializa el reconocedor de texto de credenciales
+        
+        Args:
+            backend: Backend de OCR (por defecto, el de create_ocr_backend)
+            cache_size (int): Resultados recordados por contenido de imagen (0 desactiva la caché)
+            min_card_area (int): Área mínima en pixeles de un contorno para considerarlo credencial
+        """
         # Configuración de Tesseract optimizada para texto de credenciales
         self.config = '--psm 7 --oem 3'  # Modo de línea única con mejor motor OCR
-        
+        self.backend = backend if backend is not None else create_ocr_backend()
+        self.cache_size = cache_size
+        self.min_card_area = min_card_area
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Pool de hilos de extract_texts: se crea con el primer lote y se reutiliza,
+        # así cada hilo inicializa su handle de OCR una sola vez
+        self._executor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+
     def find_white_card(self, image):
         """Detecta el cuadrado blanco de la credencial en la imagen"""
         # Convertir a escala de grises
@@ -24,25 +127,30 @@ class TextRecognizer:
         max_area = 0
         
         for cnt in contours:
+            # Descartar primero con cálculos baratos: área y relación de aspecto
+            area = cv2.contourArea(cnt)
+            if area < self.min_card_area or area <= max_area:
+                continue
+            x, y, w, h = cv2.boundingRect(cnt)
+            
+            # Calcular la relación de aspecto
+            aspect_ratio = float(w)/h
+            
+            # Verificar si parece una credencial (relación de aspecto cercana a 1.6)
+            if not 1.4 <= aspect_ratio <= 1.8:
+                continue
+            
             # Aproximar el contorno a un polígono
             peri = cv2.arcLength(cnt, True)
             approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
             
             # Si tiene 4 vértices (es rectangular)
             if len(approx) == 4:
-                area = cv2.contourArea(cnt)
-                x, y, w, h = cv2.boundingRect(cnt)
-                
-                # Calcular la relación de aspecto
-                aspect_ratio = float(w)/h
-                
-                # Verificar si parece una credencial (relación de aspecto cercana a 1.6)
-                if 1.4 <= aspect_ratio <= 1.8 and area > max_area:
-                    # Verificar si el área es predominantemente blanca
-                    roi = gray[y:y+h, x:x+w]
-                    if np.mean(roi) > 180:  # Si el promedio es alto (área blanca)
-                        max_area = area
-                        best_rect = (x, y, w, h)
+                # Verificar si el área es predominantemente blanca
+                roi = gray[y:y+h, x:x+w]
+                if np.mean(roi) > 180:  # Si el promedio es alto (área blanca)
+                    max_area = area
+                    best_rect = (x, y, w, h)
         
         return best_rect
 
@@ -83,11 +191,73 @@ class TextRecognizer:
         
         return text if text else ""
 
+    def _cache_key(self, image):
+        digest = hashlib.sha1(np.ascontiguousarray(image).data)
+        digest.update(str(image.shape).encode())
+        return digest.hexdigest()
+
     def extract_text(self, image):
         """Extrae texto de la credencial en la imagen"""
         if image is None or image.size == 0:
             return ""
         
+        # Una imagen idéntica ya procesada no vuelve a pasar por el OCR
+        if self.cache_size <= 0:
+            return self._extract_text(image)
+        key = self._cache_key(image)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+            self.cache_misses += 1
+        
+        text = self._extract_text(image)
+        with self._cache_lock:
+            self._cache[key] = text
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    def extract_texts(self, images, workers=None):
+        """
+        Extrae el texto de muchas credenciales en paralelo
+        
+        OpenCV y Tesseract liberan el GIL, así que los hilos aprovechan todos
+        los núcleos sin lanzar procesos por imagen. Los hilos se conservan
+        entre llamadas hasta close().
+        
+        Args:
+            images: Imágenes en BGR
+            workers (int, optional): Hilos a usar (por defecto, uno por núcleo)
+        
+        Returns:
+            list: Texto de cada imagen, en el mismo orden
+        """
+        images = list(images)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(images) <= 1:
+            return [self.extract_text(image) for image in images]
+        return list(self._get_executor(workers).map(self.extract_text, images))
+
+    def _get_executor(self, workers):
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown()
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+                self._executor_workers = workers
+            return self._executor
+
+    def close(self):
+        """Detiene los hilos de extract_texts y libera el backend de OCR"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        self.backend.close()
+
+    def _extract_text(self, image):
         # Encontrar la credencial
         card_rect = self.find_white_card(image)
         if card_rect is None:
@@ -101,18 +271,9 @@ class TextRecognizer:
         processed_roi = self.preprocess_roi(card_roi)
         
         try:
-            # Intentar con diferentes configuraciones
-            configs = [
-                '--psm 7 --oem 3',  # Línea única
-                '--psm 6 --oem 3',  # Bloque uniforme
-            ]
-            
-            for config in configs:
-                text = pytesseract.image_to_string(
-                    processed_roi,
-                    config=config,
-                    lang='eng'
-                )
+            # Intentar con diferentes modos: línea única, luego bloque uniforme
+            for psm in PAGE_SEG_MODES:
+                text = self.backend.image_to_string(processed_roi, psm)
                 
                 cleaned_text = self.clean_text(text)
                 if cleaned_text:
@@ -0,0 +1,290 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, Optional, Tuple
+import cv2
+import numpy as np
+from face_detector import UNKNOWN_NAME
+from face_gallery import ENCODING_DIM
+from metrics import UNKNOWN_VISITORS, UNKNOWN_VISITS
+from pipeline import AccessDeduplicator
+
+
+class VisitorIndex:
+    """
+    Agrupamiento en línea de encodings de rostros desconocidos
+
+    Cada grupo (visitante) se resume en un centroide. Un encoding nuevo se
+    asigna al centroide más cercano si está a menos de threshold; si no, abre
+    un grupo nuevo. El centroide es un promedio móvil cuyo peso se limita a
+    max_weight muestras, así sigue los cambios de luz o de ángulo sin que
+    unas pocas muestras malas lo desplacen.
+    """
+
+    def __init__(self, threshold: float = 0.5, max_weight: int = 50, dim: int = ENCODING_DIM):
+        """
+        Args:
+            threshold (float): Distancia máxima a un centroide para sumarse a su grupo
+            max_weight (int): Muestras máximas que pesa el centroide frente a una nueva
+            dim (int): Dimensión de los encodings
+        """
+        self.threshold = threshold
+        self.max_weight = max_weight
+        self._centroids = np.empty((16, dim), dtype=np.float32)
+        self._weights = np.zeros(16, dtype=np.int64)
+        self._ids = np.zeros(16, dtype=np.int64)
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, visitor_id: int, centroid: np.ndarray, weight: int = 1):
+        """Agrega un visitante con su centroide"""
+        if self._size == len(self._centroids):
+            capacity = 2 * len(self._centroids)
+            self._centroids = np.resize(self._centroids, (capacity, self._centroids.shape[1]))
+            self._weights = np.resize(self._weights, capacity)
+            self._ids = np.resize(self._ids, capacity)
+        row = self._size
+        self._centroids[row] = centroid
+        self._weights[row] = min(weight, self.max_weight)
+        self._ids[row] = visitor_id
+        self._rows[visitor_id] = row
+        self._size += 1
+
+    def nearest(self, encoding: np.ndarray) -> Tuple[Optional[int], float]:
+        """
+        Busca el visitante más cercano a un encoding
+
+        Returns:
+            Tuple[Optional[int], float]: ID del visitante (None si ninguno está a menos
+                de threshold) y su distancia
+        """
+        if self._size == 0:
+            return None, float('inf')
+        distances = np.linalg.norm(self._centroids[:self._size] - encoding, axis=1)
+        row = int(np.argmin(distances))
+        distance = float(distances[row])
+        if distance > self.threshold:
+            return None, distance
+        return int(self._ids[row]), distance
+
+    def update(self, visitor_id: int, encoding: np.ndarray) -> np.ndarray:
+        """Suma un encoding al centroide de un visitante y devuelve el centroide nuevo"""
+        row = self._rows[visitor_id]
+        weight = self._weights[row]
+        self._centroids[row] += (encoding - self._centroids[row]) / (weight + 1)
+        self._weights[row] = min(weight + 1, self.max_weight)
+        return self._centroids[row]
+
+    def centroid(self, visitor_id: int) -> np.ndarray:
+        return self._centroids[self._rows[visitor_id]]
+
+    def distance(self, visitor_id: int, encoding: np.ndarray) -> float:
+        """Distancia de un encoding al centroide de un visitante"""
+        return float(np.linalg.norm(self.centroid(visitor_id) - encoding))
+
+
+class _Visitor:
+    """Estado en memoria de un visitante desconocido"""
+
+    def __init__(self, key: int, visitor_id: Optional[int], last_seen: datetime, sightings: int,
+                 face_image_path: Optional[str]):
+        # key identifica al visitante en memoria; visitor_id es su ID en la base,
+        # que queda en None hasta que el hilo escritor lo inserta
+        self.key = key
+        self.visitor_id = visitor_id
+        self.last_seen = last_seen
+        self.sightings = sightings
+        self.face_image_path = face_image_path
+
+
+class UnknownFaceRecorder:
+    """
+    Registra los rostros no autorizados sin repetirlos
+
+    Todas las veces que se ve a un mismo desconocido se agrupan en un
+    visitante (tabla unknown_visitors) con una sola imagen representativa,
+    la de la primera vez. Un rostro seguido entre frames (mismo track) se
+    asigna al mismo visitante mientras su encoding siga cerca del centroide,
+    y cada visitante deja a lo sumo un registro "No autorizado" en
+    access_logs por min_interval. Los visitantes nuevos y sus conteos (en
+    lote cada flush_interval segundos) se escriben por la cola de
+    DatabaseManager, sin esperar a la base en el hilo de inferencia: el ID
+    de un visitante nuevo lo asigna SQLite y su primer registro se hace
+    cuando se conoce.
+    """
+
+    def __init__(self, db_manager, snapshot_writer, threshold: float = 0.5,
+                 min_interval: timedelta = timedelta(minutes=10), memory_days: int = 30,
+                 flush_interval: float = 30.0, max_tracks: int = 10000, logger=None):
+        """
+        Args:
+            db_manager: Instancia de DatabaseManager
+            snapshot_writer: Instancia de SnapshotWriter para la imagen de cada visitante
+            threshold (float): Distancia máxima para considerar que es el mismo visitante
+                (menor que la tolerancia de reconocimiento, para no mezclar personas)
+            min_interval (timedelta): Tiempo mínimo entre registros del mismo visitante
+            memory_days (int): Al iniciar se cargan los visitantes vistos en estos últimos días
+            flush_interval (float): Segundos entre guardados de los conteos de visitantes
+            max_tracks (int): Tracks recordados para asociarlos a su visitante
+            logger: Logger de la aplicación (opcional)
+        """
+        self.db_manager = db_manager
+        self.snapshot_writer = snapshot_writer
+        self.index = VisitorIndex(threshold=threshold)
+        self.deduplicator = AccessDeduplicator(min_interval)
+        self.flush_interval = flush_interval
+        self.max_tracks = max_tracks
+        self.logger = logger
+        self.sightings = 0
+        self.visits = 0
+        self._visitors: Dict[int, _Visitor] = {}
+        self._tracks = OrderedDict()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._next_key = 0
+        self._load(datetime.now() - timedelta(days=memory_days))
+
+    def _load(self, since: datetime):
+        """Carga los visitantes recientes para reconocerlos entre reinicios"""
+        for visitor_id, _, last_seen, sightings, face_image_path, encoding in self.db_manager.get_visitors(since):
+            key = self._new_key()
+            self.index.add(key, np.frombuffer(encoding, dtype=np.float32), sightings)
+            self._visitors[key] = _Visitor(key, visitor_id, datetime.fromisoformat(last_seen),
+                                           sightings, face_image_path)
+
+    def _new_key(self) -> int:
+        key = self._next_key
+        self._next_key += 1
+        return key
+
+    def __len__(self) -> int:
+        return len(self._visitors)
+
+    def observe(self, encoding: np.ndarray, location: tuple, rgb_image: np.ndarray,
+                track_id: Optional[int] = None, source: Optional[str] = None,
+                when: Optional[datetime] = None) -> Optional[int]:
+        """
+        Procesa un rostro desconocido (se usa como unknown_handler de FaceTracker)
+
+        Args:
+            encoding (np.ndarray): Encoding del rostro
+            location (tuple): Ubicación (top, right, bottom, left) en la imagen
+            rgb_image (np.ndarray): Imagen en RGB (se recorta solo para un visitante nuevo)
+            track_id (int, optional): Track del rostro; sus encodings van al mismo visitante
+            source (str, optional): Cámara de origen, para distinguir los tracks de cada una
+            when (datetime, optional): Momento de la detección
+
+        Returns:
+            Optional[int]: ID del visitante, o None si todavía no está en la base
+                (o no se pudo guardar)
+        """
+        when = when or datetime.now()
+        encoding = np.asarray(encoding, dtype=np.float32)
+        track_key = (source, track_id) if track_id is not None else None
+        try:
+            with self._lock:
+                self.sightings += 1
+                key = self._tracks.get(track_key) if track_key is not None else None
+                if key is not None and self.index.distance(key, encoding) > self.index.threshold:
+                    # El tracker saltó a otro rostro: volver a buscar el visitante
+                    key = None
+                if key is None:
+                    key, _ = self.index.nearest(encoding)
+                created = key is None
+                if created:
+                    visitor = self._create(encoding, location, rgb_image, when)
+                else:
+                    visitor = self._visitors[key]
+                    visitor.sightings += 1
+                    visitor.last_seen = when
+                    self.index.update(key, encoding)
+                    self._dirty.add(key)
+                if track_key is not None:
+                    self._remember_track(track_key, visitor.key)
+
+                should_register, _ = self.deduplicator.check(visitor.key, when)
+                if should_register:
+                    self.visits += 1
+                    UNKNOWN_VISITS.inc()
+                    # El de un visitante nuevo se registra cuando la base le asigna el ID
+                    if not created:
+                        self._register_visit(visitor)
+
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+                return visitor.visitor_id
+        except sqlite3.Error as e:
+            print(f"Error al registrar el rostro desconocido: {str(e)}")
+            return None
+
+    def _create(self, encoding: np.ndarray, location: tuple, rgb_image: np.ndarray, when: datetime) -> _Visitor:
+        """Crea un visitante con la imagen de su primera detección"""
+        top, right, bottom, left = location
+        face_image = cv2.cvtColor(rgb_image[top:bottom, left:right], cv2.COLOR_RGB2BGR)
+        face_image_path = self.snapshot_writer.submit(face_image, UNKNOWN_NAME, when)
+        key = self._new_key()
+        self.index.add(key, encoding)
+        visitor = self._visitors[key] = _Visitor(key, None, when, 1, face_image_path)
+        UNKNOWN_VISITORS.inc()
+        self.db_manager.create_visitor(encoding.tobytes(), when, face_image_path,
+                                       on_created=partial(self._on_created, visitor))
+        return visitor
+
+    def _on_created(self, visitor: _Visitor, visitor_id: int):
+        """Recibe el ID que la base asignó a un visitante nuevo y registra su primera visita"""
+        visitor.visitor_id = visitor_id
+        self._register_visit(visitor)
+
+    def _register_visit(self, visitor: _Visitor):
+        # Sin ID (la base todavía no lo insertó o falló) se registra sin número
+        name = f"{UNKNOWN_NAME} #{visitor.visitor_id}" if visitor.visitor_id is not None else UNKNOWN_NAME
+        self.db_manager.register_access(name=name, face_image_path=visitor.face_image_path)
+        if self.logger is not None:
+            self.logger.warning(f"Persona no autorizada registrada - visitante #{visitor.visitor_id} "
+                                f"({visitor.sightings} detecciones)")
+
+    def _remember_track(self, track_key: tuple, key: int):
+        self._tracks[track_key] = key
+        self._tracks.move_to_end(track_key)
+        while len(self._tracks) > self.max_tracks:
+            self._tracks.popitem(last=False)
+
+    def _flush(self):
+        """Guarda los conteos y centroides de los visitantes que cambiaron"""
+        rows = []
+        pending = set()
+        for key in self._dirty:
+            visitor = self._visitors[key]
+            if visitor.visitor_id is None:
+                # Todavía no está en la base: se guarda en el próximo flush
+                pending.add(key)
+                continue
+            rows.append((visitor.visitor_id, visitor.last_seen, visitor.sightings,
+                         self.index.centroid(key).tobytes()))
+        self._dirty = pending
+        self._last_flush = time.monotonic()
+        self.db_manager.update_visitors(rows)
+
+    def flush(self):
+        """Guarda los cambios pendientes (p. ej. antes de cerrar la base)"""
+        try:
+            # Que el hilo escritor asigne antes los IDs de los visitantes nuevos
+            self.db_manager.flush()
+            with self._lock:
+                self._flush()
+        except sqlite3.Error as e:
+            print(f"Error al guardar los visitantes desconocidos: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            'visitantes': len(self._visitors),
+            'detecciones': self.sightings,
+            'registros': self.visits,
+        }